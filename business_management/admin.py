@@ -1,6 +1,8 @@
 from django.contrib import admin
+
+from rbac.admin_performance import AutocompleteFilter, ScalableModelAdmin, SelectRelatedTabularInline
 from .models import (
-    Client, ClientCommunication, ClientNote, ClientDocument,
+    Client, ClientCommunication, ClientNote, ClientDocument, ClientImport,
     Trip, TripItinerary, TripParticipant, TripCommunication,
     Invoice, InvoiceLineItem, Payment, PaymentSchedule
 )
@@ -11,11 +13,13 @@ from .models import (
 # ============================================================================
 
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
+class ClientAdmin(ScalableModelAdmin):
     list_display = ['full_name', 'email', 'phone', 'tenant', 'is_active', 'vip_status', 'created_at']
-    list_filter = ['tenant', 'is_active', 'vip_status', 'lead_source', 'preferred_communication']
+    list_filter = [('tenant', AutocompleteFilter), 'is_active', 'vip_status', 'lead_source', 'preferred_communication']
+    list_select_related = ['tenant']
     search_fields = ['first_name', 'last_name', 'email', 'phone']
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'created_by']
     
     fieldsets = (
         ('Basic Information', {
@@ -41,50 +45,74 @@ class ClientAdmin(admin.ModelAdmin):
 
 
 @admin.register(ClientCommunication)
-class ClientCommunicationAdmin(admin.ModelAdmin):
+class ClientCommunicationAdmin(ScalableModelAdmin):
     list_display = ['client', 'communication_type', 'direction', 'subject', 'created_at']
     list_filter = ['communication_type', 'direction', 'created_at']
+    list_select_related = ['client']
     search_fields = ['client__first_name', 'client__last_name', 'subject', 'content']
     readonly_fields = ['created_at']
+    raw_id_fields = ['client', 'trip', 'created_by']
 
 
 @admin.register(ClientNote)
-class ClientNoteAdmin(admin.ModelAdmin):
+class ClientNoteAdmin(ScalableModelAdmin):
     list_display = ['client', 'note_type', 'title', 'is_important', 'created_at']
     list_filter = ['note_type', 'is_important', 'created_at']
+    list_select_related = ['client']
     search_fields = ['client__first_name', 'client__last_name', 'title', 'content']
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['client', 'created_by']
 
 
 @admin.register(ClientDocument)
-class ClientDocumentAdmin(admin.ModelAdmin):
+class ClientDocumentAdmin(ScalableModelAdmin):
     list_display = ['client', 'document_type', 'title', 'expiry_date', 'is_verified', 'created_at']
     list_filter = ['document_type', 'is_verified', 'created_at']
+    list_select_related = ['client']
     search_fields = ['client__first_name', 'client__last_name', 'title']
     readonly_fields = ['created_at', 'file_size']
+    raw_id_fields = ['client', 'uploaded_by']
+
+
+@admin.register(ClientImport)
+class ClientImportAdmin(ScalableModelAdmin):
+    list_display = ['original_name', 'tenant', 'status', 'percent', 'created_count', 'duplicate_count', 'error_count', 'created_at']
+    list_filter = [('tenant', AutocompleteFilter), 'status', 'file_format', 'created_at']
+    list_select_related = ['tenant']
+    search_fields = ['original_name', 'tenant__name']
+    readonly_fields = [
+        'file_format', 'status', 'message', 'percent', 'processed_rows', 'created_count',
+        'duplicate_count', 'error_count', 'errors', 'created_at', 'started_at', 'finished_at',
+    ]
+    raw_id_fields = ['tenant', 'created_by']
 
 
 # ============================================================================
 # TRIP ADMIN
 # ============================================================================
 
-class TripItineraryInline(admin.TabularInline):
+class TripItineraryInline(SelectRelatedTabularInline):
     model = TripItinerary
     extra = 1
+    list_select_related = ['trip']
     ordering = ['day_number']
 
 
-class TripParticipantInline(admin.TabularInline):
+class TripParticipantInline(SelectRelatedTabularInline):
     model = TripParticipant
     extra = 1
+    list_select_related = ['trip']
 
 
 @admin.register(Trip)
-class TripAdmin(admin.ModelAdmin):
+class TripAdmin(ScalableModelAdmin):
     list_display = ['trip_name', 'client', 'status', 'departure_date', 'return_date', 'total_amount', 'created_at']
-    list_filter = ['status', 'trip_type', 'departure_date', 'created_at']
+    list_filter = ['status', 'trip_type', 'created_at']
+    list_select_related = ['client']
     search_fields = ['trip_name', 'client__first_name', 'client__last_name', 'destination']
     readonly_fields = ['created_at', 'updated_at', 'duration_days', 'is_upcoming']
+    raw_id_fields = ['client', 'created_by']
+    date_hierarchy = 'departure_date'
     inlines = [TripParticipantInline, TripItineraryInline]
     
     fieldsets = (
@@ -108,38 +136,48 @@ class TripAdmin(admin.ModelAdmin):
 
 
 @admin.register(TripCommunication)
-class TripCommunicationAdmin(admin.ModelAdmin):
+class TripCommunicationAdmin(ScalableModelAdmin):
     list_display = ['trip', 'communication_type', 'subject', 'email_delivered', 'sent_at']
     list_filter = ['communication_type', 'email_delivered', 'sent_at']
+    list_select_related = ['trip__client']
     search_fields = ['trip__trip_name', 'subject', 'content']
+    raw_id_fields = ['trip', 'sent_by']
 
 
 # ============================================================================
 # INVOICE ADMIN
 # ============================================================================
 
-class InvoiceLineItemInline(admin.TabularInline):
+class InvoiceLineItemInline(SelectRelatedTabularInline):
     model = InvoiceLineItem
     extra = 1
+    list_select_related = ['invoice']
 
 
-class PaymentInline(admin.TabularInline):
+class PaymentInline(SelectRelatedTabularInline):
     model = Payment
     extra = 0
+    list_select_related = ['invoice']
     readonly_fields = ['created_at']
+    raw_id_fields = ['recorded_by']
 
 
-class PaymentScheduleInline(admin.TabularInline):
+class PaymentScheduleInline(SelectRelatedTabularInline):
     model = PaymentSchedule
     extra = 1
+    list_select_related = ['invoice']
+    raw_id_fields = ['payment']
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(ScalableModelAdmin):
     list_display = ['invoice_number', 'client', 'trip', 'status', 'total_amount', 'paid_amount', 'balance_due', 'due_date']
-    list_filter = ['status', 'invoice_date', 'due_date']
+    list_filter = ['status', 'invoice_date']
+    list_select_related = ['client', 'trip__client']
     search_fields = ['invoice_number', 'client__first_name', 'client__last_name', 'trip__trip_name']
     readonly_fields = ['created_at', 'updated_at', 'balance_due', 'is_overdue']
+    raw_id_fields = ['client', 'trip', 'created_by']
+    date_hierarchy = 'due_date'
     inlines = [InvoiceLineItemInline, PaymentInline, PaymentScheduleInline]
     
     fieldsets = (
@@ -164,8 +202,10 @@ class InvoiceAdmin(admin.ModelAdmin):
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ScalableModelAdmin):
     list_display = ['invoice', 'amount', 'payment_method', 'payment_date', 'reference_number']
     list_filter = ['payment_method', 'payment_date']
+    list_select_related = ['invoice__client']
     search_fields = ['invoice__invoice_number', 'reference_number']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+    raw_id_fields = ['invoice', 'recorded_by']
\ No newline at end of file
@@ -0,0 +1,500 @@
+"""
+Bulk client import
+
+An upload is saved as a ClientImport and processed outside the request: the
+file is read one row at a time (CSV, XLSX or vCard), each row is validated and
+normalized, and valid rows are inserted with bulk_create in batches, one
+transaction per batch, skipping emails the tenant already has (read up front
+from the (tenant, email) index and rechecked per batch). Progress and the first per-row errors are
+saved on the ClientImport after every batch for the polling endpoint.
+
+Re-running an import is safe: rows that made it in are skipped as duplicates.
+"""
+import codecs
+import csv
+import io
+import logging
+import quopri
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from rbac.background import BackgroundExecutor
+from rbac.tenant_context import (
+    apply_tenant_guc, get_tenant_database, reset_current_tenant_id, rls_enabled, set_current_tenant_id,
+)
+from .models import Client, ClientImport
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+SNIFF_BYTES = 64 * 1024
+
+FORMATS_BY_EXTENSION = {
+    'csv': 'csv',
+    'txt': 'csv',
+    'xlsx': 'xlsx',
+    'vcf': 'vcard',
+    'vcard': 'vcard',
+}
+
+# Column headings accepted for each Client field (compared lowercased, with
+# underscores and repeated spaces folded); the field name itself always works
+COLUMN_ALIASES = {
+    'first_name': ['first', 'firstname', 'given name', 'forename'],
+    'last_name': ['last', 'lastname', 'surname', 'family name'],
+    'full_name': ['name', 'full name', 'client', 'client name', 'contact', 'contact name'],
+    'email': ['e-mail', 'email address', 'e-mail address', 'mail'],
+    'phone': ['phone number', 'telephone', 'tel', 'mobile', 'mobile phone', 'cell'],
+    'address': ['street', 'street address', 'address line 1'],
+    'city': ['town'],
+    'state': ['province', 'region', 'county'],
+    'country': [],
+    'postal_code': ['postcode', 'zip', 'zip code'],
+    'lead_source': ['source'],
+    'vip_status': ['vip', 'tier'],
+    'preferred_communication': ['contact preference'],
+    'preferred_destinations': ['destinations'],
+    'travel_style': [],
+    'special_needs': ['dietary', 'accessibility'],
+}
+
+CHOICE_FIELDS = {
+    'lead_source': Client.LEAD_SOURCE_CHOICES,
+    'vip_status': Client.VIP_STATUS_CHOICES,
+    'preferred_communication': Client.COMMUNICATION_PREFERENCES,
+}
+
+MAX_LENGTHS = {
+    field.name: field.max_length for field in Client._meta.concrete_fields if getattr(field, 'max_length', None)
+}
+
+
+class ImportFileError(Exception):
+    """The file as a whole cannot be imported (format, missing columns)"""
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return FORMATS_BY_EXTENSION.get(extension)
+
+
+def normalize_heading(heading):
+    return ' '.join(str(heading or '').replace('_', ' ').lower().split())
+
+
+HEADING_FIELDS = {
+    normalize_heading(alias): field
+    for field, aliases in COLUMN_ALIASES.items()
+    for alias in [field] + aliases
+}
+
+
+def map_columns(headings):
+    """Client field (or None to ignore) for each column of a heading row"""
+    columns = [HEADING_FIELDS.get(normalize_heading(heading)) for heading in headings]
+    if 'email' not in columns:
+        raise ImportFileError('No email column found. Expected a heading such as "Email".')
+    if 'full_name' not in columns and not {'first_name', 'last_name'} <= set(columns):
+        raise ImportFileError('No name columns found. Expected "First Name" and "Last Name", or "Name".')
+    return columns
+
+
+# ============================================================================
+# READERS - each yields (row number, {field: raw value}) and reports progress
+# ============================================================================
+
+def text_stream(f):
+    """Decode a binary file as UTF-8 (with or without BOM), falling back to Windows-1252"""
+    sample = f.read(SNIFF_BYTES)
+    f.seek(0)
+    try:
+        # A multi-byte character cut off at the end of the sample is fine
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1252'
+    return io.TextIOWrapper(f, encoding=encoding, errors='replace', newline=''), sample.decode(encoding, 'replace')
+
+
+class CSVReader:
+    def __init__(self, f, size):
+        self.file = f
+        self.size = size or 1
+        self.text, sample = text_stream(f)
+        try:
+            dialect = csv.Sniffer().sniff(sample.split('\n', 1)[0], delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        self.rows = csv.reader(self.text, dialect)
+
+    def __iter__(self):
+        headings = next(self.rows, None)
+        if headings is None:
+            raise ImportFileError('The file is empty.')
+        columns = map_columns(headings)
+        for row in self.rows:
+            if not any(value.strip() for value in row):
+                continue
+            yield self.rows.line_num, {
+                field: value for field, value in zip(columns, row) if field
+            }
+
+    def progress(self):
+        return min(self.file.tell() / self.size, 1.0)
+
+    def close(self):
+        self.text.detach()
+
+
+class XLSXReader:
+    def __init__(self, f, size):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportFileError('Excel imports need openpyxl installed on the server; upload a CSV instead.')
+        # Read-only mode parses the sheet XML as it is iterated
+        self.workbook = load_workbook(f, read_only=True, data_only=True)
+        self.sheet = self.workbook.worksheets[0]
+        self.total = self.sheet.max_row or 0
+        self.row_number = 0
+
+    def __iter__(self):
+        rows = self.sheet.iter_rows(values_only=True)
+        for headings in rows:
+            self.row_number += 1
+            if any(value is not None for value in headings):
+                break
+        else:
+            raise ImportFileError('The first worksheet is empty.')
+        columns = map_columns(headings)
+        for row in rows:
+            self.row_number += 1
+            values = {field: cell_text(value) for field, value in zip(columns, row) if field}
+            if any(values.values()):
+                yield self.row_number, values
+
+    def progress(self):
+        return min(self.row_number / self.total, 1.0) if self.total else 0.0
+
+    def close(self):
+        self.workbook.close()
+
+
+def cell_text(value):
+    if value is None:
+        return ''
+    # Phone numbers typed into Excel come back as floats
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class VCardReader:
+    """vCard 2.1/3.0/4.0: N/FN, the first EMAIL and TEL, and the first ADR"""
+
+    def __init__(self, f, size):
+        self.file = f
+        self.size = size or 1
+        self.text, _ = text_stream(f)
+
+    def lines(self):
+        # Unfold continuation lines (leading space or tab)
+        current = None
+        for line in self.text:
+            line = line.rstrip('\r\n')
+            if line[:1] in (' ', '\t') and current is not None:
+                current += line[1:]
+                continue
+            if current is not None:
+                yield current
+            current = line
+        if current is not None:
+            yield current
+
+    def __iter__(self):
+        card = None
+        number = 0
+        for line in self.lines():
+            name, _, value = line.partition(':')
+            name, _, params = name.partition(';')
+            name = name.upper().split('.')[-1]  # Drop group prefixes (item1.EMAIL)
+            if name == 'BEGIN' and value.strip().upper() == 'VCARD':
+                card = {}
+                number += 1
+            elif name == 'END' and card is not None:
+                if card:
+                    yield number, card
+                card = None
+            elif card is not None:
+                if 'QUOTED-PRINTABLE' in params.upper():
+                    value = quopri.decodestring(value).decode('utf-8', 'replace')
+                self.add_property(card, name, value)
+        if number == 0:
+            raise ImportFileError('No vCards found in the file.')
+
+    def add_property(self, card, name, value):
+        if name == 'N':
+            parts = split_vcard_value(value) + ['', '']
+            card.setdefault('last_name', parts[0])
+            card.setdefault('first_name', ' '.join(parts[1:3]).strip())
+        elif name == 'FN':
+            card.setdefault('full_name', unescape_vcard(value))
+        elif name == 'EMAIL':
+            card.setdefault('email', unescape_vcard(value))
+        elif name == 'TEL':
+            card.setdefault('phone', unescape_vcard(value).removeprefix('tel:'))
+        elif name == 'ADR' and 'address' not in card:
+            parts = split_vcard_value(value) + [''] * 7
+            card.update(address=parts[2], city=parts[3], state=parts[4], postal_code=parts[5], country=parts[6])
+
+    def progress(self):
+        return min(self.file.tell() / self.size, 1.0)
+
+    def close(self):
+        self.text.detach()
+
+
+def unescape_vcard(value):
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value).strip()
+
+
+def split_vcard_value(value):
+    return [unescape_vcard(part) for part in re.split(r'(?<!\\);', value)]
+
+
+READERS = {
+    'csv': CSVReader,
+    'xlsx': XLSXReader,
+    'vcard': VCardReader,
+}
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def normalize_email(value):
+    email = value.strip().lower()
+    if email.startswith('mailto:'):
+        email = email[len('mailto:'):]
+    validate_email(email)
+    return email
+
+
+def normalize_phone(value):
+    """Digits only, with a leading + for international numbers; extensions are dropped"""
+    value = re.split(r'(?i)\s*(?:ext\.?|x|#)\s*\d+\s*$', value.strip())[0]
+    if not value:
+        return ''
+    if re.search(r'[^\d\s()+./-]', value):
+        raise ValidationError('contains letters or symbols')
+    digits = re.sub(r'\D', '', value)
+    international = value.startswith('+') or digits.startswith('00')
+    if digits.startswith('00'):
+        digits = digits[2:]
+    if not 7 <= len(digits) <= 15:
+        raise ValidationError('must have between 7 and 15 digits')
+    return f'+{digits}' if international else digits
+
+
+def normalize_choice(value, choices):
+    wanted = value.strip().lower()
+    for key, label in choices:
+        if wanted in (key.lower(), label.lower()):
+            return key
+    raise ValidationError(f'must be one of: {", ".join(label for _, label in choices)}')
+
+
+def clean_row(values):
+    """(Client field values, error messages) for one row of raw values"""
+    data = {field: (value or '').strip() for field, value in values.items() if field != 'full_name'}
+    errors = []
+
+    full_name = (values.get('full_name') or '').strip()
+    if full_name and not (data.get('first_name') or data.get('last_name')):
+        first, _, last = full_name.rpartition(' ')
+        data['first_name'], data['last_name'] = (first, last) if first else (last, '')
+    if not data.get('first_name'):
+        errors.append('First name is required')
+    if not data.get('last_name'):
+        errors.append('Last name is required')
+
+    if not data.get('email'):
+        errors.append('Email is required')
+    else:
+        try:
+            data['email'] = normalize_email(data['email'])
+        except ValidationError:
+            errors.append(f'Email "{data["email"]}" is not valid')
+
+    if data.get('phone'):
+        try:
+            data['phone'] = normalize_phone(data['phone'])
+        except ValidationError as e:
+            errors.append(f'Phone "{data["phone"]}" {e.messages[0]}')
+
+    for field, choices in CHOICE_FIELDS.items():
+        if data.get(field):
+            try:
+                data[field] = normalize_choice(data[field], choices)
+            except ValidationError as e:
+                errors.append(f'{Client._meta.get_field(field).verbose_name.capitalize()} "{data[field]}" {e.messages[0]}')
+        else:
+            data.pop(field, None)
+
+    for field, value in data.items():
+        max_length = MAX_LENGTHS.get(field)
+        if max_length and len(value) > max_length:
+            errors.append(f'{Client._meta.get_field(field).verbose_name.capitalize()} is longer than {max_length} characters')
+    return data, errors
+
+
+# ============================================================================
+# PROCESSING
+# ============================================================================
+
+@contextmanager
+def tenant_atomic(tenant_id, using):
+    """A transaction scoped to the tenant by the row-level security policies"""
+    with transaction.atomic(using=using):
+        connection = connections[using]
+        if rls_enabled(connection):
+            apply_tenant_guc(connection, tenant_id, local=True)
+        yield
+
+
+PROGRESS_FIELDS = [
+    'percent', 'processed_rows', 'created_count', 'duplicate_count', 'error_count', 'errors', 'updated_at',
+]
+
+
+def existing_emails(tenant_id, using):
+    """The tenant's client emails, lowercased (an index-only scan of (tenant, email))"""
+    emails = Client.objects.using(using).filter(tenant_id=tenant_id).values_list('email', flat=True)
+    return {email.lower() for email in emails.iterator(chunk_size=10000)}
+
+
+class ImportRun:
+    def __init__(self, job, using):
+        self.job = job
+        self.using = using
+        # Emails the tenant already has or earlier rows of the file took
+        self.seen = existing_emails(job.tenant_id, using)
+        self.batch = []  # (Client, email as written in the file)
+        self.unsaved_rows = 0
+
+    def add(self, row_number, values):
+        job = self.job
+        job.processed_rows += 1
+        self.unsaved_rows += 1
+        data, errors = clean_row(values)
+        if not errors and data['email'] in self.seen:
+            job.duplicate_count += 1
+            return
+        if errors:
+            job.error_count += 1
+            if len(job.errors) < MAX_REPORTED_ERRORS:
+                job.errors.append({'row': row_number, 'errors': errors})
+            return
+        self.seen.add(data['email'])
+        raw_email = values['email'].strip()
+        self.batch.append((Client(tenant_id=job.tenant_id, created_by_id=job.created_by_id, **data), raw_email))
+
+    def should_flush(self):
+        return self.unsaved_rows >= BATCH_SIZE
+
+    def flush(self, progress):
+        job = self.job
+        with tenant_atomic(job.tenant_id, self.using):
+            if self.batch:
+                # Clients added since the import started, e.g. through the form
+                lookups = {client.email for client, _ in self.batch} | {raw for _, raw in self.batch}
+                existing = {
+                    email.lower() for email in Client.objects.using(self.using).filter(
+                        tenant_id=job.tenant_id, email__in=lookups
+                    ).values_list('email', flat=True)
+                }
+                new_clients = [client for client, _ in self.batch if client.email not in existing]
+                Client.objects.using(self.using).bulk_create(new_clients, batch_size=BATCH_SIZE)
+                job.created_count += len(new_clients)
+                job.duplicate_count += len(self.batch) - len(new_clients)
+            job.percent = int(progress * 100)
+            job.save(using=self.using, update_fields=PROGRESS_FIELDS)
+        self.batch = []
+        self.unsaved_rows = 0
+
+
+def process_import(job, using):
+    """Import every row of the job's file; raises ImportFileError for unusable files"""
+    storage = job.file.storage
+    run = ImportRun(job, using)
+    with storage.open(job.file.name, 'rb') as f:
+        reader = READERS[job.file_format](f, storage.size(job.file.name))
+        try:
+            for row_number, values in reader:
+                run.add(row_number, values)
+                if run.should_flush():
+                    run.flush(reader.progress())
+        finally:
+            reader.close()
+    run.flush(1.0)
+
+
+def claim_import(job_id, using):
+    """Mark a pending import as running; False if another worker has it"""
+    return bool(ClientImport.objects.using(using).filter(pk=job_id, status='PENDING').update(
+        status='RUNNING', started_at=timezone.now()
+    ))
+
+
+def run_import(job_id, using=DEFAULT_DB_ALIAS):
+    """Process a claimed (RUNNING) import to completion, recording the outcome"""
+    job = ClientImport.objects.using(using).get(pk=job_id)
+    token = set_current_tenant_id(job.tenant_id)
+    try:
+        job.percent = job.processed_rows = job.created_count = job.duplicate_count = job.error_count = 0
+        job.errors = []
+        try:
+            process_import(job, using)
+        except ImportFileError as e:
+            job.status, job.message = 'FAILED', str(e)
+        except Exception as e:
+            logger.error(f"Client import {job.pk} failed: {e}")
+            job.status = 'FAILED'
+            job.message = f'The import stopped unexpectedly after {job.processed_rows} rows: {e}'
+        else:
+            job.status = 'COMPLETED'
+        job.finished_at = timezone.now()
+        job.save(using=using, update_fields=['status', 'message', 'finished_at'] + PROGRESS_FIELDS)
+        if job.status == 'COMPLETED' and job.file:
+            job.file.delete(save=False)
+            ClientImport.objects.using(using).filter(pk=job.pk).update(file='')
+        logger.info(
+            f"Client import {job.pk} for tenant {job.tenant_id} {job.status.lower()}: "
+            f"{job.created_count} created, {job.duplicate_count} duplicates, {job.error_count} errors"
+        )
+    finally:
+        reset_current_tenant_id(token)
+    return job
+
+
+import_executor = BackgroundExecutor('client-import')
+
+
+def schedule_import(job):
+    """Start the import in this process once the upload commits, unless a worker handles them"""
+    using = get_tenant_database(job.tenant_id)
+
+    def run():
+        if settings.CLIENT_IMPORT_BACKGROUND and claim_import(job.pk, using):
+            import_executor.submit(f'Client import {job.pk} could not run', run_import, job.pk, using)
+    transaction.on_commit(run, using=using)
@@ -2,11 +2,13 @@
 Email service layer for multi-tenant communications
 Supports single-domain development and multi-domain production scaling
 """
-from django.core.mail import send_mail
+from asgiref.sync import sync_to_async
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils import timezone
+from rbac.logo_renditions import logo_url
 from rbac.models import Tenant
 from .models import ClientCommunication
 import logging
@@ -76,20 +78,75 @@ class TenantEmailService:
             logger.warning(f"No email address for client {client.full_name}")
             return False, None
         
+        email, communication = self._prepare_client_email(
+            client, subject, template_name, context, sender_name, communication_type, trip
+        )
+        
+        try:
+            # Send email
+            success = email.send(fail_silently=False)
+            self._record_delivery(communication, success)
+            
+            logger.info(f"Email sent to {client.email}: {subject}")
+            return True, communication
+            
+        except Exception as e:
+            self._record_failure(communication, e)
+            
+            logger.error(f"Failed to send email to {client.email}: {str(e)}")
+            return False, communication
+    
+    async def asend_client_email(self, client, subject, template_name, context=None,
+                                 sender_name=None, communication_type='EMAIL', trip=None):
+        """
+        Async version of send_client_email for async views.
+        
+        Rendering and ClientCommunication writes run in a thread; delivery uses
+        the backend's asend_messages when it has one (Mailgun API via httpx),
+        otherwise the sync backend runs in a thread pool.
+        """
+        if not client.email:
+            logger.warning(f"No email address for client {client.full_name}")
+            return False, None
+        
+        email, communication = await sync_to_async(self._prepare_client_email)(
+            client, subject, template_name, context, sender_name, communication_type, trip
+        )
+        
+        try:
+            connection = get_connection(fail_silently=False)
+            if hasattr(connection, 'asend_messages'):
+                success = await connection.asend_messages([email])
+            else:
+                success = await sync_to_async(connection.send_messages, thread_sensitive=False)([email])
+            await sync_to_async(self._record_delivery)(communication, success)
+            
+            logger.info(f"Email sent to {client.email}: {subject}")
+            return True, communication
+            
+        except Exception as e:
+            await sync_to_async(self._record_failure)(communication, e)
+            
+            logger.error(f"Failed to send email to {client.email}: {str(e)}")
+            return False, communication
+    
+    def _prepare_client_email(self, client, subject, template_name, context,
+                              sender_name, communication_type, trip):
+        """Render the client email and create its ClientCommunication record"""
         # Prepare context with absolute URLs for logos and tenant info
         tenant_logo_url = None
-        if self.tenant and self.tenant.logo:
+        # The resized email rendition, not the original upload
+        logo_path = logo_url(self.tenant.pk, 'email') if self.tenant else ''
+        if logo_path:
             # Create absolute URL for logo in emails
-            from django.contrib.sites.shortcuts import get_current_site
-            from django.urls import reverse
             try:
                 # Try to get current site for absolute URL
                 domain = getattr(settings, 'SITE_DOMAIN', 'localhost:8000')
                 protocol = 'https' if not settings.DEBUG else 'http'
-                tenant_logo_url = f"{protocol}://{domain}{self.tenant.logo.url}"
+                tenant_logo_url = f"{protocol}://{domain}{logo_path}"
             except:
                 # Fallback to relative URL
-                tenant_logo_url = self.tenant.logo.url
+                tenant_logo_url = logo_path
         
         email_context = {
             'client': client,
@@ -105,7 +162,9 @@ class TenantEmailService:
         }
         
         # Render email templates
-        html_message = render_to_string(f'emails/{template_name}.html', email_context)
+        html_message = render_to_string(
+            f'emails/{template_name}.html', email_context, using=settings.EMAIL_TEMPLATE_ENGINE
+        )
         plain_message = strip_tags(html_message)
         
         # Generate sender email
@@ -123,32 +182,20 @@ class TenantEmailService:
             scheduled_at=timezone.now()
         )
         
-        try:
-            # Send email
-            success = send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=sender_email,
-                recipient_list=[client.email],
-                html_message=html_message,
-                fail_silently=False
-            )
-            
-            # Update communication record
-            communication.sent_at = timezone.now()
-            communication.email_delivery_status = 'SENT' if success else 'FAILED'
-            communication.save()
-            
-            logger.info(f"Email sent to {client.email}: {subject}")
-            return True, communication
-            
-        except Exception as e:
-            # Update communication record with error
-            communication.email_delivery_status = f'ERROR: {str(e)}'
-            communication.save()
-            
-            logger.error(f"Failed to send email to {client.email}: {str(e)}")
-            return False, communication
+        email = EmailMultiAlternatives(subject, plain_message, sender_email, [client.email])
+        email.attach_alternative(html_message, 'text/html')
+        return email, communication
+    
+    def _record_delivery(self, communication, success):
+        """Update communication record after sending"""
+        communication.sent_at = timezone.now()
+        communication.email_delivery_status = 'SENT' if success else 'FAILED'
+        communication.save()
+    
+    def _record_failure(self, communication, error):
+        """Update communication record with error"""
+        communication.email_delivery_status = f'ERROR: {str(error)}'
+        communication.save()
     
     def send_trip_confirmation(self, trip, sender_name=None):
         """Send trip confirmation email to client"""
@@ -0,0 +1,436 @@
+"""
+Streaming CSV and Excel exports of a tenant's CRM data
+
+Rows are read with values_list (which joins the related columns into the same
+query) through a server-side cursor, or keyset pages on the primary key where
+server-side cursors are disabled (PgBouncer), and written out a chunk at a
+time, so memory stays flat however many rows a tenant has. The .xlsx writer
+streams the worksheet XML into a zip as it goes instead of building a
+workbook in memory or on disk.
+
+Invoices and payments need financial access; for everyone else the money
+columns are left out of trip and line item exports.
+"""
+import csv
+import datetime
+import io
+import logging
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .client_import import tenant_atomic
+from .models import Client, Invoice, Payment, Trip, TripLineItem
+from .tenant_data import TENANT_MODELS, iter_values
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2000
+# Rows written between yields (roughly 50-100 KB of output)
+ROWS_PER_WRITE = 500
+
+TENANT_LOOKUPS = dict(TENANT_MODELS)
+
+# dataset -> model, ordering, columns as (header, values_list lookup), the
+# columns only shown with financial access, and whether the whole dataset needs it
+EXPORTS = {
+    'clients': {
+        'model': Client,
+        'ordering': ('last_name', 'first_name', 'pk'),
+        'financial': False,
+        'columns': [
+            ('Client ID', 'id'),
+            ('First Name', 'first_name'),
+            ('Last Name', 'last_name'),
+            ('Email', 'email'),
+            ('Phone', 'phone'),
+            ('Address', 'address'),
+            ('City', 'city'),
+            ('State', 'state'),
+            ('Country', 'country'),
+            ('Postal Code', 'postal_code'),
+            ('Preferred Communication', 'preferred_communication'),
+            ('Budget Min', 'budget_range_min'),
+            ('Budget Max', 'budget_range_max'),
+            ('Preferred Destinations', 'preferred_destinations'),
+            ('Travel Style', 'travel_style'),
+            ('Special Needs', 'special_needs'),
+            ('Lead Source', 'lead_source'),
+            ('VIP Status', 'vip_status'),
+            ('Active', 'is_active'),
+            ('Created By', 'created_by__username'),
+            ('Created', 'created_at'),
+            ('Last Contact', 'last_contact_date'),
+        ],
+        'financial_columns': [],
+    },
+    'trips': {
+        'model': Trip,
+        'ordering': ('departure_date', 'pk'),
+        'financial': False,
+        'columns': [
+            ('Trip ID', 'id'),
+            ('Trip Name', 'trip_name'),
+            ('Client First Name', 'client__first_name'),
+            ('Client Last Name', 'client__last_name'),
+            ('Client Email', 'client__email'),
+            ('Trip Type', 'trip_type'),
+            ('Status', 'status'),
+            ('Departure Date', 'departure_date'),
+            ('Return Date', 'return_date'),
+            ('Departure Location', 'departure_location'),
+            ('Destination', 'destination'),
+            ('Travelers', 'number_of_travelers'),
+            ('Budget Min', 'budget_range_min'),
+            ('Budget Max', 'budget_range_max'),
+            ('Created By', 'created_by__username'),
+            ('Created', 'created_at'),
+        ],
+        'financial_columns': [
+            ('Estimated Cost', 'estimated_cost'),
+            ('Quoted Price', 'quoted_price'),
+            ('Total Amount', 'total_amount'),
+        ],
+    },
+    'line-items': {
+        'model': TripLineItem,
+        'ordering': ('trip__departure_date', 'trip_id', 'service_date', 'pk'),
+        'financial': False,
+        'columns': [
+            ('Line Item ID', 'id'),
+            ('Trip ID', 'trip_id'),
+            ('Trip Name', 'trip__trip_name'),
+            ('Client Email', 'trip__client__email'),
+            ('Item Type', 'item_type'),
+            ('Description', 'description'),
+            ('Supplier', 'supplier'),
+            ('Quantity', 'quantity'),
+            ('Confirmation Number', 'confirmation_number'),
+            ('Booking Date', 'booking_date'),
+            ('Service Date', 'service_date'),
+            ('Confirmed', 'is_confirmed'),
+        ],
+        'financial_columns': [
+            ('Unit Price', 'unit_price'),
+            ('Total Price', 'total_price'),
+            ('Paid', 'is_paid'),
+        ],
+    },
+    'invoices': {
+        'model': Invoice,
+        'ordering': ('invoice_date', 'invoice_number', 'pk'),
+        'financial': True,
+        'columns': [
+            ('Invoice ID', 'id'),
+            ('Invoice Number', 'invoice_number'),
+            ('Status', 'status'),
+            ('Client First Name', 'client__first_name'),
+            ('Client Last Name', 'client__last_name'),
+            ('Client Email', 'client__email'),
+            ('Trip Name', 'trip__trip_name'),
+            ('Invoice Date', 'invoice_date'),
+            ('Due Date', 'due_date'),
+            ('Subtotal', 'subtotal'),
+            ('Tax', 'tax_amount'),
+            ('Total', 'total_amount'),
+            ('Paid', 'paid_amount'),
+            ('Created By', 'created_by__username'),
+        ],
+        'financial_columns': [],
+    },
+    'payments': {
+        'model': Payment,
+        'ordering': ('payment_date', 'pk'),
+        'financial': True,
+        'columns': [
+            ('Payment ID', 'id'),
+            ('Invoice Number', 'invoice__invoice_number'),
+            ('Client Email', 'invoice__client__email'),
+            ('Amount', 'amount'),
+            ('Payment Method', 'payment_method'),
+            ('Payment Date', 'payment_date'),
+            ('Reference Number', 'reference_number'),
+            ('Notes', 'notes'),
+            ('Recorded By', 'recorded_by__username'),
+            ('Recorded', 'created_at'),
+        ],
+        'financial_columns': [],
+    },
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def export_columns(dataset, financial_access):
+    spec = EXPORTS[dataset]
+    if financial_access:
+        return spec['columns'] + spec['financial_columns']
+    return spec['columns']
+
+
+def resolve_field(model, lookup):
+    """The model field a values_list lookup like 'client__email' ends on"""
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def choice_labels(model, columns):
+    """Per column, the display labels of a choices field (or None)"""
+    labels = []
+    for _, lookup in columns:
+        field = resolve_field(model, lookup)
+        labels.append(dict(field.flatchoices) if field.choices else None)
+    return labels
+
+
+def export_queryset(dataset, tenant_id, using):
+    spec = EXPORTS[dataset]
+    model = spec['model']
+    lookup = TENANT_LOOKUPS[model]
+    return model.objects.using(using).filter(**{f'{lookup}_id': tenant_id})
+
+
+def iter_rows(dataset, tenant_id, using, financial_access):
+    """Display-ready rows of the export, read in one tenant-scoped transaction"""
+    spec = EXPORTS[dataset]
+    columns = export_columns(dataset, financial_access)
+    labels = choice_labels(spec['model'], columns)
+    queryset = export_queryset(dataset, tenant_id, using)
+    # One snapshot for the whole export, and the cursor lives inside it
+    with tenant_atomic(tenant_id, using):
+        for row in iter_values(queryset, [lookup for _, lookup in columns], spec['ordering'], CHUNK_SIZE):
+            yield [
+                choices.get(value, value) if choices and value is not None else value
+                for value, choices in zip(row, labels)
+            ]
+
+
+# ============================================================================
+# CSV
+# ============================================================================
+
+FORMULA_START = re.compile(r'[=+\-@\t\r]')
+PHONE_LIKE = re.compile(r'[+-][\d\s().-]*$')
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, str):
+        # Keep spreadsheet apps from evaluating imported text as a formula
+        # (phone numbers like +1 555 0100 are left alone)
+        if FORMULA_START.match(value) and not PHONE_LIKE.match(value):
+            return "'" + value
+        return value
+    return str(value)
+
+
+def iter_csv(headers, rows):
+    """CSV bytes a few hundred rows at a time, with a BOM so Excel reads UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('﻿')
+    writer.writerow(headers)
+    count = 0
+    for row in rows:
+        writer.writerow([csv_value(value) for value in row])
+        count += 1
+        if count % ROWS_PER_WRITE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+# ============================================================================
+# XLSX
+# ============================================================================
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell style 1 is a date, 2 a date and time (built-in number formats 14 and 22)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="4">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/>'
+    '</sheetView></sheetViews><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+# Characters XML 1.0 cannot carry
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def xlsx_cell(value, style=0):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(timezone.localtime(value))
+        serial = (value - EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="2"><v>{serial:.8f}</v></c>'
+    if isinstance(value, datetime.date):
+        return f'<c s="1"><v>{(value - EXCEL_EPOCH.date()).days}</v></c>'
+    text = escape(ILLEGAL_XML_CHARS.sub('', str(value)))
+    style = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class StreamBuffer:
+    """Write-only file for zipfile; the generator takes what was written so far"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_xlsx(headers, rows, sheet_name='Export'):
+    """
+    An .xlsx workbook of one sheet, yielded as it is written. The buffer has
+    no seek/tell, so zipfile writes data descriptors after each member instead
+    of going back to patch the sizes into its header.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, xml in XLSX_PARTS.items():
+            workbook.writestr(name, xml)
+        workbook.writestr('xl/workbook.xml', WORKBOOK_XML.format(name=escape(sheet_name[:31])))
+        # force_zip64 because the sheet's final size is unknown when its header is written
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            header_cells = ''.join(xlsx_cell(header, style=3) for header in headers)
+            sheet.write(f'{SHEET_START}<row r="1">{header_cells}</row>'.encode('utf-8'))
+            lines = []
+            for number, row in enumerate(rows, start=2):
+                lines.append(f'<row r="{number}">{"".join(xlsx_cell(value) for value in row)}</row>')
+                if len(lines) == ROWS_PER_WRITE:
+                    sheet.write(''.join(lines).encode('utf-8'))
+                    lines = []
+                    yield buffer.take()
+            sheet.write((''.join(lines) + SHEET_END).encode('utf-8'))
+    yield buffer.take()
+
+
+WRITERS = {
+    'csv': iter_csv,
+    'xlsx': iter_xlsx,
+}
+
+
+def iter_export(dataset, file_format, tenant_id, using, financial_access):
+    """The export file's bytes, in chunks"""
+    headers = [header for header, _ in export_columns(dataset, financial_access)]
+    rows = iter_rows(dataset, tenant_id, using, financial_access)
+    count = 0
+    for chunk in WRITERS[file_format](headers, rows):
+        count += 1
+        yield chunk
+    logger.info(f"Exported {dataset} ({file_format}) for tenant {tenant_id} in {count} chunks")
+
+
+async def aiter_sync(iterator):
+    """
+    Serve a sync iterator to an ASGI response. Django would otherwise read the
+    whole export into a list before sending it; each chunk is pulled on the
+    thread the view ran on, where the export's transaction and cursor live.
+    """
+    sentinel = object()
+    get_next = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await get_next(iterator, sentinel)
+            if chunk is sentinel:
+                return
+            yield chunk
+    finally:
+        # Ends the export's transaction if the response was abandoned part way
+        await sync_to_async(iterator.close, thread_sensitive=True)()
@@ -0,0 +1,62 @@
+# Row-level security policies for tenant-owned CRM tables (PostgreSQL only)
+
+from django.db import migrations
+
+# Tenant bound by rbac.middleware.TenantRLSMiddleware; empty/unset means system scope
+TENANT_SCOPE = "NULLIF(current_setting('app.tenant_id', true), '')"
+
+
+def parent(table, column, parent_table):
+    """Child rows inherit visibility from their (RLS-filtered) parent row"""
+    return f"EXISTS (SELECT 1 FROM {parent_table} p WHERE p.id = {table}.{column})"
+
+
+# Ordered parents first; clients carries the tenant_id every other table hangs off
+TENANT_TABLES = {
+    'clients': f"tenant_id = {TENANT_SCOPE}::uuid",
+    'client_communications': parent('client_communications', 'client_id', 'clients'),
+    'client_notes': parent('client_notes', 'client_id', 'clients'),
+    'client_documents': parent('client_documents', 'client_id', 'clients'),
+    'trips': parent('trips', 'client_id', 'clients'),
+    'trip_line_items': parent('trip_line_items', 'trip_id', 'trips'),
+    'trip_itineraries': parent('trip_itineraries', 'trip_id', 'trips'),
+    'trip_participants': parent('trip_participants', 'trip_id', 'trips'),
+    'trip_communications': parent('trip_communications', 'trip_id', 'trips'),
+    'invoices': parent('invoices', 'client_id', 'clients'),
+    'invoice_line_items': parent('invoice_line_items', 'invoice_id', 'invoices'),
+    'payments': parent('payments', 'invoice_id', 'invoices'),
+    'payment_schedules': parent('payment_schedules', 'invoice_id', 'invoices'),
+}
+
+
+def create_policies(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, predicate in TENANT_TABLES.items():
+        condition = f"{TENANT_SCOPE} IS NULL OR ({predicate})"
+        schema_editor.execute(f'ALTER TABLE {table} ENABLE ROW LEVEL SECURITY')
+        schema_editor.execute(f'ALTER TABLE {table} FORCE ROW LEVEL SECURITY')
+        schema_editor.execute(f'DROP POLICY IF EXISTS tenant_isolation ON {table}')
+        schema_editor.execute(
+            f'CREATE POLICY tenant_isolation ON {table} USING ({condition}) WITH CHECK ({condition})'
+        )
+
+
+def drop_policies(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in reversed(list(TENANT_TABLES)):
+        schema_editor.execute(f'DROP POLICY IF EXISTS tenant_isolation ON {table}')
+        schema_editor.execute(f'ALTER TABLE {table} NO FORCE ROW LEVEL SECURITY')
+        schema_editor.execute(f'ALTER TABLE {table} DISABLE ROW LEVEL SECURITY')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_management', '0007_add_trip_description'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_policies, drop_policies),
+    ]
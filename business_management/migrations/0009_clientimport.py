@@ -0,0 +1,68 @@
+# Generated by Django 4.2.23 on 2026-10-19 03:33
+
+import business_management.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+# Same tenant_isolation policy as 0008_tenant_rls_policies
+TENANT_SCOPE = "NULLIF(current_setting('app.tenant_id', true), '')"
+
+
+def create_policy(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    condition = f"{TENANT_SCOPE} IS NULL OR (tenant_id = {TENANT_SCOPE}::uuid)"
+    schema_editor.execute('ALTER TABLE client_imports ENABLE ROW LEVEL SECURITY')
+    schema_editor.execute('ALTER TABLE client_imports FORCE ROW LEVEL SECURITY')
+    schema_editor.execute(
+        f'CREATE POLICY tenant_isolation ON client_imports USING ({condition}) WITH CHECK ({condition})'
+    )
+
+
+def drop_policy(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP POLICY IF EXISTS tenant_isolation ON client_imports')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rbac', '0010_admin_date_hierarchy_indexes'),
+        ('business_management', '0008_tenant_rls_policies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientImport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(blank=True, storage=business_management.models.client_import_storage, upload_to=business_management.models.client_import_path)),
+                ('original_name', models.CharField(max_length=255)),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel (XLSX)'), ('vcard', 'vCard')], max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('message', models.TextField(blank=True)),
+                ('percent', models.PositiveSmallIntegerField(default=0)),
+                ('processed_rows', models.PositiveIntegerField(default=0)),
+                ('created_count', models.PositiveIntegerField(default=0)),
+                ('duplicate_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list, help_text="First rows that failed validation: [{'row': n, 'errors': [...]}]")),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='client_imports', to='rbac.tenant')),
+            ],
+            options={
+                'db_table': 'client_imports',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RunPython(create_policy, drop_policy),
+    ]
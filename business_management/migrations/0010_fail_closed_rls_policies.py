@@ -0,0 +1,49 @@
+# Row-level security policies that fail closed (PostgreSQL only): rows are
+# visible to the tenant bound with SET LOCAL app.tenant_id, or to connections
+# running with app.bypass_rls=on (system admins, maintenance); to nothing else
+
+from importlib import import_module
+
+from django.db import migrations
+
+tenant_rls_policies = import_module('business_management.migrations.0008_tenant_rls_policies')
+TENANT_SCOPE = tenant_rls_policies.TENANT_SCOPE
+RLS_BYPASS = "COALESCE(current_setting('app.bypass_rls', true), '') = 'on'"
+
+TENANT_TABLES = {
+    **tenant_rls_policies.TENANT_TABLES,
+    'client_imports': f"tenant_id = {TENANT_SCOPE}::uuid",
+}
+
+
+def fail_closed(predicate):
+    return f"{RLS_BYPASS} OR ({predicate})"
+
+
+def fail_open(predicate):
+    # Policies of 0008/0009: an unset app.tenant_id showed every tenant
+    return f"{TENANT_SCOPE} IS NULL OR ({predicate})"
+
+
+def replace_policies(condition_for):
+    def replace(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for table, predicate in TENANT_TABLES.items():
+            condition = condition_for(predicate)
+            schema_editor.execute(f'DROP POLICY IF EXISTS tenant_isolation ON {table}')
+            schema_editor.execute(
+                f'CREATE POLICY tenant_isolation ON {table} USING ({condition}) WITH CHECK ({condition})'
+            )
+    return replace
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_management', '0009_clientimport'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_policies(fail_closed), replace_policies(fail_open)),
+    ]
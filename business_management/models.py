@@ -1,7 +1,10 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rbac.models import Tenant
+import os
 import uuid
 
 User = get_user_model()
@@ -214,6 +217,79 @@ class ClientDocument(models.Model):
         return f"{self.document_type} - {self.client.full_name}"
 
 
+class ClientImportStorage(FileSystemStorage):
+    """Private storage for import uploads: CLIENT_IMPORT_ROOT, never under MEDIA_ROOT"""
+
+    @property
+    def base_location(self):
+        return settings.CLIENT_IMPORT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def client_import_storage():
+    return ClientImportStorage()
+
+
+def client_import_path(instance, filename):
+    # Random names; the uploads hold client PII and are deleted once imported
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return f"{instance.tenant_id}/{uuid.uuid4().hex}.{extension}"
+
+
+class ClientImport(models.Model):
+    """Bulk client upload (CSV/XLSX/vCard), processed by business_management.client_import"""
+
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+        ('vcard', 'vCard'),
+    ]
+
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='client_imports')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+
+    file = models.FileField(upload_to=client_import_path, storage=client_import_storage, blank=True)
+    original_name = models.CharField(max_length=255)
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    message = models.TextField(blank=True)
+
+    # Progress, saved after every batch
+    percent = models.PositiveSmallIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    duplicate_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True, help_text="First rows that failed validation: [{'row': n, 'errors': [...]}]")
+
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'client_imports'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.original_name} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('COMPLETED', 'FAILED')
+
+
 # ============================================================================
 # TRIP MODELS
 # ============================================================================
@@ -0,0 +1,69 @@
+"""
+Tenant-owned CRM models in foreign-key dependency order, with the lookup
+that scopes each one to a tenant. Shared by the tenant move, backup and export tooling.
+"""
+from django.db import connections
+
+from .models import (
+    Client, ClientCommunication, ClientNote, ClientDocument, ClientImport,
+    Trip, TripLineItem, TripItinerary, TripParticipant, TripCommunication,
+    Invoice, InvoiceLineItem, Payment, PaymentSchedule
+)
+
+# Parents come before children so rows can be inserted in this order
+TENANT_MODELS = [
+    (Client, 'tenant'),
+    (ClientImport, 'tenant'),
+    (Trip, 'client__tenant'),
+    (ClientCommunication, 'client__tenant'),
+    (ClientNote, 'client__tenant'),
+    (ClientDocument, 'client__tenant'),
+    (TripLineItem, 'trip__client__tenant'),
+    (TripItinerary, 'trip__client__tenant'),
+    (TripParticipant, 'trip__client__tenant'),
+    (TripCommunication, 'trip__client__tenant'),
+    (Invoice, 'client__tenant'),
+    (InvoiceLineItem, 'invoice__client__tenant'),
+    (Payment, 'invoice__client__tenant'),
+    (PaymentSchedule, 'invoice__client__tenant'),
+]
+
+
+def tenant_queryset(model, lookup, tenant, using=None):
+    """All rows of model belonging to tenant, in primary key order"""
+    queryset = model.objects.using(using) if using else model.objects.all()
+    return queryset.filter(**{lookup: tenant}).order_by('pk')
+
+
+def iter_batches(queryset, batch_size=1000):
+    """Yield lists of rows using keyset pagination on the primary key"""
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(page[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1].pk
+
+
+def iter_values(queryset, fields, ordering=('pk',), chunk_size=2000):
+    """
+    Yield value tuples for the queryset. Server-side cursors stream the rows
+    in `ordering`; without them iterator() would fetch the whole result, so
+    fall back to keyset pages in primary key order.
+    """
+    if not connections[queryset.db].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        yield from queryset.order_by(*ordering).values_list(*fields).iterator(chunk_size=chunk_size)
+        return
+
+    queryset = queryset.order_by('pk').values_list('pk', *fields)
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        for row in rows:
+            yield row[1:]
+        last_pk = rows[-1][0]
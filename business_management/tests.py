@@ -1,3 +1,547 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import types
+import uuid
+import weakref
+from datetime import date, datetime
+from decimal import Decimal
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from openpyxl import load_workbook
+
+from rbac import db_copy
+from rbac.management.commands.benchmark_templates import (
+    EMAIL_TEMPLATES, django_backend, jinja2_backend, sample_context,
+)
+from rbac.models import Permission, Role, RolePermission, Tenant, User
+from .client_import import (
+    CSVReader, ImportFileError, VCardReader, XLSXReader, clean_row, normalize_phone, run_import,
+)
+from .models import Client, ClientCommunication, ClientImport, Invoice, Payment, Trip, TripLineItem
+
+
+class ClientImportParsingTests(SimpleTestCase):
+    """Import rows are read from each format and normalized, or rejected with a readable error"""
+
+    def read(self, reader_class, data):
+        reader = reader_class(io.BytesIO(data), len(data))
+        try:
+            return list(reader)
+        finally:
+            reader.close()
+
+    def test_normalize_phone(self):
+        for value, expected in [
+            ('(555) 123-4567', '5551234567'),
+            ('555.123.4567 x12', '5551234567'),
+            ('555-123-4567 ext. 89', '5551234567'),
+            ('+44 20 7946 0958', '+442079460958'),
+            ('0044 20 7946 0958', '+442079460958'),
+            ('  ', ''),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(normalize_phone(value), expected)
+        for value, message in [
+            ('call me', 'contains letters or symbols'),
+            ('555-1234;9', 'contains letters or symbols'),
+            ('12345', 'between 7 and 15 digits'),
+            ('+1 234 567 890 123 456', 'between 7 and 15 digits'),
+        ]:
+            with self.subTest(value=value):
+                with self.assertRaisesMessage(ValidationError, message):
+                    normalize_phone(value)
+
+    def test_clean_row(self):
+        for values, expected, errors in [
+            (
+                {'full_name': 'Ada King Lovelace', 'email': ' ADA@Example.com ', 'lead_source': ''},
+                {'first_name': 'Ada King', 'last_name': 'Lovelace', 'email': 'ada@example.com'},
+                [],
+            ),
+            (
+                {'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'mailto:ada@example.com',
+                 'phone': '+1 (555) 123-4567', 'vip_status': 'premium', 'lead_source': 'Walk-in'},
+                {'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com',
+                 'phone': '+15551234567', 'vip_status': 'PREMIUM', 'lead_source': 'WALK_IN'},
+                [],
+            ),
+            (
+                {'full_name': 'Cher', 'email': 'cher@example'},
+                {'first_name': 'Cher', 'last_name': '', 'email': 'cher@example'},
+                ['Last name is required', 'Email "cher@example" is not valid'],
+            ),
+            (
+                {'first_name': 'Ada', 'last_name': 'L' * 101, 'phone': 'n/a', 'vip_status': 'Gold'},
+                {'first_name': 'Ada', 'last_name': 'L' * 101, 'phone': 'n/a', 'vip_status': 'Gold'},
+                ['Email is required', 'Phone "n/a" contains letters or symbols',
+                 'Vip status "Gold" must be one of: Regular, VIP, Premium',
+                 'Last name is longer than 100 characters'],
+            ),
+        ]:
+            with self.subTest(values=values):
+                self.assertEqual(clean_row(values), (expected, errors))
+
+    def test_csv(self):
+        for data, rows in [
+            # UTF-8 with BOM, aliased headings, blank lines skipped
+            ('\ufeffName,E-mail,Tel,Notes\r\nAda Lovelace,ada@example.com,555 1234,x\r\n,,,\r\n'.encode('utf-8'),
+             [(2, {'full_name': 'Ada Lovelace', 'email': 'ada@example.com', 'phone': '555 1234'})]),
+            # Semicolons, Windows-1252, quoted delimiters
+            ('first_name;Last Name;email;city\nRené;"Doe; Jr";rene@example.com;Zürich\n'.encode('cp1252'),
+             [(2, {'first_name': 'René', 'last_name': 'Doe; Jr', 'email': 'rene@example.com', 'city': 'Zürich'})]),
+        ]:
+            with self.subTest(data=data):
+                self.assertEqual(self.read(CSVReader, data), rows)
+        for data, message in [
+            (b'', 'The file is empty.'),
+            (b'Name,Phone\nAda,555\n', 'No email column found'),
+            (b'First Name,Email\nAda,ada@example.com\n', 'No name columns found'),
+        ]:
+            with self.subTest(data=data):
+                with self.assertRaisesMessage(ImportFileError, message):
+                    self.read(CSVReader, data)
+
+    def test_xlsx(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append([None, None, None])
+        sheet.append(['First Name', 'Surname', 'Email Address', 'Mobile'])
+        sheet.append(['Ada', 'Lovelace', 'ada@example.com', 5551234567.0])
+        sheet.append([None, None, None, None])
+        sheet.append(['Grace', 'Hopper', 'grace@example.com', None])
+        data = io.BytesIO()
+        workbook.save(data)
+        self.assertEqual(self.read(XLSXReader, data.getvalue()), [
+            (3, {'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com', 'phone': '5551234567'}),
+            (5, {'first_name': 'Grace', 'last_name': 'Hopper', 'email': 'grace@example.com', 'phone': ''}),
+        ])
+
+    def test_vcard(self):
+        data = (
+            'BEGIN:VCARD\r\nVERSION:3.0\r\nN:Lovelace;Ada;King;;\r\nFN:Ada Lovelace\r\n'
+            'item1.EMAIL;TYPE=INTERNET:ada@example.com\r\nEMAIL:other@example.com\r\n'
+            'TEL;TYPE=CELL:tel:+44 20 7946\r\n  0958\r\n'
+            'ADR;TYPE=HOME:;;12 St James\\; Square;London;;SW1Y 4LB;UK\r\nEND:VCARD\r\n'
+            'BEGIN:VCARD\r\nVERSION:2.1\r\nN;ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:M=C3=BCller;J=C3=BCrgen\r\n'
+            'EMAIL:jurgen@example.com\r\nEND:VCARD\r\n'
+        ).encode('utf-8')
+        self.assertEqual(self.read(VCardReader, data), [
+            (1, {'last_name': 'Lovelace', 'first_name': 'Ada King', 'full_name': 'Ada Lovelace',
+                 'email': 'ada@example.com', 'phone': '+44 20 7946 0958', 'address': '12 St James; Square',
+                 'city': 'London', 'state': '', 'postal_code': 'SW1Y 4LB', 'country': 'UK'}),
+            (2, {'last_name': 'Müller', 'first_name': 'Jürgen', 'email': 'jurgen@example.com'}),
+        ])
+        with self.assertRaisesMessage(ImportFileError, 'No vCards found'):
+            self.read(VCardReader, b'Name,Email\n')
+
+
+class ClientImportJobTests(TestCase):
+    """An import inserts its new clients in bulk, skips duplicate emails and caps the reported errors"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CLIENT_IMPORT_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch('business_management.client_import.logger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        Client.objects.create(tenant=self.tenant, first_name='Ada', last_name='Lovelace', email='ada@example.com')
+        # Another tenant's client does not make a row a duplicate
+        other = Tenant.objects.create(name='Other', subdomain='other', contact_email='o@example.com')
+        Client.objects.create(tenant=other, first_name='Alan', last_name='Turing', email='alan@example.com')
+
+    def run_job(self, lines):
+        data = '\n'.join(['first_name,last_name,email'] + lines).encode()
+        job = ClientImport.objects.create(
+            tenant=self.tenant, file=ContentFile(data, name='clients.csv'), original_name='clients.csv',
+            file_format='csv', status='RUNNING',
+        )
+        with CaptureQueriesContext(connection) as queries:
+            job = run_import(job.pk)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "clients"')]
+        return job, len(inserts)
+
+    def test_import(self):
+        job, inserts = self.run_job([
+            'Grace,Hopper,grace@example.com',
+            'Alan,Turing,alan@example.com',
+            'Ada,Lovelace,ADA@example.com',      # already a client
+            'Grace,Hopper,Grace@Example.com',    # earlier row of the file
+            'Edsger,Dijkstra,edsger@example.com',
+            'Nameless,,nobody@example.com',
+        ])
+        self.assertEqual(job.status, 'COMPLETED')
+        self.assertEqual(
+            (job.processed_rows, job.created_count, job.duplicate_count, job.error_count, job.percent),
+            (6, 3, 2, 1, 100)
+        )
+        self.assertEqual(job.errors, [{'row': 7, 'errors': ['Last name is required']}])
+        self.assertEqual(inserts, 1)
+        self.assertEqual(
+            sorted(Client.objects.filter(tenant=self.tenant).values_list('email', flat=True)),
+            ['ada@example.com', 'alan@example.com', 'edsger@example.com', 'grace@example.com']
+        )
+        # The upload holds client PII and goes once imported
+        self.assertEqual(ClientImport.objects.get(pk=job.pk).file.name, '')
+
+    @mock.patch('business_management.client_import.MAX_REPORTED_ERRORS', 2)
+    @mock.patch('business_management.client_import.BATCH_SIZE', 2)
+    def test_batches_and_error_cap(self):
+        lines = [f'Client,{n},client{n}@example.com' for n in range(5)] + [f'Broken,{n},' for n in range(3)]
+        job, inserts = self.run_job(lines)
+        self.assertEqual((job.created_count, job.error_count), (5, 3))
+        self.assertEqual([error['row'] for error in job.errors], [7, 8])
+        self.assertEqual(inserts, 3)
+
+
+class ExportTests(TestCase):
+    """Exports hold only the requesting tenant's rows, and money only for users with financial access"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        role = Role.objects.create(name='CLIENT_USER', description='Agent', hierarchy_level=5)
+        cls.agent = User.objects.create_user('agent', 'agent@example.com', 'password', tenant=cls.tenant, role=role)
+        cls.accountant = User.objects.create_user(
+            'accountant', 'accountant@example.com', 'password', tenant=cls.tenant, role=role,
+            has_financial_access=True,
+        )
+        client = Client.objects.create(
+            tenant=cls.tenant, first_name='=HYPERLINK("http://x")', last_name='@SUM(A1)', email='ada@example.com',
+            phone='+1 555 0100', special_needs='-2+3',
+        )
+        trip = Trip.objects.create(
+            client=client, trip_name='Lisbon', departure_date=date(2026, 5, 1), quoted_price=Decimal('1500.00')
+        )
+        TripLineItem.objects.create(
+            trip=trip, item_type='HOTEL', description='Hotel', unit_price=Decimal('120.00'),
+            total_price=Decimal('240.00'), quantity=2,
+        )
+        invoice = Invoice.objects.create(
+            client=client, trip=trip, invoice_number='INV-1', subtotal=Decimal('1500'),
+            total_amount=Decimal('1500'), due_date=date(2026, 4, 1),
+        )
+        Payment.objects.create(invoice=invoice, amount=Decimal('500'), payment_method='CASH')
+
+        other = Tenant.objects.create(name='Other', subdomain='other', contact_email='o@example.com')
+        other_client = Client.objects.create(
+            tenant=other, first_name='Alan', last_name='Turing', email='alan@example.com'
+        )
+        Trip.objects.create(client=other_client, trip_name='Bletchley', departure_date=date(2026, 5, 1))
+
+    def export(self, user, dataset, file_format='csv'):
+        self.client.force_login(user)
+        return self.client.get(reverse('crm_export', args=[dataset, file_format]))
+
+    def csv_rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_only_tenant_rows(self):
+        for dataset, column, expected in (('clients', 'Email', ['ada@example.com']), ('trips', 'Trip Name', ['Lisbon'])):
+            with self.subTest(dataset=dataset):
+                headers, *rows = self.csv_rows(self.export(self.accountant, dataset))
+                self.assertEqual([row[headers.index(column)] for row in rows], expected)
+
+    def test_financial_datasets_need_access(self):
+        for dataset in ('invoices', 'payments'):
+            with self.subTest(dataset=dataset):
+                self.assertEqual(self.export(self.agent, dataset).status_code, 403)
+                headers, *rows = self.csv_rows(self.export(self.accountant, dataset))
+                self.assertEqual(len(rows), 1)
+
+    def test_money_columns_need_access(self):
+        for dataset, money in (('trips', 'Quoted Price'), ('line-items', 'Unit Price')):
+            with self.subTest(dataset=dataset):
+                headers, row = self.csv_rows(self.export(self.agent, dataset))
+                self.assertNotIn(money, headers)
+                self.assertNotIn('1500.00', row)
+                headers, row = self.csv_rows(self.export(self.accountant, dataset))
+                self.assertIn(money, headers)
+
+    def test_csv_formulas_escaped(self):
+        headers, row = self.csv_rows(self.export(self.agent, 'clients'))
+        values = dict(zip(headers, row))
+        self.assertEqual(values['First Name'], '\'=HYPERLINK("http://x")')
+        self.assertEqual(values['Last Name'], "'@SUM(A1)")
+        self.assertEqual(values['Special Needs'], "'-2+3")
+        self.assertEqual(values['Phone'], '+1 555 0100')
+
+    def test_xlsx_opens(self):
+        response = self.export(self.accountant, 'trips', 'xlsx')
+        self.assertEqual(response.status_code, 200)
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        headers, row = list(workbook.active.iter_rows(values_only=True))
+        values = dict(zip(headers, row))
+        self.assertEqual(values['Trip Name'], 'Lisbon')
+        self.assertEqual(values['Departure Date'], datetime(2026, 5, 1))
+        self.assertEqual(values['Quoted Price'], 1500)
+
+
+@override_settings(
+    EMAIL_BACKEND='mailgun_api_backend.MailgunAPIBackend', MAILGUN_API_KEY='key-test', MAILGUN_DOMAIN='mg.example.com',
+)
+class AsyncSendViewTests(TestCase):
+    """The async send views need a login, stay within the tenant, and send through Mailgun's httpx client"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        role = Role.objects.create(name='CLIENT_USER', description='Agent', hierarchy_level=5)
+        cls.agent = User.objects.create_user(
+            'agent', 'agent@example.com', 'password', tenant=cls.tenant, role=role, first_name='Grace',
+        )
+        client = Client.objects.create(tenant=cls.tenant, first_name='Ada', last_name='Client', email='ada@example.com')
+        cls.trip = Trip.objects.create(client=client, trip_name='Lisbon', destination='Portugal',
+                                       departure_date=date(2026, 5, 1))
+        cls.invoice = Invoice.objects.create(
+            client=client, trip=cls.trip, invoice_number='INV-1', subtotal=Decimal('1500'),
+            total_amount=Decimal('1500'), due_date=date(2026, 4, 1),
+        )
+
+        other = Tenant.objects.create(name='Other', subdomain='other', contact_email='o@example.com')
+        other_client = Client.objects.create(
+            tenant=other, first_name='Alan', last_name='Turing', email='alan@example.com'
+        )
+        other_trip = Trip.objects.create(client=other_client, trip_name='Bletchley', departure_date=date(2026, 5, 1))
+        other_invoice = Invoice.objects.create(
+            client=other_client, trip=other_trip, invoice_number='INV-2', subtotal=Decimal('10'),
+            total_amount=Decimal('10'), due_date=date(2026, 4, 1),
+        )
+        cls.other_urls = [
+            reverse('send_client_email', args=[other_client.id]),
+            reverse('trip_send_to_client', args=[other_trip.id]),
+            reverse('invoice_send', args=[other_invoice.id]),
+        ]
+
+    def setUp(self):
+        # httpx isn't a test dependency: the backend imports this module instead
+        self.http = mock.Mock()
+        self.http.post = mock.AsyncMock(return_value=mock.Mock(status_code=200, text='{}'))
+        self.http.aclose = mock.AsyncMock()
+        httpx = types.ModuleType('httpx')
+        httpx.AsyncClient = mock.Mock(return_value=self.http)
+        httpx.Limits = mock.Mock()
+        for patcher in (
+            mock.patch.dict(sys.modules, {'httpx': httpx}),
+            mock.patch('mailgun_api_backend._async_clients', weakref.WeakKeyDictionary()),
+            mock.patch('mailgun_api_backend.logger'),
+            mock.patch('business_management.email_service.logger'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_login_required(self):
+        for url in [
+            reverse('send_client_email', args=[self.trip.client_id]),
+            reverse('trip_send_to_client', args=[self.trip.id]),
+            reverse('invoice_send', args=[self.invoice.id]),
+        ]:
+            with self.subTest(url=url):
+                response = await self.async_client.post(url, {'subject': 'Hello', 'message': 'Hi'})
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(response['Location'], f'{reverse(settings.LOGIN_URL)}?next={url}')
+        self.http.post.assert_not_called()
+
+    async def test_other_tenants_rows_not_found(self):
+        await sync_to_async(self.async_client.force_login)(self.agent)
+        for url in self.other_urls:
+            with self.subTest(url=url):
+                response = await self.async_client.post(url, {'subject': 'Hello', 'message': 'Hi'})
+                self.assertEqual(response.status_code, 404)
+        self.http.post.assert_not_called()
+
+    async def test_trip_sent_through_mailgun(self):
+        await sync_to_async(self.async_client.force_login)(self.agent)
+        response = await self.async_client.post(
+            reverse('trip_send_to_client', args=[self.trip.id]), {'custom_message': 'Bon voyage'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.content)['success'])
+        self.http.post.assert_awaited_once()
+        (url,), kwargs = self.http.post.call_args
+        self.assertEqual(url, 'https://api.mailgun.net/v3/mg.example.com/messages')
+        self.assertEqual(kwargs['auth'], ('api', 'key-test'))
+        self.assertEqual(kwargs['data']['to'], ['ada@example.com'])
+        self.assertIn('Bon voyage', kwargs['data']['html'])
+        communication = await ClientCommunication.objects.aget(client_id=self.trip.client_id)
+        self.assertEqual(communication.email_delivery_status, 'SENT')
+
+    async def test_invoice_sent_and_marked(self):
+        await sync_to_async(self.async_client.force_login)(self.agent)
+        response = await self.async_client.post(reverse('invoice_send', args=[self.invoice.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('invoice_detail', args=[self.invoice.id]))
+        self.assertEqual(self.http.post.call_args.kwargs['data']['subject'], 'Invoice INV-1 - 1500.00')
+        invoice = await Invoice.objects.aget(id=self.invoice.id)
+        self.assertEqual(invoice.status, 'SENT')
+
+
+class TenantBackupTests(TestCase):
+    """A backup restored under a new subdomain is a full copy with its own keys"""
+
+    def test_backup_and_clone(self):
+        tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        agent = User.objects.create_user('agent', 'agent@example.com', 'password', tenant=tenant, role=role)
+        for n in range(3):
+            client = Client.objects.create(
+                tenant=tenant, first_name='Ada', last_name=f'Client {n}', email=f'c{n}@example.com', created_by=agent
+            )
+            trip = Trip.objects.create(client=client, trip_name=f'Trip {n}', departure_date=date(2026, 5, 1))
+            Invoice.objects.create(
+                client=client, trip=trip, invoice_number=f'INV-{n}', subtotal=Decimal('100'),
+                total_amount=Decimal('100'), due_date=date(2026, 4, 1), created_by=agent,
+            )
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'agency')
+        call_command('backup_tenant', 'agency', path, '--no-media', stdout=io.StringIO())
+        call_command('restore_tenant', path, '--as', 'agency-copy', '--no-media', stdout=io.StringIO())
+
+        clone = Tenant.objects.get(subdomain='agency-copy')
+        self.assertNotEqual(clone.pk, tenant.pk)
+        for model, lookup in ((Client, 'tenant'), (Trip, 'client__tenant'), (Invoice, 'client__tenant')):
+            with self.subTest(model=model.__name__):
+                self.assertEqual(model.objects.filter(**{lookup: clone}).count(), 3)
+                self.assertEqual(model.objects.filter(**{lookup: tenant}).count(), 3)
+
+        def cloned(value):
+            return uuid.uuid5(clone.pk, str(value))
+
+        cloned_agent = User.objects.get(tenant=clone)
+        self.assertEqual((cloned_agent.pk, cloned_agent.username), (cloned(agent.pk), 'agency-copy-agent'))
+        self.assertEqual(cloned_agent.role, role)
+        for invoice in Invoice.objects.filter(client__tenant=tenant).select_related('client', 'trip'):
+            copy = Invoice.objects.get(pk=cloned(invoice.pk))
+            self.assertEqual(copy.invoice_number, f'agency-copy-{invoice.invoice_number}')
+            self.assertEqual(
+                (copy.client_id, copy.trip_id, copy.created_by_id),
+                (cloned(invoice.client_id), cloned(invoice.trip_id), cloned_agent.pk)
+            )
+            self.assertEqual(copy.trip.client_id, copy.client_id)
+            self.assertEqual(copy.client.email, invoice.client.email)
+
+
+class DatabaseCopyTests(SimpleTestCase):
+    """An interrupted copy resumes after its last committed chunk and ends identical to the source"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.urls = {name: f'sqlite:///{directory.name}/{name}.sqlite3' for name in ('source', 'target')}
+        self.addCleanup(self.remove_aliases, set(connections.settings))
+        self.source = db_copy.add_database('copy_test_source', self.urls['source'])
+        self.target = db_copy.add_database('copy_test_target', self.urls['target'])
+        for alias in (self.source, self.target):
+            with connections[alias].schema_editor() as editor:
+                for model in (Role, Permission, RolePermission):
+                    editor.create_model(model)
+
+        Role.objects.using(self.source).bulk_create([
+            Role(name=name, description=name, hierarchy_level=n)
+            for n, name in enumerate(['SUPER_ADMIN', 'CLIENT_ADMIN'], start=1)
+        ])
+        permissions = [
+            Permission(name=f'Permission {n}', codename=f'permission_{n}', description='', category='CLIENTS')
+            for n in range(5)
+        ]
+        Permission.objects.using(self.source).bulk_create(permissions)
+        RolePermission.objects.using(self.source).bulk_create([
+            RolePermission(role=role, permission=permission)
+            for role in Role.objects.using(self.source) for permission in Permission.objects.using(self.source)
+        ])
+
+    @staticmethod
+    def remove_aliases(kept):
+        # Including the command's copy_source and copy_target
+        for alias in set(connections.settings) - kept:
+            connections[alias].close()
+            del connections[alias]
+            connections.settings.pop(alias, None)
+            settings.DATABASES.pop(alias, None)
+
+    def test_resume_after_interruption(self):
+        db_copy.ensure_checkpoint_table(self.target)
+        insert_rows = db_copy.insert_rows
+        calls = []
+
+        def interrupt_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise ConnectionError('connection lost')
+            return insert_rows(*args, **kwargs)
+
+        with mock.patch('rbac.db_copy.insert_rows', side_effect=interrupt_second_chunk):
+            with self.assertRaises(ConnectionError):
+                db_copy.copy_table('rbac.Permission', self.source, self.target, chunk_size=2)
+        # The first chunk and its checkpoint were committed, the second neither
+        self.assertEqual(Permission.objects.using(self.target).count(), 2)
+        self.assertEqual(db_copy.read_checkpoints(self.target)['permissions'][1:3], (2, False))
+
+        out = io.StringIO()
+        call_command(
+            'copy_database', '--source', self.urls['source'], '--target', self.urls['target'],
+            '--no-migrate', '--workers', '1', '--chunk-size', '2', stdout=out,
+        )
+        self.assertIn('Resuming', out.getvalue())
+        self.assertIn('All 3 tables match', out.getvalue())
+
+        for model in (Role, Permission, RolePermission):
+            with self.subTest(model=model.__name__):
+                target_pks = list(model.objects.using(self.target).values_list('pk', flat=True))
+                self.assertEqual(len(target_pks), len(set(target_pks)))
+                self.assertEqual(
+                    sorted(target_pks), sorted(model.objects.using(self.source).values_list('pk', flat=True))
+                )
+                check = db_copy.verify_table(model._meta.label, self.source, self.target)
+                self.assertEqual((check.source_rows, check.source_checksum), (check.target_rows, check.target_checksum))
+
+
+@skipUnless(find_spec('jinja2'), 'Jinja2 is not installed')
+class EmailTemplateParityTests(SimpleTestCase):
+    """The Jinja2 ports in jinja2/emails/ render the same emails as templates/emails/"""
+
+    def normalize(self, html):
+        return re.sub(r'>\s+<', '><', re.sub(r'\s+', ' ', html)).strip()
+
+    def test_engines_match(self):
+        django_engine, jinja2_engine = django_backend(cached=True), jinja2_backend()
+        contexts = {
+            'sample': sample_context(3, 4),
+            'sparse': {
+                **sample_context(1, 0), 'tenant_logo': 'https://example.com/logo.png',
+                'message': '', 'sender_name': '', 'sender_email': '', 'sender_phone': '',
+            },
+        }
+        for label, context in contexts.items():
+            for name in EMAIL_TEMPLATES:
+                with self.subTest(context=label, template=name):
+                    template_name = f'emails/{name}.html'
+                    self.assertEqual(
+                        self.normalize(jinja2_engine.get_template(template_name).render(context)),
+                        self.normalize(django_engine.get_template(template_name).render(context)),
+                    )
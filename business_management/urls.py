@@ -8,6 +8,9 @@ urlpatterns = [
     # Client Management
     path('clients/', views.client_list_view, name='client_list'),
     path('clients/new/', views.client_create_view, name='client_create'),
+    path('clients/import/', views.client_import_view, name='client_import'),
+    path('clients/import/<uuid:import_id>/', views.client_import_detail_view, name='client_import_detail'),
+    path('clients/import/<uuid:import_id>/progress/', views.client_import_progress_view, name='client_import_progress'),
     path('clients/<uuid:client_id>/', views.client_detail_view, name='client_detail'),
     path('clients/<uuid:client_id>/edit/', views.client_edit_view, name='client_edit'),
     path('clients/<uuid:client_id>/email/', views.send_client_email_view, name='send_client_email'),
@@ -17,9 +20,11 @@ urlpatterns = [
     path('trips/', views.trip_list_view, name='trip_list'),
     path('trips/create/', views.trip_create_view, name='trip_create'),
     path('trips/<uuid:trip_id>/', views.trip_detail_view, name='trip_detail'),
+    path('trips/<uuid:trip_id>/send/', views.trip_send_to_client_view, name='trip_send_to_client'),
     path('trips/<uuid:trip_id>/edit/', views.trip_edit_view, name='trip_edit'),
     path('trips/<uuid:trip_id>/confirm/', views.trip_confirm_view, name='trip_confirm'),
     path('trips/<uuid:trip_id>/itinerary/', views.trip_itinerary_view, name='trip_itinerary'),
+    path('trips/<uuid:trip_id>/itinerary/email/', views.trip_email_itinerary_view, name='trip_email_itinerary'),
     
     # Invoice Management  
     path('invoices/', views.invoice_list_view, name='invoice_list'),
@@ -28,4 +33,7 @@ urlpatterns = [
     path('invoices/<uuid:invoice_id>/edit/', views.invoice_edit_view, name='invoice_edit'),
     path('invoices/<uuid:invoice_id>/send/', views.invoice_send_view, name='invoice_send'),
     path('invoices/<uuid:invoice_id>/delete/', views.invoice_delete_view, name='invoice_delete'),
+
+    # Data Exports
+    path('export/<slug:dataset>.<slug:file_format>', views.export_view, name='crm_export'),
 ]
\ No newline at end of file
@@ -1,24 +1,35 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Count, Q, Sum
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.urls import reverse
 from django.utils import timezone
+from django.views.decorators.cache import never_cache
 from datetime import timedelta
 from .models import (
     Client, ClientCommunication, ClientNote, ClientDocument,
     Trip, TripLineItem, TripItinerary, TripParticipant, TripCommunication,
-    Invoice, InvoiceLineItem, Payment, PaymentSchedule
+    Invoice, InvoiceLineItem, Payment, PaymentSchedule, ClientImport
 )
+from .client_import import COLUMN_ALIASES, detect_format, schedule_import
 from .email_service import TenantEmailService
+from .exports import EXPORTS, FORMATS, aiter_sync, iter_export
+from rbac.decorators import async_login_required, query_budget
+from rbac.navigation import can_access_financial_data, navigation_version
+from rbac.tenant_context import get_tenant_database
 
 
 # ============================================================================
 # CLIENT MANAGEMENT VIEWS
 # ============================================================================
 
+@query_budget(15)
 @login_required
 def client_list_view(request):
     """List all clients for the current tenant with search and filtering"""
@@ -80,6 +91,7 @@ def client_list_view(request):
     return render(request, 'business_management/client_list.html', context)
 
 
+@query_budget(20)
 @login_required
 def client_detail_view(request, client_id):
     """Detailed view of a specific client"""
@@ -191,10 +203,112 @@ def client_edit_view(request, client_id):
     return render(request, 'business_management/client_form.html', context)
 
 
+# ============================================================================
+# CLIENT IMPORT VIEWS
+# ============================================================================
+
+@login_required
+def client_import_view(request):
+    """Upload a CSV, Excel or vCard file of clients to import in the background"""
+    if request.user.tenant is None:
+        messages.error(request, 'Client imports need an agency account.')
+        return redirect('client_list')
+
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        file_format = detect_format(upload.name) if upload else None
+        if not upload:
+            messages.error(request, 'Please choose a file to import.')
+        elif not file_format:
+            messages.error(request, 'Please upload a .csv, .xlsx or .vcf file.')
+        elif upload.size > settings.CLIENT_IMPORT_MAX_MB * 1024 * 1024:
+            messages.error(request, f'Import files can be at most {settings.CLIENT_IMPORT_MAX_MB} MB.')
+        else:
+            job = ClientImport(
+                tenant=request.user.tenant,
+                created_by=request.user,
+                original_name=upload.name[:255],
+                file_format=file_format,
+            )
+            job.file.save(upload.name, upload, save=False)
+            job.save()
+            schedule_import(job)
+            return redirect('client_import_detail', import_id=job.id)
+
+    context = {
+        'imports': ClientImport.objects.filter(tenant=request.user.tenant)[:10],
+        'column_aliases': COLUMN_ALIASES,
+        'max_mb': settings.CLIENT_IMPORT_MAX_MB,
+    }
+    return render(request, 'business_management/client_import.html', context)
+
+
+@login_required
+def client_import_detail_view(request, import_id):
+    """Progress page for an import; polls client_import_progress until it finishes"""
+    job = get_object_or_404(ClientImport, id=import_id, tenant=request.user.tenant)
+    return render(request, 'business_management/client_import_detail.html', {'job': job})
+
+
+@never_cache
+@login_required
+def client_import_progress_view(request, import_id):
+    """Import progress as JSON; ?errors_from=N only returns the row errors after the first N"""
+    job = get_object_or_404(ClientImport, id=import_id, tenant=request.user.tenant)
+    try:
+        errors_from = max(int(request.GET.get('errors_from', 0)), 0)
+    except ValueError:
+        errors_from = 0
+    return JsonResponse({
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'finished': job.is_finished,
+        'message': job.message,
+        'percent': job.percent,
+        'processed_rows': job.processed_rows,
+        'created_count': job.created_count,
+        'duplicate_count': job.duplicate_count,
+        'error_count': job.error_count,
+        'errors': job.errors[errors_from:],
+        'errors_reported': len(job.errors),
+    })
+
+
+# ============================================================================
+# DATA EXPORT VIEWS
+# ============================================================================
+
+@login_required
+def export_view(request, dataset, file_format):
+    """Stream one of the tenant's datasets as a CSV or Excel file"""
+    if dataset not in EXPORTS or file_format not in FORMATS:
+        raise Http404
+    if request.user.tenant is None:
+        raise PermissionDenied
+    financial_access = can_access_financial_data(request.user, navigation_version())
+    if EXPORTS[dataset]['financial'] and not financial_access:
+        raise PermissionDenied
+
+    tenant = request.user.tenant
+    # The alias is fixed now: the tenant routing context ends with the view,
+    # before the response body is read
+    chunks = iter_export(dataset, file_format, tenant.pk, get_tenant_database(tenant.pk), financial_access)
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_sync(chunks)
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[file_format])
+    filename = f"{tenant.subdomain}-{dataset}-{timezone.localdate():%Y-%m-%d}.{file_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private, no-store'
+    # Let nginx pass chunks through as they are written
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # ============================================================================
 # TRIP MANAGEMENT VIEWS
 # ============================================================================
 
+@query_budget(15)
 @login_required
 def trip_list_view(request):
     """List all trips for the current tenant"""
@@ -305,54 +419,6 @@ def trip_detail_view(request, trip_id):
             except TripLineItem.DoesNotExist:
                 return JsonResponse({'success': False, 'message': 'Line item not found.'})
         
-        elif action == 'send_trip_to_client':
-            try:
-                custom_message = request.POST.get('custom_message', '')
-                include_itinerary = request.POST.get('include_itinerary') == 'on'
-                include_line_items = request.POST.get('include_line_items') == 'on'
-                
-                # Get email service for tenant
-                email_service = TenantEmailService(tenant=request.user.tenant)
-                
-                # Prepare context for email
-                context_data = {
-                    'trip': trip,
-                    'message': custom_message,
-                }
-                
-                if include_itinerary:
-                    context_data['itinerary_days'] = trip.itinerary_days.all().order_by('day_number')
-                
-                if include_line_items:
-                    context_data['line_items'] = trip.line_items.all().order_by('item_type', 'service_date')
-                    context_data['line_items_total'] = sum(item.total_price for item in context_data['line_items'])
-                
-                # Send trip email using existing itinerary template
-                success, communication = email_service.send_client_email(
-                    client=trip.client,
-                    subject=f'Your Trip Information: {trip.trip_name} - {trip.destination}',
-                    template_name='itinerary',
-                    context=context_data,
-                    sender_name=request.user.get_full_name() or request.user.username
-                )
-                
-                if success:
-                    return JsonResponse({
-                        'success': True, 
-                        'message': f'Trip information sent successfully to {trip.client.full_name}!'
-                    })
-                else:
-                    return JsonResponse({
-                        'success': False, 
-                        'message': 'Failed to send trip information. Please try again.'
-                    })
-                    
-            except Exception as e:
-                return JsonResponse({
-                    'success': False, 
-                    'message': f'Error sending trip information: {str(e)}'
-                })
-        
         elif action == 'push_to_invoice':
             try:
                 line_item_id = request.POST.get('line_item_id')
@@ -495,10 +561,71 @@ def trip_detail_view(request, trip_id):
     return render(request, 'business_management/trip_detail.html', context)
 
 
+@async_login_required
+async def trip_send_to_client_view(request, trip_id):
+    """Email trip details (optionally itinerary and line items) to the client"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method.'})
+    
+    try:
+        trip = await Trip.objects.select_related('client').aget(id=trip_id, client__tenant=request.user.tenant)
+    except Trip.DoesNotExist:
+        raise Http404('No Trip matches the given query.')
+    
+    try:
+        custom_message = request.POST.get('custom_message', '')
+        include_itinerary = request.POST.get('include_itinerary') == 'on'
+        include_line_items = request.POST.get('include_line_items') == 'on'
+        
+        # Get email service for tenant
+        email_service = TenantEmailService(tenant=request.user.tenant)
+        
+        # Prepare context for email
+        context_data = {
+            'trip': trip,
+            'message': custom_message,
+        }
+        
+        if include_itinerary:
+            context_data['itinerary_days'] = trip.itinerary_days.all().order_by('day_number')
+        
+        if include_line_items:
+            line_items = [item async for item in trip.line_items.all().order_by('item_type', 'service_date')]
+            context_data['line_items'] = line_items
+            context_data['line_items_total'] = sum(item.total_price for item in line_items)
+        
+        # Send trip email using existing itinerary template
+        success, communication = await email_service.asend_client_email(
+            client=trip.client,
+            subject=f'Your Trip Information: {trip.trip_name} - {trip.destination}',
+            template_name='itinerary',
+            context=context_data,
+            sender_name=request.user.get_full_name() or request.user.username
+        )
+        
+        if success:
+            return JsonResponse({
+                'success': True, 
+                'message': f'Trip information sent successfully to {trip.client.full_name}!'
+            })
+        else:
+            return JsonResponse({
+                'success': False, 
+                'message': 'Failed to send trip information. Please try again.'
+            })
+            
+    except Exception as e:
+        return JsonResponse({
+            'success': False, 
+            'message': f'Error sending trip information: {str(e)}'
+        })
+
+
 # ============================================================================
 # INVOICE MANAGEMENT VIEWS  
 # ============================================================================
 
+@query_budget(15)
 @login_required
 def invoice_list_view(request):
     """List all invoices for the current tenant"""
@@ -582,6 +709,7 @@ def invoice_detail_view(request, invoice_id):
 # DASHBOARD AND OVERVIEW VIEWS
 # ============================================================================
 
+@query_budget(20)
 @login_required
 def crm_dashboard_view(request):
     """Main CRM dashboard for travel advisors"""
@@ -613,12 +741,12 @@ def crm_dashboard_view(request):
     
     # Recent activity
     recent_clients = Client.objects.filter(tenant=tenant).order_by('-created_at')[:5]
-    upcoming_departures = Trip.objects.filter(
+    upcoming_departures = Trip.objects.select_related('client').filter(
         client__tenant=tenant,
         departure_date__gte=timezone.now().date()
     ).order_by('departure_date')[:5]
     
-    overdue_invoices = Invoice.objects.filter(
+    overdue_invoices = Invoice.objects.select_related('client').filter(
         client__tenant=tenant,
         due_date__lt=timezone.now().date(),
         status__in=['SENT', 'VIEWED']
@@ -644,10 +772,13 @@ def crm_dashboard_view(request):
 # COMMUNICATION VIEWS
 # ============================================================================
 
-@login_required
-def send_client_email_view(request, client_id):
+@async_login_required
+async def send_client_email_view(request, client_id):
     """Send email to a specific client"""
-    client = get_object_or_404(Client, id=client_id, tenant=request.user.tenant)
+    try:
+        client = await Client.objects.aget(id=client_id, tenant=request.user.tenant)
+    except Client.DoesNotExist:
+        raise Http404('No Client matches the given query.')
     
     if request.method == 'POST':
         subject = request.POST.get('subject')
@@ -658,8 +789,8 @@ def send_client_email_view(request, client_id):
             # Get email service for tenant
             email_service = TenantEmailService(tenant=request.user.tenant)
             
-            # Send email
-            success, communication = email_service.send_client_email(
+            # Send email without holding a worker while Mailgun responds
+            success, communication = await email_service.asend_client_email(
                 client=client,
                 subject=subject,
                 template_name=template_name,
@@ -684,7 +815,7 @@ def send_client_email_view(request, client_id):
         ]
     }
     
-    return render(request, 'business_management/send_email.html', context)
+    return await sync_to_async(render)(request, 'business_management/send_email.html', context)
 
 
 @login_required
@@ -910,44 +1041,6 @@ def trip_itinerary_view(request, trip_id):
                 return JsonResponse({'success': True, 'message': 'Day deleted successfully!'})
             except TripItinerary.DoesNotExist:
                 return JsonResponse({'success': False, 'message': 'Day not found.'})
-        
-        elif action == 'email_itinerary':
-            include_pdf = request.POST.get('include_pdf') == 'on'
-            custom_message = request.POST.get('custom_message', '')
-            
-            try:
-                # Get email service for tenant
-                email_service = TenantEmailService(tenant=request.user.tenant)
-                
-                # Send itinerary email
-                success, communication = email_service.send_client_email(
-                    client=trip.client,
-                    subject=f'Your Itinerary: {trip.trip_name} - {trip.destination}',
-                    template_name='itinerary',
-                    context={
-                        'trip': trip,
-                        'itinerary_days': itinerary_days,
-                        'message': custom_message,
-                    },
-                    sender_name=request.user.get_full_name() or request.user.username
-                )
-                
-                if success:
-                    return JsonResponse({
-                        'success': True, 
-                        'message': f'Itinerary sent successfully to {trip.client.full_name}!'
-                    })
-                else:
-                    return JsonResponse({
-                        'success': False, 
-                        'message': 'Failed to send itinerary. Please try again.'
-                    })
-                    
-            except Exception as e:
-                return JsonResponse({
-                    'success': False, 
-                    'message': f'Error sending itinerary: {str(e)}'
-                })
     
     context = {
         'trip': trip,
@@ -957,6 +1050,55 @@ def trip_itinerary_view(request, trip_id):
     return render(request, 'business_management/trip_itinerary.html', context)
 
 
+@async_login_required
+async def trip_email_itinerary_view(request, trip_id):
+    """Email the trip itinerary to the client"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method.'})
+    
+    try:
+        trip = await Trip.objects.select_related('client').aget(id=trip_id, client__tenant=request.user.tenant)
+    except Trip.DoesNotExist:
+        raise Http404('No Trip matches the given query.')
+    
+    include_pdf = request.POST.get('include_pdf') == 'on'
+    custom_message = request.POST.get('custom_message', '')
+    
+    try:
+        # Get email service for tenant
+        email_service = TenantEmailService(tenant=request.user.tenant)
+        
+        # Send itinerary email
+        success, communication = await email_service.asend_client_email(
+            client=trip.client,
+            subject=f'Your Itinerary: {trip.trip_name} - {trip.destination}',
+            template_name='itinerary',
+            context={
+                'trip': trip,
+                'itinerary_days': trip.itinerary_days.all().order_by('day_number'),
+                'message': custom_message,
+            },
+            sender_name=request.user.get_full_name() or request.user.username
+        )
+        
+        if success:
+            return JsonResponse({
+                'success': True, 
+                'message': f'Itinerary sent successfully to {trip.client.full_name}!'
+            })
+        else:
+            return JsonResponse({
+                'success': False, 
+                'message': 'Failed to send itinerary. Please try again.'
+            })
+            
+    except Exception as e:
+        return JsonResponse({
+            'success': False, 
+            'message': f'Error sending itinerary: {str(e)}'
+        })
+
+
 # ============================================================================
 # ADDITIONAL INVOICE MANAGEMENT VIEWS
 # ============================================================================
@@ -1055,17 +1197,22 @@ def invoice_edit_view(request, invoice_id):
     return render(request, 'business_management/invoice_form.html', context)
 
 
-@login_required
-def invoice_send_view(request, invoice_id):
+@async_login_required
+async def invoice_send_view(request, invoice_id):
     """Send invoice to client via email"""
-    invoice = get_object_or_404(Invoice, id=invoice_id, client__tenant=request.user.tenant)
+    try:
+        invoice = await Invoice.objects.select_related('client').aget(
+            id=invoice_id, client__tenant=request.user.tenant
+        )
+    except Invoice.DoesNotExist:
+        raise Http404('No Invoice matches the given query.')
     
     if request.method == 'POST':
         # Get email service for tenant
         email_service = TenantEmailService(tenant=request.user.tenant)
         
-        # Send invoice email
-        success, communication = email_service.send_client_email(
+        # Send invoice email without holding a worker while Mailgun responds
+        success, communication = await email_service.asend_client_email(
             client=invoice.client,
             subject=f'Invoice {invoice.invoice_number} - {invoice.total_amount}',
             template_name='invoice',
@@ -1080,7 +1227,7 @@ def invoice_send_view(request, invoice_id):
             # Update invoice status
             if invoice.status == 'DRAFT':
                 invoice.status = 'SENT'
-                invoice.save()
+                await invoice.asave()
             
             messages.success(request, f'Invoice {invoice.invoice_number} sent to {invoice.client.full_name}!')
         else:
@@ -1092,7 +1239,7 @@ def invoice_send_view(request, invoice_id):
         'invoice': invoice,
     }
     
-    return render(request, 'business_management/invoice_send.html', context)
+    return await sync_to_async(render)(request, 'business_management/invoice_send.html', context)
 
 
 @login_required
@@ -1122,6 +1269,7 @@ def invoice_delete_view(request, invoice_id):
 # CLIENT COMMUNICATION TRACKING VIEWS
 # ============================================================================
 
+@query_budget(20)
 @login_required
 def client_communications_view(request, client_id):
     """View all communications with a specific client"""
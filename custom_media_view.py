@@ -1,39 +1,221 @@
-from django.http import HttpResponse, Http404, FileResponse
-from django.conf import settings
-import os
+"""
+Media file serving (tenant logos, client documents)
+
+Files are validated and conditional requests answered here from a single
+stat(); the bytes are then either handed to the front server
+(MEDIA_SENDFILE = x-accel-redirect | x-sendfile) or streamed by Django, with
+single byte ranges for large documents. Paths under MEDIA_IMMUTABLE_PREFIXES
+never change content and are cached for a year.
+"""
 import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
 
-def serve_media_file(request, path):
-    """Custom view to serve media files from Railway volume"""
-    
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+async def read_file_chunks(file_path, chunk_size=CHUNK_SIZE, offset=0, length=None):
+    """Async iterator over a file; reads run in a thread pool so the event loop stays free"""
+    f = await sync_to_async(open, thread_sensitive=False)(file_path, 'rb')
+    try:
+        if offset:
+            await sync_to_async(f.seek, thread_sensitive=False)(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await sync_to_async(f.read, thread_sensitive=False)(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        await sync_to_async(f.close, thread_sensitive=False)()
+
+
+def iter_file_range(file_path, offset, length, chunk_size=CHUNK_SIZE):
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def get_media_root():
     # Force use of Railway volume
     if os.path.exists('/app/media'):
-        media_root = '/app/media'
+        return '/app/media'
+    return str(settings.MEDIA_ROOT)
+
+
+def resolve_media_path(media_root, path):
+    """
+    Absolute path of a media file, or None when the path escapes the media root
+    (.., absolute paths, or a symlink pointing outside it)
+    """
+    root = os.path.realpath(media_root)
+    try:
+        file_path = os.path.realpath(os.path.join(root, path))
+    except ValueError:  # Embedded NUL byte
+        return None
+    if file_path == root or os.path.commonpath([root, file_path]) != root:
+        return None
+    return file_path
+
+
+def file_etag(file_stat):
+    """Strong ETag from inode, size and mtime - any rewrite of the file changes it"""
+    return f'"{file_stat.st_ino:x}-{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+
+
+def is_immutable(path):
+    return any(path.startswith(prefix) for prefix in settings.MEDIA_IMMUTABLE_PREFIXES)
+
+
+def cache_control(path):
+    if is_immutable(path):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    # Client documents must never land in a shared cache
+    return f'private, max-age={settings.MEDIA_CACHE_SECONDS}'
+
+
+def parse_range(header, size):
+    """
+    (start, length) for a single satisfiable byte range, None to serve the
+    whole file (no header, or several ranges), or False when unsatisfiable
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        start = max(size - suffix, 0)
+        return start, size - start
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end - start + 1
+
+
+def if_range_matches(request, etag, last_modified):
+    """A Range request with If-Range only gets a partial response if the file is unchanged"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Weak validators never match (RFC 9110 13.1.5)
+        return parse_etags(if_range) == [etag]
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def sendfile_response(file_path, media_root):
+    backend = settings.MEDIA_SENDFILE
+    response = HttpResponse()
+    if backend == 'x-accel-redirect':
+        relative = os.path.relpath(file_path, os.path.realpath(media_root)).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_PREFIX + quote(relative)
+    elif backend == 'x-sendfile':
+        response['X-Sendfile'] = file_path
     else:
-        media_root = settings.MEDIA_ROOT
-    
-    # Build full file path
-    file_path = os.path.join(media_root, path)
-    
-    # Security check - ensure path is within media root
-    if not file_path.startswith(media_root):
+        raise ValueError(f'Unknown MEDIA_SENDFILE backend: {backend}')
+    return response
+
+
+async def serve_media_file(request, path):
+    """Custom view to serve media files from Railway volume"""
+    media_root = get_media_root()
+    file_path = resolve_media_path(media_root, path)
+    if file_path is None:
         raise Http404("Invalid file path")
-    
-    # Check if file exists
-    if not os.path.exists(file_path) or not os.path.isfile(file_path):
+
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        raise Http404(f"File not found: {path}")
+    if not stat.S_ISREG(file_stat.st_mode):
         raise Http404(f"File not found: {path}")
-    
-    # Get content type
+
     content_type, _ = mimetypes.guess_type(file_path)
-    if not content_type:
-        content_type = 'application/octet-stream'
-    
-    # Return file response
-    try:
-        return FileResponse(
-            open(file_path, 'rb'),
-            content_type=content_type,
-            as_attachment=False
-        )
-    except Exception as e:
-        raise Http404(f"Error serving file: {str(e)}")
\ No newline at end of file
+    etag = file_etag(file_stat)
+    last_modified = int(file_stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+
+    # 304 Not Modified / 412 Precondition Failed without touching the file
+    validators = HttpResponse(headers=headers)
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=validators)
+    if conditional is not validators:
+        return conditional
+
+    if settings.MEDIA_SENDFILE:
+        # The front server reads the file and handles Range itself
+        response = sendfile_response(file_path, media_root)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+    else:
+        try:
+            response = build_file_response(request, file_path, file_stat.st_size, content_type, etag, last_modified)
+        except OSError as e:
+            raise Http404(f"Error serving file: {str(e)}")
+    for header, value in headers.items():
+        response[header] = value
+    response['Content-Disposition'] = content_disposition_header(False, os.path.basename(file_path))
+    return response
+
+
+def build_file_response(request, file_path, size, content_type, etag, last_modified):
+    content_type = content_type or 'application/octet-stream'
+    byte_range = None
+    if request.method == 'GET' and if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(size)
+        return response
+
+    if byte_range is None:
+        if not isinstance(request, ASGIRequest):
+            # Gunicorn sends FileResponse bodies with sendfile()
+            return FileResponse(open(file_path, 'rb'), content_type=content_type)
+        # Under ASGI a sync file iterator would be read fully into memory
+        # before sending, so stream it through an async iterator instead
+        response = StreamingHttpResponse(read_file_chunks(file_path), content_type=content_type)
+        response['Content-Length'] = str(size)
+        return response
+
+    start, length = byte_range
+    if isinstance(request, ASGIRequest):
+        body = read_file_chunks(file_path, offset=start, length=length)
+    else:
+        body = iter_file_range(file_path, start, length)
+    response = StreamingHttpResponse(body, status=206, content_type=content_type)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    return response
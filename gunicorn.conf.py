@@ -1,20 +1,142 @@
-# Gunicorn configuration file for production-like development
+# Gunicorn runtime configuration - used by start.sh and scripts/start_production.sh
+#
+# Workers and threads are sized from the CPUs and memory actually available to
+# the container (cgroup limits, not the host's), and can be overridden with:
+#   GUNICORN_WORKER_CLASS  sync | gthread | uvicorn (default: uvicorn when
+#                          ASGI_ENABLED=true, otherwise gthread)
+#   WEB_CONCURRENCY        number of worker processes
+#   GUNICORN_THREADS       threads per gthread worker (default 4)
+#   GUNICORN_WORKER_MEMORY_MB  expected RSS per worker used to cap workers (default 160)
+#   GUNICORN_MAX_WORKERS   upper bound on auto-sized workers (default 8)
+#   GUNICORN_PRELOAD       load the app in the master before forking (default true)
+#   GUNICORN_TIMEOUT, GUNICORN_MAX_REQUESTS
+#   METRICS_DIR            where workers write their request metrics (cleared on start)
+#
+# scripts/loadtest_gunicorn.py compares throughput and memory across settings.
+import gc
+import math
+import multiprocessing
+import os
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def read_file(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit():
+    """CPU quota in cores from cgroup v2 (cpu.max) or v1 (cfs quota), or None"""
+    cpu_max = read_file('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / int(period)
+        return None
+
+    quota = read_file('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = read_file('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+    limit = cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return cpus
+
+
+def memory_limit_bytes():
+    """Memory limit from cgroup v2/v1, falling back to physical memory"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = read_file(path)
+        # v1 reports "no limit" as a huge number close to 2**63
+        if value and value != 'max' and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_worker_count(worker_class, cpus):
+    if worker_class == 'sync':
+        return 2 * cpus + 1
+    if worker_class == 'gthread':
+        return cpus + 1
+    # One event loop per core
+    return cpus
+
+
+ASGI_ENABLED = env_bool('ASGI_ENABLED')
+WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn' if ASGI_ENABLED else 'gthread').lower()
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': 'uvicorn.workers.UvicornWorker',
+}
+if WORKER_CLASS not in WORKER_CLASSES:
+    raise RuntimeError(f'GUNICORN_WORKER_CLASS must be one of {", ".join(WORKER_CLASSES)}')
+
+CPUS = available_cpus()
+MEMORY_LIMIT = memory_limit_bytes()
+WORKER_MEMORY_MB = env_int('GUNICORN_WORKER_MEMORY_MB', 160)
+
+if 'WEB_CONCURRENCY' in os.environ:
+    WORKERS = max(1, env_int('WEB_CONCURRENCY', 2))
+else:
+    WORKERS = min(default_worker_count(WORKER_CLASS, CPUS), env_int('GUNICORN_MAX_WORKERS', 8))
+    if MEMORY_LIMIT:
+        # Leave room for the master process
+        memory_workers = (MEMORY_LIMIT // (1024 * 1024) - WORKER_MEMORY_MB) // WORKER_MEMORY_MB
+        WORKERS = min(WORKERS, max(1, memory_workers))
+    WORKERS = max(1, WORKERS)
 
 # Server socket
-bind = "0.0.0.0:8000"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
 backlog = 2048
 
+# Application - ASGI for uvicorn workers, WSGI otherwise
+wsgi_app = 'vacationdesktop.asgi:application' if WORKER_CLASS == 'uvicorn' else 'vacationdesktop.wsgi:application'
+
 # Worker processes
-workers = 2  # (2 x CPU cores) + 1
-worker_class = "sync"
+workers = WORKERS
+worker_class = WORKER_CLASSES[WORKER_CLASS]
+threads = env_int('GUNICORN_THREADS', 4) if WORKER_CLASS == 'gthread' else 1
 worker_connections = 1000
-timeout = 30
+timeout = env_int('GUNICORN_TIMEOUT', 300)
+graceful_timeout = 60
 keepalive = 2
 
 # Restart workers after this many requests, to prevent memory leaks
-max_requests = 1000
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 500)
 max_requests_jitter = 50
 
+# Import Django once in the master so workers share its pages copy-on-write
+preload_app = env_bool('GUNICORN_PRELOAD', True)
+
 # Logging - Use stdout/stderr for Railway deployment
 accesslog = "-"  # stdout
 errorlog = "-"   # stderr
@@ -40,7 +162,45 @@ limit_request_field_size = 8190
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile"
 
+# Request metrics files written by the workers (rbac/request_metrics.py)
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+
 # Environment
 raw_env = [
     'DJANGO_SETTINGS_MODULE=vacationdesktop.settings',
-]
\ No newline at end of file
+]
+
+
+def when_ready(server):
+    memory = f'{MEMORY_LIMIT // (1024 * 1024)}MB' if MEMORY_LIMIT else 'unknown'
+    server.log.info(
+        f'🚀 {workers} x {WORKER_CLASS} workers'
+        f'{f" x {threads} threads" if WORKER_CLASS == "gthread" else ""} '
+        f'(cpus={CPUS}, memory limit={memory}, preload={preload_app})'
+    )
+    if preload_app:
+        from django.conf import settings
+        if settings.TEMPLATE_CACHE:
+            # Parse every template once here; workers inherit the cached loader
+            from rbac.template_warmup import warm_templates
+            compiled, failed = warm_templates()
+            server.log.info(f'🧩 Precompiled {compiled} templates ({failed} failed)')
+        # Connections opened while importing the app must not be shared by workers
+        from django.db import connections
+        connections.close_all()
+        # Keep the preloaded objects out of the cyclic GC so collections in the
+        # workers don't touch (and un-share) their pages
+        gc.freeze()
+
+
+def on_starting(server):
+    if METRICS_DIR:
+        from rbac.request_metrics import clear_metrics_dir
+        clear_metrics_dir(METRICS_DIR)
+
+
+def child_exit(server, worker):
+    if METRICS_DIR:
+        # Keep the exited worker's counts; its pid may be reused
+        from rbac.request_metrics import retire_worker
+        retire_worker(worker.pid, METRICS_DIR)
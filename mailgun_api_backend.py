@@ -2,6 +2,9 @@
 Mailgun HTTP API email backend for Django
 More reliable than SMTP on cloud platforms like Railway
 """
+import asyncio
+import weakref
+
 import requests
 from django.core.mail.backends.base import BaseEmailBackend
 from django.core.mail.message import sanitize_address
@@ -10,6 +13,36 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# One httpx.AsyncClient per event loop so concurrent sends share keep-alive
+# connections; each is closed when its loop shuts down
+_async_clients = weakref.WeakKeyDictionary()
+
+
+async def _close_at_shutdown(client):
+    # Left suspended at the yield: the loop's shutdown_asyncgens() (run by
+    # asyncio.run, and so by async_to_sync for every sync caller) finalizes it
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def get_async_client():
+    """Shared httpx.AsyncClient for the running event loop"""
+    import httpx
+    
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        client = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+        entry = _async_clients[loop] = (client, _close_at_shutdown(client))
+        await entry[1].__anext__()
+    return entry[0]
+
+
 class MailgunAPIBackend(BaseEmailBackend):
     """
     Email backend that uses Mailgun's HTTP API instead of SMTP
@@ -46,36 +79,58 @@ class MailgunAPIBackend(BaseEmailBackend):
         
         return sent_count
     
+    async def asend_messages(self, email_messages):
+        """
+        Send email messages using Mailgun API without blocking the event loop
+        """
+        if not self.api_key:
+            logger.error("MAILGUN_API_KEY not configured")
+            return 0
+            
+        if not self.domain:
+            logger.error("MAILGUN_DOMAIN not configured")
+            return 0
+        
+        results = await asyncio.gather(*(self._asend_message(message) for message in email_messages))
+        return sum(1 for sent in results if sent)
+    
+    def _build_request(self, message):
+        """
+        Build the Mailgun API URL and form data for a message
+        """
+        url = f"https://api.mailgun.net/v3/{self.domain}/messages"
+        
+        # Handle multiple recipients
+        to_emails = [sanitize_address(addr, message.encoding) for addr in message.to]
+        
+        data = {
+            'from': sanitize_address(message.from_email, message.encoding),
+            'to': to_emails,
+            'subject': message.subject,
+            'text': message.body,
+        }
+        
+        # Add HTML version if available
+        for alternative in getattr(message, 'alternatives', []):
+            content, content_type = alternative
+            if content_type == 'text/html':
+                data['html'] = content
+                break
+        
+        # Add CC and BCC if present
+        if message.cc:
+            data['cc'] = [sanitize_address(addr, message.encoding) for addr in message.cc]
+        if message.bcc:
+            data['bcc'] = [sanitize_address(addr, message.encoding) for addr in message.bcc]
+        
+        return url, data
+    
     def _send_message(self, message):
         """
         Send a single email message via Mailgun API
         """
         try:
-            # Prepare API request
-            url = f"https://api.mailgun.net/v3/{self.domain}/messages"
-            
-            # Handle multiple recipients
-            to_emails = [sanitize_address(addr, message.encoding) for addr in message.to]
-            
-            data = {
-                'from': sanitize_address(message.from_email, message.encoding),
-                'to': to_emails,
-                'subject': message.subject,
-                'text': message.body,
-            }
-            
-            # Add HTML version if available
-            for alternative in message.alternatives:
-                content, content_type = alternative
-                if content_type == 'text/html':
-                    data['html'] = content
-                    break
-            
-            # Add CC and BCC if present
-            if message.cc:
-                data['cc'] = [sanitize_address(addr, message.encoding) for addr in message.cc]
-            if message.bcc:
-                data['bcc'] = [sanitize_address(addr, message.encoding) for addr in message.bcc]
+            url, data = self._build_request(message)
             
             # Make API request
             response = requests.post(
@@ -94,4 +149,29 @@ class MailgunAPIBackend(BaseEmailBackend):
                 
         except Exception as e:
             logger.error(f"Failed to send email via Mailgun API: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    async def _asend_message(self, message):
+        """
+        Send a single email message via Mailgun API using httpx.AsyncClient
+        """
+        try:
+            url, data = self._build_request(message)
+            
+            client = await get_async_client()
+            response = await client.post(
+                url,
+                auth=('api', self.api_key),
+                data=data,
+            )
+            
+            if response.status_code == 200:
+                logger.info(f"Email sent successfully via Mailgun API: {message.subject}")
+                return True
+            else:
+                logger.error(f"Mailgun API error {response.status_code}: {response.text}")
+                return False
+                
+        except Exception as e:
+            logger.error(f"Failed to send email via Mailgun API: {str(e)}")
+            return False
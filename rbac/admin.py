@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth import get_user_model
+from .admin_performance import AutocompleteFilter, ScalableModelAdmin
 from .models import (
     Tenant, Role, Permission, RolePermission, UserPermissionOverride, AuditLog,
     AccountStatus, ClientAccount, SalesOpportunity, SupportTicket, TicketComment, OnboardingTask
@@ -11,7 +12,7 @@ User = get_user_model()
 
 
 @admin.register(Tenant)
-class TenantAdmin(admin.ModelAdmin):
+class TenantAdmin(ScalableModelAdmin):
     list_display = ['name', 'subdomain', 'tenant_type', 'status', 'is_active', 'plan_type', 'max_users', 'created_at']
     list_filter = ['tenant_type', 'status', 'is_active', 'plan_type', 'created_at']
     search_fields = ['name', 'subdomain', 'contact_email']
@@ -27,6 +28,11 @@ class TenantAdmin(admin.ModelAdmin):
         ('Subscription & Billing', {
             'fields': ('plan_type', 'max_users')
         }),
+        ('Data Placement', {
+            'fields': ('database_alias',),
+            'description': 'Use the move_tenant management command to change placement of existing data',
+            'classes': ('collapse',)
+        }),
         ('Metadata', {
             'fields': ('id', 'created_at'),
             'classes': ('collapse',)
@@ -35,15 +41,16 @@ class TenantAdmin(admin.ModelAdmin):
 
 
 @admin.register(Role)
-class RoleAdmin(admin.ModelAdmin):
+class RoleAdmin(ScalableModelAdmin):
     list_display = ['name', 'hierarchy_level', 'is_system_role', 'created_at']
     list_filter = ['is_system_role', 'hierarchy_level']
+    search_fields = ['name', 'description']
     ordering = ['hierarchy_level']
     readonly_fields = ['created_at']
 
 
 @admin.register(Permission)
-class PermissionAdmin(admin.ModelAdmin):
+class PermissionAdmin(ScalableModelAdmin):
     list_display = ['name', 'category', 'codename', 'is_sensitive', 'created_at']
     list_filter = ['category', 'is_sensitive', 'created_at']
     search_fields = ['name', 'codename', 'description']
@@ -51,18 +58,24 @@ class PermissionAdmin(admin.ModelAdmin):
 
 
 @admin.register(RolePermission)
-class RolePermissionAdmin(admin.ModelAdmin):
+class RolePermissionAdmin(ScalableModelAdmin):
     list_display = ['role', 'permission', 'granted_at']
-    list_filter = ['role', 'permission__category', 'granted_at']
+    list_filter = [('role', AutocompleteFilter), 'permission__category', 'granted_at']
+    list_select_related = ['role', 'permission']
     readonly_fields = ['granted_at']
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(ScalableModelAdmin, BaseUserAdmin):
     list_display = ['username', 'email', 'role', 'tenant', 'is_active', 'mfa_enabled', 'user_created_at']
-    list_filter = ['is_active', 'role', 'tenant', 'mfa_enabled', 'has_financial_access', 'user_created_at']
+    list_filter = [
+        'is_active', ('role', AutocompleteFilter), ('tenant', AutocompleteFilter),
+        'mfa_enabled', 'has_financial_access', 'user_created_at',
+    ]
+    list_select_related = ['role', 'tenant']
     search_fields = ['username', 'email', 'first_name', 'last_name']
     readonly_fields = ['id', 'user_created_at', 'user_updated_at', 'last_login_ip']
+    raw_id_fields = ['tenant']
     
     # Override add_fieldsets to include role as required field
     add_fieldsets = BaseUserAdmin.add_fieldsets + (
@@ -93,6 +106,11 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # User.__str__ shows the role, e.g. in autocomplete results. The changelist
+        # skips list_select_related for querysets that already select related rows.
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
     def get_form(self, request, obj=None, **kwargs):
         """Override form to set role as required"""
         form = super().get_form(request, obj, **kwargs)
@@ -111,19 +129,24 @@ class UserAdmin(BaseUserAdmin):
 
 
 @admin.register(UserPermissionOverride)
-class UserPermissionOverrideAdmin(admin.ModelAdmin):
+class UserPermissionOverrideAdmin(ScalableModelAdmin):
     list_display = ['user', 'permission', 'is_granted', 'granted_by', 'created_at', 'expires_at']
     list_filter = ['is_granted', 'permission__category', 'created_at', 'expires_at']
+    list_select_related = ['user__role', 'permission', 'granted_by__role']
     search_fields = ['user__username', 'permission__name', 'reason']
     readonly_fields = ['created_at']
+    raw_id_fields = ['user', 'granted_by']
 
 
 @admin.register(AuditLog)
-class AuditLogAdmin(admin.ModelAdmin):
+class AuditLogAdmin(ScalableModelAdmin):
     list_display = ['user', 'action', 'resource_type', 'tenant', 'ip_address', 'created_at']
-    list_filter = ['action', 'resource_type', 'tenant', 'created_at']
+    # created_at's date hierarchy replaces a date list filter
+    list_filter = ['action', 'resource_type', ('tenant', AutocompleteFilter)]
+    list_select_related = ['user__role', 'tenant']
     search_fields = ['user__username', 'resource_id', 'ip_address']
     readonly_fields = ['created_at']
+    raw_id_fields = ['user', 'tenant']
     date_hierarchy = 'created_at'
     
     def has_add_permission(self, request):
@@ -139,7 +162,7 @@ class AuditLogAdmin(admin.ModelAdmin):
 # Admin/Support/Sales System Admin
 
 @admin.register(AccountStatus)
-class AccountStatusAdmin(admin.ModelAdmin):
+class AccountStatusAdmin(ScalableModelAdmin):
     list_display = ['name', 'description', 'is_active', 'color_code', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
@@ -147,11 +170,13 @@ class AccountStatusAdmin(admin.ModelAdmin):
 
 
 @admin.register(ClientAccount)
-class ClientAccountAdmin(admin.ModelAdmin):
+class ClientAccountAdmin(ScalableModelAdmin):
     list_display = ['business_name', 'account_type', 'status', 'sales_rep', 'monthly_revenue', 'created_at']
-    list_filter = ['account_type', 'status', 'sales_rep', 'created_at']
+    list_filter = ['account_type', 'status', ('sales_rep', AutocompleteFilter), 'created_at']
+    list_select_related = ['status', 'sales_rep__role']
     search_fields = ['business_name', 'primary_contact__username', 'primary_contact__email']
     readonly_fields = ['id', 'created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'primary_contact', 'sales_rep', 'created_by']
     
     fieldsets = [
         ('Basic Information', {
@@ -177,11 +202,15 @@ class ClientAccountAdmin(admin.ModelAdmin):
 
 
 @admin.register(SalesOpportunity)
-class SalesOpportunityAdmin(admin.ModelAdmin):
+class SalesOpportunityAdmin(ScalableModelAdmin):
     list_display = ['name', 'tenant', 'client_account', 'stage', 'probability', 'estimated_value', 'expected_close_date', 'sales_rep']
-    list_filter = ['stage', 'probability', 'tenant', 'sales_rep', 'expected_close_date', 'created_at']
+    list_filter = [
+        'stage', 'probability', ('tenant', AutocompleteFilter), ('sales_rep', AutocompleteFilter), 'created_at',
+    ]
+    list_select_related = ['tenant', 'client_account', 'sales_rep__role']
     search_fields = ['name', 'tenant__name', 'client_account__business_name', 'description']
     readonly_fields = ['id', 'created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'client_account', 'sales_rep', 'created_by']
     date_hierarchy = 'expected_close_date'
     
     fieldsets = [
@@ -212,14 +241,19 @@ class TicketCommentInline(admin.TabularInline):
     model = TicketComment
     extra = 0
     readonly_fields = ['created_at']
+    raw_id_fields = ['author']
 
 
 @admin.register(SupportTicket)
-class SupportTicketAdmin(admin.ModelAdmin):
+class SupportTicketAdmin(ScalableModelAdmin):
     list_display = ['ticket_number', 'subject', 'tenant', 'client_account', 'priority', 'status', 'assigned_to', 'created_at']
-    list_filter = ['status', 'priority', 'category', 'tenant', 'assigned_to', 'created_at']
+    list_filter = [
+        'status', 'priority', 'category', ('tenant', AutocompleteFilter), ('assigned_to', AutocompleteFilter),
+    ]
+    list_select_related = ['tenant', 'client_account', 'assigned_to__role']
     search_fields = ['ticket_number', 'subject', 'description', 'tenant__name', 'client_account__business_name']
     readonly_fields = ['id', 'ticket_number', 'created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'client_account', 'created_by', 'assigned_to']
     date_hierarchy = 'created_at'
     inlines = [TicketCommentInline]
     
@@ -251,19 +285,25 @@ class SupportTicketAdmin(admin.ModelAdmin):
 
 
 @admin.register(TicketComment)
-class TicketCommentAdmin(admin.ModelAdmin):
+class TicketCommentAdmin(ScalableModelAdmin):
     list_display = ['ticket', 'author', 'is_internal', 'created_at']
     list_filter = ['is_internal', 'created_at']
+    list_select_related = ['ticket', 'author__role']
     search_fields = ['ticket__ticket_number', 'comment', 'author__username']
     readonly_fields = ['id', 'created_at']
+    raw_id_fields = ['ticket', 'author']
 
 
 @admin.register(OnboardingTask)
-class OnboardingTaskAdmin(admin.ModelAdmin):
+class OnboardingTaskAdmin(ScalableModelAdmin):
     list_display = ['tenant', 'name', 'client_account', 'status', 'assigned_to', 'due_date', 'order']
-    list_filter = ['status', 'tenant', 'assigned_to', 'due_date', 'created_at']
+    list_filter = [
+        'status', ('tenant', AutocompleteFilter), ('assigned_to', AutocompleteFilter), 'due_date', 'created_at',
+    ]
+    list_select_related = ['tenant', 'client_account', 'assigned_to__role']
     search_fields = ['name', 'tenant__name', 'client_account__business_name', 'description']
     readonly_fields = ['id', 'created_at', 'updated_at']
+    raw_id_fields = ['tenant', 'client_account', 'assigned_to']
     ordering = ['tenant', 'order']
     
     fieldsets = [
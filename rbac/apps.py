@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class RbacConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rbac'
+
+    def ready(self):
+        from .db_metrics import connect_signals
+        from . import cache_backends, impersonation_tokens, logo_renditions, navigation, nplusone, request_metrics
+        connect_signals()
+        cache_backends.connect_signals()
+        impersonation_tokens.connect_signals()
+        navigation.connect_signals()
+        logo_renditions.connect_signals()
+        request_metrics.connect_signals()
+        nplusone.connect_signals()
@@ -0,0 +1,44 @@
+"""
+Single-thread executors for work started by a request but not awaited by it
+(logo renditions, client imports)
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundExecutor:
+    """
+    One worker thread, created on first use so a gunicorn master never starts
+    a thread its workers would lose. Jobs log their failures and close the
+    database connections they opened.
+    """
+
+    def __init__(self, thread_name_prefix):
+        self.thread_name_prefix = thread_name_prefix
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.thread_name_prefix)
+            return self._executor
+
+    def submit(self, failure_message, func, *args):
+        """Run func(*args) on the worker thread; an exception is logged as '<failure_message>: <error>'"""
+        return self.get_executor().submit(self.run, failure_message, func, args)
+
+    @staticmethod
+    def run(failure_message, func, args):
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.error(f"{failure_message}: {e}")
+        finally:
+            # Connections opened by this thread
+            connections.close_all()
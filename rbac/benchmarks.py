@@ -0,0 +1,341 @@
+"""
+View benchmarks against a seeded large tenant
+
+seed_tenant() fills a tenant with deterministic, realistically shaped data
+(clients, trips with line items and itineraries, invoices with line items and
+payments, support tickets and audit history), written with COPY on PostgreSQL.
+run_benchmarks() drives the key views through the test client as the tenant's
+admin and a helpdesk user, recording latency percentiles and query counts;
+compare() checks the results against a stored baseline.
+"""
+import contextlib
+import datetime
+import json
+import logging
+import os
+import random
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.test import Client as TestClient
+from django.urls import reverse
+from django.utils import timezone
+
+from business_management.models import (
+    Client, Invoice, InvoiceLineItem, Payment, Trip, TripItinerary, TripLineItem,
+)
+from .models import AuditLog, Role, SupportTicket, Tenant
+from .tenant_backup import insert_rows
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+SCALES = {
+    'large': {'clients': 10000, 'trips': 50000, 'invoices': 100000, 'audit_rows': 1000000, 'tickets': 2000},
+    'medium': {'clients': 1000, 'trips': 5000, 'invoices': 10000, 'audit_rows': 100000, 'tickets': 200},
+    'small': {'clients': 50, 'trips': 250, 'invoices': 500, 'audit_rows': 5000, 'tickets': 20},
+}
+LINE_ITEMS_PER_TRIP = 2
+ITINERARY_DAYS_PER_TRIP = 3
+ADMIN_USERNAME = '{}-admin'
+HELPDESK_USERNAME = 'benchmark-helpdesk'
+
+FIRST_NAMES = ['Ada', 'Grace', 'Alan', 'Linus', 'Margaret', 'Ken', 'Barbara', 'Dennis', 'Frances', 'Edsger']
+LAST_NAMES = ['Lovelace', 'Hopper', 'Turing', 'Torvalds', 'Hamilton', 'Thompson', 'Liskov', 'Ritchie', 'Allen']
+CITIES = ['Paris', 'Lisbon', 'Austin', 'Kyoto', 'Cape Town', 'Reykjavik', 'Lima', 'Sydney']
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def choices(model, field_name):
+    return [value for value, _ in model._meta.get_field(field_name).choices]
+
+
+# ============================================================================
+# SEEDING
+# ============================================================================
+
+def insert(using, model, rows):
+    """Insert dicts of attname -> value; other columns get their field defaults"""
+    now = timezone.now()
+    fields = [field for field in model._meta.concrete_fields if not isinstance(field, models.AutoField)]
+    defaults = {}
+    for field in fields:
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            defaults[field.attname] = now
+        elif field.has_default():
+            defaults[field.attname] = field.get_default()
+        else:
+            defaults[field.attname] = None if field.null else ''
+    return insert_rows(using, model, fields, (
+        tuple(row[field.attname] if field.attname in row else defaults[field.attname] for field in fields)
+        for row in rows
+    ))
+
+
+def seed_tenant(subdomain, counts, seed=0, using=DEFAULT_DB_ALIAS, log=None):
+    """Create tenant `subdomain` filled with `counts` rows (see SCALES); returns the tenant"""
+    log = log or logger.info
+    if Tenant.objects.using(using).filter(subdomain=subdomain).exists():
+        raise BenchmarkError(f'Tenant "{subdomain}" already exists')
+    # Tenants seeded with the same seed still get their own ids
+    rng = random.Random(f'{subdomain}:{seed}')
+
+    def new_id():
+        return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+    today = timezone.localdate()
+    now = timezone.now()
+
+    def days_ago(days):
+        return now - datetime.timedelta(days=days, seconds=rng.randrange(86400))
+
+    with transaction.atomic(using=using):
+        admin_role = role(using, 'CLIENT_ADMIN', 'Agency administrator', 4)
+        helpdesk_role = role(using, 'HELPDESK_USER', 'Platform help desk', 3, is_system_role=True)
+        tenant = Tenant.objects.using(using).create(
+            name=f'Benchmark {subdomain}', subdomain=subdomain, contact_email=f'{subdomain}@example.com',
+            status='ACTIVE', tenant_type='CLIENT',
+        )
+        admin = user(using, ADMIN_USERNAME.format(subdomain), admin_role, tenant=tenant,
+                     is_tenant_admin=True, has_financial_access=True)
+        user(using, HELPDESK_USERNAME, helpdesk_role)
+
+        start = time.perf_counter()
+        client_ids = [new_id() for _ in range(counts['clients'])]
+        insert(using, Client, ({
+            'id': client_id, 'tenant_id': tenant.pk, 'created_by_id': admin.pk,
+            'first_name': rng.choice(FIRST_NAMES), 'last_name': f'{rng.choice(LAST_NAMES)} {n}',
+            'email': f'client{n}@example.com', 'phone': f'+1 555 {n:07d}', 'city': rng.choice(CITIES),
+            'vip_status': rng.choice(choices(Client, 'vip_status')),
+            'lead_source': rng.choice(choices(Client, 'lead_source')),
+            'created_at': days_ago(rng.randrange(1000)),
+        } for n, client_id in enumerate(client_ids)))
+        log(f'clients: {len(client_ids)} ({time.perf_counter() - start:.1f}s)')
+
+        start = time.perf_counter()
+        trips = [(new_id(), rng.choice(client_ids)) for _ in range(counts['trips'])]
+        departures = {trip_id: today + datetime.timedelta(days=rng.randrange(-365, 365)) for trip_id, _ in trips}
+        insert(using, Trip, ({
+            'id': trip_id, 'client_id': client_id, 'created_by_id': admin.pk,
+            'trip_name': f'{rng.choice(CITIES)} trip {n}', 'trip_type': rng.choice(choices(Trip, 'trip_type')),
+            'status': rng.choice(choices(Trip, 'status')), 'departure_date': departures[trip_id],
+            'return_date': departures[trip_id] + datetime.timedelta(days=ITINERARY_DAYS_PER_TRIP),
+            'destination': rng.choice(CITIES), 'total_amount': Decimal(rng.randrange(50000, 1500000)) / 100,
+            'number_of_travelers': rng.randrange(1, 6), 'created_at': days_ago(rng.randrange(1000)),
+        } for n, (trip_id, client_id) in enumerate(trips)))
+        insert(using, TripLineItem, ({
+            'id': new_id(), 'trip_id': trip_id, 'item_type': rng.choice(choices(TripLineItem, 'item_type')),
+            'description': f'Booking {n}', 'unit_price': Decimal(rng.randrange(10000, 500000)) / 100,
+            'total_price': Decimal(rng.randrange(10000, 500000)) / 100, 'service_date': departures[trip_id],
+        } for trip_id, _ in trips for n in range(LINE_ITEMS_PER_TRIP)))
+        insert(using, TripItinerary, ({
+            'id': new_id(), 'trip_id': trip_id, 'day_number': day + 1,
+            'date': departures[trip_id] + datetime.timedelta(days=day), 'title': f'Day {day + 1}',
+            'location': rng.choice(CITIES), 'description': 'Guided tour, free afternoon',
+        } for trip_id, _ in trips for day in range(ITINERARY_DAYS_PER_TRIP)))
+        log(f'trips: {len(trips)} with {LINE_ITEMS_PER_TRIP} line items and '
+            f'{ITINERARY_DAYS_PER_TRIP} itinerary days each ({time.perf_counter() - start:.1f}s)')
+
+        start = time.perf_counter()
+        invoice_statuses = choices(Invoice, 'status')
+        invoices = []
+        for n in range(counts['invoices']):
+            trip_id, client_id = trips[rng.randrange(len(trips))]
+            total = Decimal(rng.randrange(10000, 1000000)) / 100
+            invoices.append((new_id(), client_id, trip_id, total, rng.choice(invoice_statuses)))
+        insert(using, Invoice, ({
+            'id': invoice_id, 'client_id': client_id, 'trip_id': trip_id, 'created_by_id': admin.pk,
+            'invoice_number': f'{subdomain.upper()}-{n:07d}', 'status': status, 'subtotal': total,
+            'total_amount': total, 'paid_amount': total if status == 'PAID' else 0,
+            'invoice_date': today - datetime.timedelta(days=rng.randrange(365)),
+            'due_date': today + datetime.timedelta(days=rng.randrange(-60, 60)),
+            'created_at': days_ago(rng.randrange(365)),
+        } for n, (invoice_id, client_id, trip_id, total, status) in enumerate(invoices)))
+        insert(using, InvoiceLineItem, ({
+            'id': new_id(), 'invoice_id': invoice_id, 'description': 'Travel package',
+            'unit_price': min(total, Decimal('999999.99')), 'total_price': total,
+        } for invoice_id, _, _, total, _ in invoices))
+        insert(using, Payment, ({
+            'id': new_id(), 'invoice_id': invoice_id, 'recorded_by_id': admin.pk, 'amount': total,
+            'payment_method': rng.choice(choices(Payment, 'payment_method')),
+            'payment_date': today - datetime.timedelta(days=rng.randrange(365)),
+        } for invoice_id, _, _, total, status in invoices if status == 'PAID'))
+        log(f'invoices: {len(invoices)} with line items and payments ({time.perf_counter() - start:.1f}s)')
+
+        start = time.perf_counter()
+        insert(using, SupportTicket, ({
+            'id': new_id(), 'ticket_number': f'BM-{n:06d}-{subdomain[:10]}', 'subject': f'Question {n}',
+            'description': 'Benchmark ticket', 'tenant_id': tenant.pk, 'created_by_id': admin.pk,
+            'created_for_id': admin.pk, 'priority': rng.choice(choices(SupportTicket, 'priority')),
+            'status': rng.choice(choices(SupportTicket, 'status')),
+            'category': rng.choice(choices(SupportTicket, 'category')), 'created_at': days_ago(rng.randrange(365)),
+        } for n in range(counts['tickets'])))
+        actions = choices(AuditLog, 'action')
+        insert(using, AuditLog, ({
+            'user_id': admin.pk, 'tenant_id': tenant.pk, 'action': rng.choice(actions),
+            'resource_type': 'Client', 'resource_id': str(rng.choice(client_ids)), 'details': {},
+            'ip_address': '10.0.0.1', 'created_at': days_ago(rng.randrange(365)),
+        } for _ in range(counts['audit_rows'])))
+        log(f'tickets: {counts["tickets"]}, audit rows: {counts["audit_rows"]} ({time.perf_counter() - start:.1f}s)')
+
+    if connections[using].vendor == 'postgresql':
+        with connections[using].cursor() as cursor:
+            cursor.execute('ANALYZE')
+    return tenant
+
+
+def role(using, name, description, hierarchy_level, is_system_role=False):
+    return Role.objects.using(using).get_or_create(name=name, defaults={
+        'description': description, 'hierarchy_level': hierarchy_level, 'is_system_role': is_system_role,
+    })[0]
+
+
+def user(using, username, user_role, **fields):
+    account = User.objects.db_manager(using).filter(username=username).first()
+    if account is None:
+        account = User(username=username, email=f'{username}@example.com', role=user_role, **fields)
+        # Benchmarks log in with force_login
+        account.set_unusable_password()
+        account.save(using=using)
+    return account
+
+
+# ============================================================================
+# RUNNING
+# ============================================================================
+
+def scenarios(tenant, using=DEFAULT_DB_ALIAS):
+    """[(name, username, path)] of the benchmarked requests"""
+    clients = Client.objects.using(using).filter(tenant=tenant)
+    busiest_client = clients.annotate(n=models.Count('trips')).order_by('-n', 'pk').first()
+    busiest_trip = Trip.objects.using(using).filter(client__tenant=tenant).annotate(
+        n=models.Count('line_items')).order_by('-n', 'pk').first()
+    if busiest_client is None or busiest_trip is None:
+        raise BenchmarkError(f'Tenant "{tenant.subdomain}" has no clients or trips; seed it first')
+    admin = ADMIN_USERNAME.format(tenant.subdomain)
+    client_list = reverse('client_list')
+    return [
+        ('crm_dashboard', admin, reverse('crm_dashboard')),
+        ('client_list', admin, client_list),
+        ('client_list_search', admin, f'{client_list}?search=Hopper'),
+        # Out-of-range pages show the last one
+        ('client_list_last_page', admin, f'{client_list}?page=1000000'),
+        ('trip_list', admin, reverse('trip_list')),
+        ('invoice_list', admin, reverse('invoice_list')),
+        ('client_detail', admin, reverse('client_detail', args=[busiest_client.pk])),
+        ('trip_detail', admin, reverse('trip_detail', args=[busiest_trip.pk])),
+        ('dashboard', admin, reverse('dashboard')),
+        ('helpdesk_dashboard', HELPDESK_USERNAME, reverse('dashboard')),
+    ]
+
+
+@contextlib.contextmanager
+def count_queries():
+    """Count queries on every connection of this thread; yields a one-item list"""
+    counter = [0]
+
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield counter
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_scenario(client, path, iterations, warmup):
+    for _ in range(warmup):
+        client.get(path)
+    timings, queries = [], []
+    for _ in range(iterations):
+        with count_queries() as counter:
+            start = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise BenchmarkError(f'{path} returned {response.status_code}')
+        queries.append(counter[0])
+    ordered = sorted(timings)
+    return {
+        'p50_ms': round(statistics.median(ordered), 2),
+        'p95_ms': round(percentile(ordered, 0.95), 2),
+        'p99_ms': round(percentile(ordered, 0.99), 2),
+        'mean_ms': round(statistics.fmean(ordered), 2),
+        'queries': max(queries),
+    }
+
+
+def run_benchmarks(tenant, iterations=20, warmup=2, only=None, using=DEFAULT_DB_ALIAS, log=None):
+    """{scenario: {p50_ms, p95_ms, p99_ms, mean_ms, queries}}; call within setup_test_environment()"""
+    log = log or logger.info
+    clients = {}
+    results = {}
+    for name, username, path in scenarios(tenant, using):
+        if only and name not in only:
+            continue
+        if username not in clients:
+            clients[username] = TestClient()
+            clients[username].force_login(User.objects.db_manager(using).get(username=username))
+        results[name] = result = run_scenario(clients[username], path, iterations, warmup)
+        log(f'{name}: p50={result["p50_ms"]}ms p95={result["p95_ms"]}ms '
+            f'p99={result["p99_ms"]}ms queries={result["queries"]}')
+    return results
+
+
+# ============================================================================
+# BASELINES
+# ============================================================================
+
+def save_baseline(path, results, tenant, using=DEFAULT_DB_ALIAS):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({
+            'created_at': timezone.now().isoformat(),
+            'database': connections[using].vendor,
+            'tenant': tenant.subdomain,
+            'rows': {
+                'clients': Client.objects.using(using).filter(tenant=tenant).count(),
+                'audit_rows': AuditLog.objects.using(using).filter(tenant=tenant).count(),
+            },
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise BenchmarkError(f'No baseline at {path}; record one with --save-baseline')
+
+
+def compare(results, baseline, latency_threshold=25, min_delta_ms=5, query_threshold=0):
+    """
+    [(scenario, message)] for every regression: p50 or p95 slower by more than
+    latency_threshold percent and min_delta_ms, or more than query_threshold
+    extra queries. Scenarios missing from the baseline are skipped.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            delta = result[key] - base[key]
+            if delta > min_delta_ms and delta > base[key] * latency_threshold / 100:
+                regressions.append((name, f'{key} {base[key]}ms -> {result[key]}ms (+{delta:.1f}ms)'))
+        if result['queries'] > base['queries'] + query_threshold:
+            regressions.append((name, f'queries {base["queries"]} -> {result["queries"]}'))
+    return regressions
@@ -0,0 +1,187 @@
+"""
+Two-tier cache: a bounded per-process LRU in front of the shared cache (Redis or
+the database cache), plus version-stamped keys for tenant-level invalidation
+"""
+import functools
+import logging
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+from .request_metrics import cache_queries, record_cache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+TENANT_VERSION_KEY = 'tenant:{}:cache_version'
+
+
+class CacheTraffic:
+    """A cache backend whose calls run in cache_queries(), so a DatabaseCache's queries stay out of query budgets"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        attribute = getattr(self.backend, name)
+        if not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            with cache_queries():
+                return attribute(*args, **kwargs)
+        return call
+
+
+class TieredCache(BaseCache):
+    """
+    Reads are served from process memory when possible and fall through to the
+    shared cache (LOCATION names its alias); writes go to both. Entries live
+    locally for at most OPTIONS['LOCAL_TIMEOUT'] seconds, which bounds how long
+    another worker's write or delete can go unseen. Misses are never cached
+    locally.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.remote_alias = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.local = LocMemCache(f'tiered:{location}', {
+            'TIMEOUT': self.local_timeout,
+            'OPTIONS': {'MAX_ENTRIES': options.get('LOCAL_MAX_ENTRIES', 1000)},
+        })
+
+    @property
+    def remote(self):
+        return CacheTraffic(caches[self.remote_alias])
+
+    def get_local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self.local.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            record_cache(1, 0)
+            return value
+        value = self.remote.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        self.local.set(key, value, self.local_timeout, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self.local.get_many(keys, version=version)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            remote_found = self.remote.get_many(missing, version=version)
+            if remote_found:
+                self.local.set_many(remote_found, self.local_timeout, version=version)
+            found.update(remote_found)
+        record_cache(len(found), len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.remote.set(key, value, timeout, version=version)
+        self.set_local(key, value, timeout, version)
+
+    def set_local(self, key, value, timeout, version):
+        local_timeout = self.get_local_timeout(timeout)
+        if local_timeout > 0:
+            self.local.set(key, value, local_timeout, version=version)
+        else:
+            self.local.delete(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.remote.add(key, value, timeout, version=version)
+        if added:
+            self.set_local(key, value, timeout, version)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.remote.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key in failed:
+                self.local.delete(key, version=version)
+            else:
+                self.set_local(key, value, timeout, version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(key, version=version)
+        return self.remote.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version=version)
+        return self.remote.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(key, version=version)
+        self.remote.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.local.has_key(key, version=version) or self.remote.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(key, version=version)
+        return self.remote.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self.local.delete(key, version=version)
+        return self.remote.decr(key, delta, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.remote.clear()
+
+    def close(self, **kwargs):
+        self.remote.close(**kwargs)
+
+
+def shared_cache_alias(alias='default'):
+    """The cache every worker sees: the alias behind a TieredCache, else the alias itself"""
+    backend = caches[alias]
+    return backend.remote_alias if isinstance(backend, TieredCache) else alias
+
+
+def tenant_cache_version(tenant_id):
+    version = cache.get(TENANT_VERSION_KEY.format(tenant_id))
+    if version is None:
+        cache.add(TENANT_VERSION_KEY.format(tenant_id), 1, timeout=None)
+        version = 1
+    return version
+
+
+def tenant_cache_key(tenant_id, key):
+    """Cache key scoped to a tenant; invalidate_tenant_cache() orphans every such key at once"""
+    return f'tenant:{tenant_id}:v{tenant_cache_version(tenant_id)}:{key}'
+
+
+def invalidate_tenant_cache(tenant_id):
+    """Move the tenant to a new key version; old entries expire on their own"""
+    try:
+        return cache.incr(TENANT_VERSION_KEY.format(tenant_id))
+    except ValueError:
+        cache.set(TENANT_VERSION_KEY.format(tenant_id), 2, timeout=None)
+        return 2
+
+
+def _on_tenant_changed(sender, instance, **kwargs):
+    try:
+        invalidate_tenant_cache(instance.pk)
+    except Exception as e:
+        logger.error(f"Failed to invalidate cache for tenant {instance.pk}: {e}")
+
+
+def connect_signals():
+    from django.db.models.signals import post_save, post_delete
+    from .models import Tenant
+    post_save.connect(_on_tenant_changed, sender=Tenant, dispatch_uid='tenant_cache_saved')
+    post_delete.connect(_on_tenant_changed, sender=Tenant, dispatch_uid='tenant_cache_deleted')
@@ -0,0 +1,232 @@
+"""
+Copy every table of one database into another (e.g. SQLite to PostgreSQL)
+
+Tables are read in primary key order, a chunk at a time, and written with
+COPY FROM STDIN on PostgreSQL (batched INSERTs elsewhere). Each chunk is
+committed together with its checkpoint row in the target, so an interrupted
+copy resumes after the last committed chunk without duplicating rows. Tables
+run in parallel worker processes once every table they reference is done,
+which keeps the deferred foreign key checks of each chunk satisfied.
+
+Verification compares row counts and an order-independent checksum of every
+row (the sum of per-row hashes), so collation differences between the two
+databases don't matter.
+"""
+import hashlib
+import json
+import time
+from collections import namedtuple
+
+import dj_database_url
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+from .tenant_backup import insert_rows, json_default
+
+CHECKPOINT_TABLE = 'data_copy_checkpoints'
+CHUNK_SIZE = 10000
+CHECKSUM_MODULUS = 2 ** 128
+
+# Filled in by `migrate` on the target; replaced by the source's rows
+POST_MIGRATE_TABLES = {'django_content_type', 'auth_permission'}
+
+TableResult = namedtuple('TableResult', 'label rows seconds')
+TableCheck = namedtuple('TableCheck', 'label source_rows target_rows source_checksum target_checksum')
+
+
+def add_database(alias, url):
+    """Register a database URL as a connection alias in this process"""
+    if alias in connections.settings:
+        return alias
+    config = dj_database_url.parse(url)
+    for key, default in (
+        ('ATOMIC_REQUESTS', False), ('AUTOCOMMIT', True), ('CONN_MAX_AGE', 0),
+        ('CONN_HEALTH_CHECKS', False), ('OPTIONS', {}), ('TIME_ZONE', None), ('TEST', {}),
+    ):
+        config.setdefault(key, default)
+    settings.DATABASES[alias] = config
+    connections.settings[alias] = config
+    return alias
+
+
+def copied_models(source):
+    """Every concrete table (including many-to-many tables) present in the source"""
+    tables = set(connections[source].introspection.table_names())
+    return [
+        model for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy and model._meta.db_table in tables
+    ]
+
+
+def dependencies(models):
+    """model -> the other copied models it has foreign keys to"""
+    selected = set(models)
+    return {
+        model: {field.related_model for field in model._meta.concrete_fields
+                if field.is_relation and field.related_model in selected} - {model}
+        for model in models
+    }
+
+
+# ============================================================================
+# CHECKPOINTS (kept in the target database)
+# ============================================================================
+
+def ensure_checkpoint_table(target):
+    connection = connections[target]
+    if CHECKPOINT_TABLE in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {CHECKPOINT_TABLE} ('
+            'table_name varchar(255) PRIMARY KEY, last_pk text, rows bigint NOT NULL, '
+            'done boolean NOT NULL, seconds double precision NOT NULL)'
+        )
+
+
+def drop_checkpoint_table(target):
+    connection = connections[target]
+    if CHECKPOINT_TABLE in connection.introspection.table_names():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {CHECKPOINT_TABLE}')
+
+
+def read_checkpoints(target):
+    """table -> (last pk as JSON, rows, done, seconds)"""
+    with connections[target].cursor() as cursor:
+        cursor.execute(f'SELECT table_name, last_pk, rows, done, seconds FROM {CHECKPOINT_TABLE}')
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def save_checkpoint(target, table, last_pk, rows, done, seconds):
+    with connections[target].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {CHECKPOINT_TABLE} WHERE table_name = %s', [table])
+        cursor.execute(
+            f'INSERT INTO {CHECKPOINT_TABLE} (table_name, last_pk, rows, done, seconds) VALUES (%s, %s, %s, %s, %s)',
+            [table, json.dumps(last_pk, default=json_default), rows, done, seconds],
+        )
+
+
+# ============================================================================
+# TARGET PREPARATION
+# ============================================================================
+
+def tables_with_rows(alias, models):
+    tables = []
+    with connections[alias].cursor() as cursor:
+        for model in models:
+            cursor.execute(f'SELECT 1 FROM {connections[alias].ops.quote_name(model._meta.db_table)} LIMIT 1')
+            if cursor.fetchone():
+                tables.append(model._meta.db_table)
+    return tables
+
+
+def empty_tables(alias, models):
+    """Delete every row of the tables (TRUNCATE on PostgreSQL), children first"""
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'TRUNCATE {", ".join(quote(m._meta.db_table) for m in models)} CASCADE')
+            return
+        for model in reversed(ordered(models)):
+            cursor.execute(f'DELETE FROM {quote(model._meta.db_table)}')
+
+
+def ordered(models):
+    """Models with every model they reference before them (cycles in any order)"""
+    deps = dependencies(models)
+    result, done = [], set()
+    while len(result) < len(models):
+        ready = [m for m in models if m not in done and deps[m] <= done] or \
+                [m for m in models if m not in done][:1]
+        for model in ready:
+            result.append(model)
+            done.add(model)
+    return result
+
+
+def reset_sequences(alias, models):
+    connection = connections[alias]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+def init_worker(databases):
+    """Process pool initializer: set up Django and the URL aliases in the worker"""
+    django.setup()
+    for alias, url in databases.items():
+        add_database(alias, url)
+
+
+def copy_table(label, source, target, chunk_size=CHUNK_SIZE):
+    """Copy one table from its checkpoint onwards; returns a TableResult"""
+    model = apps.get_model(label)
+    table = model._meta.db_table
+    fields = list(model._meta.concrete_fields)
+    pk_index = fields.index(model._meta.pk)
+    last_pk, rows, done, seconds = read_checkpoints(target).get(table, (None, 0, False, 0.0))
+    if done:
+        return TableResult(label, rows, seconds)
+    last_pk = model._meta.pk.to_python(json.loads(last_pk)) if last_pk else None
+
+    start = time.perf_counter() - seconds
+    queryset = model._base_manager.using(source).order_by('pk').values_list(*[f.attname for f in fields])
+    try:
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(page[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1][pk_index]
+            rows += len(chunk)
+            # The chunk and its checkpoint commit together
+            with transaction.atomic(using=target):
+                insert_rows(target, model, fields, chunk, batch_size=chunk_size)
+                save_checkpoint(target, table, last_pk, rows, False, time.perf_counter() - start)
+        seconds = time.perf_counter() - start
+        with transaction.atomic(using=target):
+            save_checkpoint(target, table, last_pk, rows, True, seconds)
+    finally:
+        connections.close_all()
+    return TableResult(label, rows, seconds)
+
+
+def table_checksum(model, alias, chunk_size=CHUNK_SIZE):
+    """(row count, sum of per-row hashes) of a table"""
+    fields = [f.attname for f in model._meta.concrete_fields]
+    queryset = model._base_manager.using(alias).order_by('pk').values_list(*fields)
+    pk_index = fields.index(model._meta.pk.attname)
+    count = total = 0
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return count, total
+        for row in chunk:
+            encoded = json.dumps(row, default=json_default, sort_keys=True, separators=(',', ':'))
+            total = (total + int.from_bytes(hashlib.blake2b(encoded.encode(), digest_size=16).digest(), 'big')) \
+                % CHECKSUM_MODULUS
+        count += len(chunk)
+        last_pk = chunk[-1][pk_index]
+
+
+def verify_table(label, source, target, chunk_size=CHUNK_SIZE):
+    model = apps.get_model(label)
+    try:
+        source_rows, source_checksum = table_checksum(model, source, chunk_size)
+        target_rows, target_checksum = table_checksum(model, target, chunk_size)
+    finally:
+        connections.close_all()
+    return TableCheck(label, source_rows, target_rows, source_checksum, target_checksum)
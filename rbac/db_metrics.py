@@ -0,0 +1,62 @@
+"""
+In-process database connection metrics (connections opened vs requests served)
+"""
+import threading
+import time
+
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+
+_lock = threading.Lock()
+_stats = {
+    'connections_opened': {},
+    'requests_finished': 0,
+    'started_at': time.time(),
+}
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    with _lock:
+        opened = _stats['connections_opened']
+        opened[connection.alias] = opened.get(connection.alias, 0) + 1
+
+
+def _on_request_finished(sender, **kwargs):
+    with _lock:
+        _stats['requests_finished'] += 1
+
+
+def connect_signals():
+    connection_created.connect(_on_connection_created, dispatch_uid='rbac_db_metrics_connection')
+    request_finished.connect(_on_request_finished, dispatch_uid='rbac_db_metrics_request')
+
+
+def get_connection_stats():
+    """Snapshot of connection usage for this worker process"""
+    from django.db import connections
+    
+    with _lock:
+        opened = dict(_stats['connections_opened'])
+        requests = _stats['requests_finished']
+        started_at = _stats['started_at']
+    
+    aliases = {}
+    for alias in connections:
+        conn_settings = connections.settings[alias]
+        opened_count = opened.get(alias, 0)
+        aliases[alias] = {
+            'connections_opened': opened_count,
+            'conn_max_age': conn_settings.get('CONN_MAX_AGE', 0),
+            'health_checks': conn_settings.get('CONN_HEALTH_CHECKS', False),
+            'server_side_cursors': not conn_settings.get('DISABLE_SERVER_SIDE_CURSORS', False),
+        }
+    
+    total_opened = sum(opened.values())
+    return {
+        'uptime_seconds': round(time.time() - started_at, 1),
+        'requests_finished': requests,
+        'connections_opened': total_opened,
+        # ~1.0 means a new connection per request; close to 0 means connections are reused
+        'connections_per_request': round(total_opened / requests, 3) if requests else None,
+        'aliases': aliases,
+    }
@@ -0,0 +1,157 @@
+"""
+Database routers for tenant placement and read replicas
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from .tenant_context import get_current_database
+
+logger = logging.getLogger(__name__)
+
+# Apps whose tables are tenant-owned and may live in a dedicated schema/database
+TENANT_APPS = {'business_management'}
+
+
+class TenantDatabaseRouter:
+    """
+    Route CRM models to the schema/database alias of the tenant bound to the
+    current request (see Tenant.database_alias and TENANT_DATABASES).
+
+    Schema aliases share the primary server and only hold the CRM tables;
+    rbac/auth tables are reached through the public schema on the search_path.
+    Database aliases are standalone and receive every app's tables.
+    Tenants in the shared database fall through to the next router.
+    """
+    
+    def _tenant_db(self, model, hints):
+        if model._meta.app_label not in TENANT_APPS:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in getattr(settings, 'TENANT_DATABASE_ALIASES', ()):
+            return instance._state.db
+        alias = get_current_database()
+        return alias if alias != DEFAULT_DB_ALIAS else None
+    
+    def db_for_read(self, model, **hints):
+        return self._tenant_db(model, hints)
+    
+    def db_for_write(self, model, **hints):
+        return self._tenant_db(model, hints)
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Tenant rows reference shared rbac rows (tenant, users) across aliases
+        if obj1._meta.app_label in TENANT_APPS or obj2._meta.app_label in TENANT_APPS:
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in getattr(settings, 'TENANT_DATABASE_ALIASES', ()):
+            return None
+        if settings.DATABASES[db].get('TENANT_SCHEMA'):
+            return app_label in TENANT_APPS
+        return True
+
+
+# Per-request replica state set by rbac.middleware.ReplicaRoutingMiddleware:
+# {'allow': bool, 'wrote': bool}. None outside requests (always primary).
+_replica_state = contextvars.ContextVar('replica_state', default=None)
+
+# alias -> (healthy, checked_at)
+_replica_health = {}
+_replica_health_lock = threading.Lock()
+
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def begin_replica_reads(allow):
+    """Start routing state for a request; returns a token for end_replica_reads"""
+    return _replica_state.set({'allow': allow, 'wrote': False})
+
+
+def end_replica_reads(token):
+    """Finish the request; returns True if it wrote to the primary"""
+    state = _replica_state.get()
+    _replica_state.reset(token)
+    return bool(state and state['wrote'])
+
+
+def replica_is_healthy(alias):
+    """Check (and cache briefly) whether a replica's lag is within REPLICA_MAX_LAG_SECONDS"""
+    interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5)
+    healthy, checked_at = _replica_health.get(alias, (True, 0.0))
+    if time.monotonic() - checked_at < interval:
+        return healthy
+    
+    with _replica_health_lock:
+        healthy, checked_at = _replica_health.get(alias, (True, 0.0))
+        if time.monotonic() - checked_at < interval:
+            return healthy
+        try:
+            connection = connections[alias]
+            if connection.vendor != 'postgresql':
+                healthy = True
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute(REPLICA_LAG_SQL)
+                    lag = float(cursor.fetchone()[0])
+                healthy = lag <= getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5)
+                if not healthy:
+                    logger.warning(f"Replica {alias} lagging {lag:.1f}s - reading from primary")
+        except Exception as e:
+            logger.error(f"Replica {alias} health check failed: {e}")
+            healthy = False
+        _replica_health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+class ReplicaRouter:
+    """
+    Send reads from read-only requests (GET/HEAD) to a healthy replica from
+    DATABASE_REPLICA_URLS. Reads stay on the primary once the request has
+    written, inside transactions on the primary (e.g. RLS-scoped requests),
+    and for sessions pinned after a recent write (read-your-writes).
+    """
+    
+    def _replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', ())
+    
+    def db_for_read(self, model, **hints):
+        state = _replica_state.get()
+        if not state or not state['allow'] or state['wrote']:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        healthy = [alias for alias in self._replicas() if replica_is_healthy(alias)]
+        return random.choice(healthy) if healthy else None
+    
+    def db_for_write(self, model, **hints):
+        state = _replica_state.get()
+        if state is not None:
+            state['wrote'] = True
+        # Objects loaded from a replica must be saved to the primary
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in self._replicas():
+            return DEFAULT_DB_ALIAS
+        return None
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        primary_group = {DEFAULT_DB_ALIAS, *self._replicas()}
+        if obj1._state.db in primary_group and obj2._state.db in primary_group:
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in self._replicas():
+            return False
+        return None
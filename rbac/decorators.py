@@ -0,0 +1,45 @@
+"""
+View decorators: login for async views, query budgets
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+
+def load_request_user(request):
+    """
+    Resolve request.user and the relations views read from it (tenant, role).
+
+    Must run in a sync context; afterwards async code can read
+    request.user.tenant and request.user.role without touching the database.
+    """
+    user = request.user
+    if user.is_authenticated:
+        user.tenant
+        user.role
+    return user
+
+
+def async_login_required(view_func):
+    """login_required for async views (Django 4.2's decorator only wraps sync views)"""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await sync_to_async(load_request_user)(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def query_budget(max_queries):
+    """
+    Declare the most queries a request to the view may run.
+
+    RequestMetricsMiddleware logs and counts requests over budget, and fails
+    them when QUERY_BUDGET_STRICT is set (as the test runner does).
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
@@ -12,7 +12,9 @@ from django.urls import reverse
 from rbac.models import Tenant, AuditLog
 from django.utils import timezone
 from .impersonation_tokens import ImpersonationTokenManager
+import logging
 
+logger = logging.getLogger(__name__)
 User = get_user_model()
 
 def can_impersonate(user, target_user):
@@ -107,12 +109,17 @@ def start_impersonation(request, user_id):
         return redirect('staff_client_management')
     
     # Create impersonation token
-    token = ImpersonationTokenManager.create_token(
-        original_user_id=request.user.id,
-        target_user_id=target_user.id,
-        original_username=request.user.username,
-        target_username=target_user.username
-    )
+    try:
+        token = ImpersonationTokenManager.create_token(
+            original_user_id=request.user.id,
+            target_user_id=target_user.id,
+            original_username=request.user.username,
+            target_username=target_user.username
+        )
+    except Exception as e:
+        logger.error(f"Failed to create impersonation token: {e}")
+        messages.error(request, "Impersonation is temporarily unavailable. Please try again.")
+        return redirect('staff_client_management')
     
     # Log the impersonation start
     AuditLog.objects.create(
@@ -125,7 +132,7 @@ def start_impersonation(request, user_id):
             'impersonated_user': target_user.username,
             'impersonated_role': target_user.role.name,
             'impersonated_tenant': target_user.tenant.name if target_user.tenant else 'System',
-            'token': token
+            'token_id': ImpersonationTokenManager.token_id(token)
         },
         ip_address=get_client_ip(request),
         user_agent=request.META.get('HTTP_USER_AGENT', '')
@@ -180,7 +187,7 @@ def stop_impersonation(request):
         details={
             'impersonated_user': token_data['target_username'],
             'duration_minutes': duration_minutes,
-            'token': impersonation_token
+            'token_id': ImpersonationTokenManager.token_id(impersonation_token)
         },
         ip_address=get_client_ip(request),
         user_agent=request.META.get('HTTP_USER_AGENT', '')
@@ -1,149 +1,539 @@
 """
 Token-based impersonation system for separate tab sessions
+
+IMPERSONATION_TOKEN_BACKEND selects how tokens are kept: 'stored' (below) or
+'signed' (stateless, see signed_impersonation_tokens.py). Callers only use
+ImpersonationTokenManager, whose API is the same for both.
+
+Stored tokens are only ever kept hashed. Each payload carries a snapshot of the
+target user (with role and tenant) so an impersonated request is served
+without database queries. Redis is used directly when it is the shared cache
+(sets for the per-user index, MGET for payload + identity version in one round
+trip); otherwise the Django cache holds the same keys. Decoded payloads are
+kept briefly in an in-process LRU, so revocation reaches other workers within
+IMPERSONATION_LOCAL_CACHE_SECONDS.
 """
-import secrets
+import hashlib
 import json
-from django.core.cache import cache
-from django.utils import timezone
-from datetime import timedelta
 import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
-class ImpersonationTokenManager:
-    """Manages impersonation tokens for separate tab sessions"""
-    
-    TOKEN_PREFIX = "imp_token:"
-    TOKEN_EXPIRY = timedelta(hours=8)  # 8 hour expiry for impersonation tokens
-    
+IDENTITY_EXCLUDED_FIELDS = {'password', 'backup_tokens'}
+TOKEN_PREFIX = 'imp'
+TOKEN_EXPIRY = timedelta(hours=8)  # 8 hour expiry for impersonation tokens
+# revoke_user_tokens() result of backends that cannot count the tokens they revoke
+REVOKED_COUNT_UNKNOWN = -1
+
+_store = None
+
+
+def get_token_store():
+    """Redis when it is the default cache, otherwise the Django cache"""
+    global _store
+    if _store is None:
+        # Tokens skip the per-process cache tier: revocations must be seen at once
+        from .cache_backends import shared_cache_alias
+        alias = shared_cache_alias()
+        cache_config = settings.CACHES[alias]
+        if cache_config.get('BACKEND', '').startswith('django_redis.'):
+            # Raw keys bypass the cache's key function, so namespace them the same way
+            prefix = cache_config.get('KEY_PREFIX')
+            _store = RedisTokenStore(f'{prefix}:{TOKEN_PREFIX}' if prefix else TOKEN_PREFIX, alias)
+        else:
+            _store = CacheTokenStore(TOKEN_PREFIX, alias)
+    return _store
+
+
+def token_id(token):
+    """Stable identifier for a token (what is stored, indexed and audit-logged)"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def local_cache_seconds():
+    return getattr(settings, 'IMPERSONATION_LOCAL_CACHE_SECONDS', 5)
+
+
+def snapshot_instance(instance):
+    """JSON-safe field values of a model instance (secrets left out)"""
+    data = {}
+    for field in instance._meta.concrete_fields:
+        if field.name in IDENTITY_EXCLUDED_FIELDS:
+            continue
+        value = field.value_from_object(instance)
+        data[field.attname] = None if value is None else field.value_to_string(instance)
+    return data
+
+
+def restore_instance(model, data):
+    """Rebuild a model instance from snapshot_instance() output without querying"""
+    names, values = [], []
+    for field in model._meta.concrete_fields:
+        if field.attname in data:
+            names.append(field.attname)
+            value = data[field.attname]
+            values.append(None if value is None else field.to_python(value))
+    # Fields missing from the snapshot (password) are deferred and load on access
+    return model.from_db(router.db_for_write(model), names, values)
+
+
+class LocalTokenCache:
+    """Small thread-safe LRU of decoded token payloads with a per-entry TTL"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if time.monotonic() > expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisTokenStore:
+    """Token keys straight in Redis, sharing the connection pool of the shared cache"""
+
+    def __init__(self, prefix, alias):
+        self.prefix = prefix
+        self.alias = alias
+
+    @property
+    def client(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.alias)
+
+    def key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get_many(self, keys):
+        values = self.client.mget([self.key(key) for key in keys])
+        return [value.decode() if isinstance(value, bytes) else value for value in values]
+
+    def set(self, key, value, ttl):
+        self.client.set(self.key(key), value, ex=max(1, int(ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.key(key) for key in keys])
+
+    def incr(self, key):
+        return self.client.incr(self.key(key))
+
+    def index_add(self, index, member, ttl):
+        pipe = self.client.pipeline()
+        pipe.sadd(self.key(index), member)
+        pipe.expire(self.key(index), max(1, int(ttl)))
+        pipe.execute()
+
+    def index_members(self, index):
+        return {member.decode() for member in self.client.smembers(self.key(index))}
+
+    def index_remove(self, index, *members):
+        if members:
+            self.client.srem(self.key(index), *members)
+
+    def get_bits(self, keys):
+        return self.client.mget([self.key(key) for key in keys])
+
+    def set_bits(self, key, positions, ttl):
+        pipe = self.client.pipeline()
+        for position in positions:
+            pipe.setbit(self.key(key), position, 1)
+        pipe.expire(self.key(key), max(1, int(ttl)))
+        pipe.execute()
+
+
+class CacheTokenStore:
+    """Fallback on the Django cache (DatabaseCache without Redis); the index is a JSON list"""
+
+    def __init__(self, prefix, alias):
+        self.prefix = prefix
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get_many(self, keys):
+        values = self.cache.get_many([self.key(key) for key in keys])
+        return [values.get(self.key(key)) for key in keys]
+
+    def set(self, key, value, ttl):
+        self.cache.set(self.key(key), value, timeout=max(1, int(ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self.cache.delete_many([self.key(key) for key in keys])
+
+    def incr(self, key):
+        try:
+            return self.cache.incr(self.key(key))
+        except ValueError:
+            self.cache.set(self.key(key), 1, timeout=None)
+            return 1
+
+    def index_add(self, index, member, ttl):
+        members = self.index_members(index)
+        members.add(member)
+        self.cache.set(self.key(index), json.dumps(sorted(members)), timeout=max(1, int(ttl)))
+
+    def index_members(self, index):
+        return set(json.loads(self.cache.get(self.key(index)) or '[]'))
+
+    def index_remove(self, index, *members):
+        remaining = self.index_members(index) - set(members)
+        if remaining:
+            self.cache.set(self.key(index), json.dumps(sorted(remaining)),
+                      timeout=int(TOKEN_EXPIRY.total_seconds()))
+        else:
+            self.cache.delete(self.key(index))
+
+    def get_bits(self, keys):
+        return self.get_many(keys)
+
+    def set_bits(self, key, positions, ttl):
+        # Read-modify-write: concurrent revocations may race, unlike Redis SETBIT
+        bits = bytearray(self.cache.get(self.key(key)) or b'')
+        for position in positions:
+            if len(bits) <= position // 8:
+                bits.extend(bytes(position // 8 + 1 - len(bits)))
+            bits[position // 8] |= 0x80 >> (position % 8)
+        self.cache.set(self.key(key), bytes(bits), timeout=max(1, int(ttl)))
+
+
+class StoredTokenBackend:
+    """Random tokens whose payloads live in Redis or the cache (the default backend)"""
+
+    TOKEN_EXPIRY = TOKEN_EXPIRY
+    IDENTITY_VERSION_KEY = 'identity_version'
+
+    _local = LocalTokenCache()
+
+    get_store = staticmethod(get_token_store)
+    token_id = staticmethod(token_id)
+    local_cache_seconds = staticmethod(local_cache_seconds)
+
     @classmethod
     def create_token(cls, original_user_id, target_user_id, original_username, target_username):
-        """Create a new impersonation token"""
-        try:
-            token = secrets.token_urlsafe(32)
-            
-            token_data = {
-                'original_user_id': str(original_user_id),
-                'target_user_id': str(target_user_id),
-                'original_username': original_username,
-                'target_username': target_username,
-                'created_at': timezone.now().isoformat(),
-                'expires_at': (timezone.now() + cls.TOKEN_EXPIRY).isoformat(),
-            }
-            
-            # Store in cache with expiry
-            cache_key = f"{cls.TOKEN_PREFIX}{token}"
-            cache.set(cache_key, json.dumps(token_data), timeout=int(cls.TOKEN_EXPIRY.total_seconds()))
-            
-            logger.info(f"Created impersonation token for {original_username} -> {target_username}")
-            return token
-        except Exception as e:
-            logger.error(f"Failed to create impersonation token: {e}")
-            # Fallback: use a simple in-memory store (not ideal but prevents 500 error)
-            return cls._create_fallback_token(original_user_id, target_user_id, original_username, target_username)
-    
+        """Create a new impersonation token; the raw token is returned and never stored"""
+        token = secrets.token_urlsafe(32)
+        token_id = cls.token_id(token)
+        now = timezone.now()
+        ttl = int(cls.TOKEN_EXPIRY.total_seconds())
+
+        token_data = {
+            'original_user_id': str(original_user_id),
+            'target_user_id': str(target_user_id),
+            'original_username': original_username,
+            'target_username': target_username,
+            'created_at': now.isoformat(),
+            'expires_at': (now + cls.TOKEN_EXPIRY).isoformat(),
+        }
+
+        store = cls.get_store()
+        store.set(f'token:{token_id}', json.dumps(token_data), ttl)
+        store.index_add(f'user:{original_user_id}', token_id, ttl)
+        store.index_add(f'user:{target_user_id}', token_id, ttl)
+
+        logger.info(f"Created impersonation token {token_id[:12]} for {original_username} -> {target_username}")
+        return token
+
     @classmethod
     def get_token_data(cls, token):
         """Get impersonation data for a token"""
         if not token:
             return None
-            
+
+        token_id = cls.token_id(token)
+        token_data = cls._local.get(token_id)
+        if token_data is not None:
+            return dict(token_data)
+
         try:
-            cache_key = f"{cls.TOKEN_PREFIX}{token}"
-            data = cache.get(cache_key)
-            
-            if not data:
-                # Check fallback storage
-                return cls._get_fallback_token_data(token)
-                
-            try:
-                token_data = json.loads(data)
-                
-                # Check if token has expired
-                expires_at = timezone.datetime.fromisoformat(token_data['expires_at'])
-                if timezone.now() > expires_at:
-                    cls.invalidate_token(token)
-                    return None
-                    
-                return token_data
-            except (json.JSONDecodeError, KeyError, ValueError):
-                cls.invalidate_token(token)
-                return None
+            raw, version = cls.get_store().get_many([f'token:{token_id}', cls.IDENTITY_VERSION_KEY])
         except Exception as e:
             logger.error(f"Failed to get token data: {e}")
-            return cls._get_fallback_token_data(token)
-    
+            return None
+        if not raw:
+            return None
+
+        try:
+            token_data = json.loads(raw)
+            expires_at = timezone.datetime.fromisoformat(token_data['expires_at'])
+        except (json.JSONDecodeError, KeyError, ValueError):
+            cls.invalidate_token(token)
+            return None
+
+        # Check if token has expired
+        if timezone.now() > expires_at:
+            cls.invalidate_token(token)
+            return None
+
+        # A role or tenant changed since the identity was captured
+        identity = token_data.get('target')
+        if identity and identity.get('version') != int(version or 0):
+            del token_data['target']
+
+        token_data['token_id'] = token_id
+        token_data['identity_version'] = int(version or 0)
+        cls._local.set(token_id, token_data, cls.local_cache_seconds())
+        return dict(token_data)
+
+    @classmethod
+    def get_target_user(cls, token_data):
+        """
+        The impersonated user with role and tenant attached. Built from the
+        cached identity when it is current, otherwise loaded once and cached.
+        """
+        User = get_user_model()
+        identity = token_data.get('target')
+        if identity:
+            from .models import Role, Tenant
+            user = restore_instance(User, identity['user'])
+            user.role = restore_instance(Role, identity['role'])
+            user.tenant = restore_instance(Tenant, identity['tenant']) if identity['tenant'] else None
+            return user
+
+        user = User.objects.select_related('role', 'tenant').get(id=token_data['target_user_id'])
+        cls._store_identity(token_data, user)
+        return user
+
+    @classmethod
+    def _store_identity(cls, token_data, user):
+        token_id = token_data['token_id']
+        try:
+            # The version read before the user was loaded, so a concurrent
+            # role/tenant change leaves this identity stale rather than current
+            stored = {key: value for key, value in token_data.items()
+                      if key not in ('token_id', 'identity_version')}
+            stored['target'] = {
+                'version': token_data['identity_version'],
+                'user': snapshot_instance(user),
+                'role': snapshot_instance(user.role),
+                'tenant': snapshot_instance(user.tenant) if user.tenant_id else None,
+            }
+            remaining = timezone.datetime.fromisoformat(token_data['expires_at']) - timezone.now()
+            cls.get_store().set(f'token:{token_id}', json.dumps(stored), remaining.total_seconds())
+            cls._local.set(token_id, dict(token_data, target=stored['target']), cls.local_cache_seconds())
+        except Exception as e:
+            # The identity is only an optimisation - the next request loads it again
+            logger.warning(f"Could not cache impersonation identity: {e}")
+
     @classmethod
     def invalidate_token(cls, token):
         """Invalidate a token"""
         if not token:
             return
-            
-        cache_key = f"{cls.TOKEN_PREFIX}{token}"
-        cache.delete(cache_key)
-    
+        cls.revoke_token_ids([cls.token_id(token)])
+
+    @classmethod
+    def revoke_token_ids(cls, token_ids):
+        store = cls.get_store()
+        for token_id in token_ids:
+            cls._local.delete(token_id)
+        store.delete(*[f'token:{token_id}' for token_id in token_ids])
+
     @classmethod
     def extend_token(cls, token, additional_hours=2):
         """Extend a token's expiry time"""
         token_data = cls.get_token_data(token)
         if not token_data:
             return False
-            
+
         # Update expiry time
-        new_expiry = timezone.now() + timedelta(hours=additional_hours)
-        token_data['expires_at'] = new_expiry.isoformat()
-        
-        # Update cache
-        cache_key = f"{cls.TOKEN_PREFIX}{token}"
-        timeout = int(timedelta(hours=additional_hours).total_seconds())
-        cache.set(cache_key, json.dumps(token_data), timeout=timeout)
-        
+        token_id = token_data.pop('token_id')
+        token_data.pop('identity_version')
+        additional = timedelta(hours=additional_hours)
+        token_data['expires_at'] = (timezone.now() + additional).isoformat()
+
+        store = cls.get_store()
+        store.set(f'token:{token_id}', json.dumps(token_data), additional.total_seconds())
+        for user_id in (token_data['original_user_id'], token_data['target_user_id']):
+            store.index_add(f'user:{user_id}', token_id, max(additional, cls.TOKEN_EXPIRY).total_seconds())
+        cls._local.delete(token_id)
         return True
-    
+
     @classmethod
     def get_user_tokens(cls, user_id):
-        """Get all active tokens for a user (for cleanup purposes)"""
-        # This is a simplified version - in production you might want to store
-        # user-to-token mappings separately for better performance
-        pass
-    
-    # Fallback storage for when cache is unavailable (Railway deployment issue)
-    _fallback_tokens = {}
-    
-    @classmethod
-    def _create_fallback_token(cls, original_user_id, target_user_id, original_username, target_username):
-        """Create token using in-memory fallback storage"""
-        token = secrets.token_urlsafe(32)
-        
-        token_data = {
-            'original_user_id': str(original_user_id),
-            'target_user_id': str(target_user_id),
-            'original_username': original_username,
-            'target_username': target_username,
-            'created_at': timezone.now().isoformat(),
-            'expires_at': (timezone.now() + cls.TOKEN_EXPIRY).isoformat(),
-        }
-        
-        cls._fallback_tokens[token] = token_data
-        logger.warning(f"Using fallback token storage for {original_username} -> {target_username}")
-        return token
-    
+        """Active tokens where the user is the impersonator or the impersonated user"""
+        store = cls.get_store()
+        token_ids = sorted(store.index_members(f'user:{user_id}'))
+        if not token_ids:
+            return []
+
+        tokens, expired = [], []
+        for token_id, raw in zip(token_ids, store.get_many([f'token:{token_id}' for token_id in token_ids])):
+            if not raw:
+                expired.append(token_id)
+                continue
+            token_data = json.loads(raw)
+            token_data.pop('target', None)
+            token_data['token_id'] = token_id
+            tokens.append(token_data)
+
+        # Drop index entries whose tokens expired or were revoked
+        store.index_remove(f'user:{user_id}', *expired)
+        return tokens
+
     @classmethod
-    def _get_fallback_token_data(cls, token):
-        """Get token data from fallback storage"""
-        if not token or token not in cls._fallback_tokens:
-            return None
-            
-        token_data = cls._fallback_tokens[token]
-        
-        try:
-            # Check if token has expired
-            expires_at = timezone.datetime.fromisoformat(token_data['expires_at'])
-            if timezone.now() > expires_at:
-                cls._fallback_tokens.pop(token, None)
-                return None
-                
-            return token_data
-        except (KeyError, ValueError):
-            cls._fallback_tokens.pop(token, None)
-            return None
\ No newline at end of file
+    def revoke_user_tokens(cls, user_id):
+        """Revoke every token the user issued or is the target of; returns how many were active"""
+        store = cls.get_store()
+        token_ids = store.index_members(f'user:{user_id}')
+        active = len(cls.get_user_tokens(user_id))
+        cls.revoke_token_ids(token_ids)
+        store.delete(f'user:{user_id}')
+        if active:
+            logger.info(f"Revoked {active} impersonation tokens for user {user_id}")
+        return active
+
+    @classmethod
+    def forget_identity(cls, user_id):
+        """Drop cached identities of tokens targeting the user so the next request reloads them"""
+        store = cls.get_store()
+        for token_data in cls.get_user_tokens(user_id):
+            token_id = token_data.pop('token_id')
+            cls._local.delete(token_id)
+            if token_data['target_user_id'] != str(user_id):
+                continue
+            remaining = timezone.datetime.fromisoformat(token_data['expires_at']) - timezone.now()
+            if remaining.total_seconds() > 0:
+                store.set(f'token:{token_id}', json.dumps(token_data), remaining.total_seconds())
+
+    @classmethod
+    def bump_identity_version(cls):
+        """Invalidate every cached identity (a role or tenant they embed changed)"""
+        cls._local.clear()
+        cls.get_store().incr(cls.IDENTITY_VERSION_KEY)
+
+    @classmethod
+    def user_changed(cls, user_id, revoke):
+        if revoke:
+            cls.revoke_user_tokens(user_id)
+        else:
+            cls.forget_identity(user_id)
+
+    @classmethod
+    def identity_models_changed(cls):
+        cls.bump_identity_version()
+
+
+class ImpersonationTokenManager:
+    """Manages impersonation tokens for separate tab sessions"""
+
+    TOKEN_EXPIRY = TOKEN_EXPIRY
+    token_id = staticmethod(token_id)
+
+    @staticmethod
+    def get_backend():
+        if getattr(settings, 'IMPERSONATION_TOKEN_BACKEND', 'stored') == 'signed':
+            from .signed_impersonation_tokens import SignedTokenBackend
+            return SignedTokenBackend
+        return StoredTokenBackend
+
+    @classmethod
+    def create_token(cls, original_user_id, target_user_id, original_username, target_username):
+        """Create a new impersonation token"""
+        return cls.get_backend().create_token(original_user_id, target_user_id, original_username, target_username)
+
+    @classmethod
+    def get_token_data(cls, token):
+        """Get impersonation data for a token, or None if it is invalid, expired or revoked"""
+        return cls.get_backend().get_token_data(token)
+
+    @classmethod
+    def get_target_user(cls, token_data):
+        """The impersonated user (with role) for get_token_data() output"""
+        return cls.get_backend().get_target_user(token_data)
+
+    @classmethod
+    def invalidate_token(cls, token):
+        """Invalidate a token"""
+        return cls.get_backend().invalidate_token(token)
+
+    @classmethod
+    def extend_token(cls, token, additional_hours=2):
+        """Extend a token's expiry time; False if it can't be extended"""
+        return cls.get_backend().extend_token(token, additional_hours)
+
+    @classmethod
+    def get_user_tokens(cls, user_id):
+        """Active tokens where the user is the impersonator or the impersonated user"""
+        return cls.get_backend().get_user_tokens(user_id)
+
+    @classmethod
+    def revoke_user_tokens(cls, user_id):
+        """
+        Revoke every token the user issued or is the target of; returns how many
+        were active, or REVOKED_COUNT_UNKNOWN when the backend keeps no record
+        of issued tokens (signed)
+        """
+        return cls.get_backend().revoke_user_tokens(user_id)
+
+
+def _on_user_changed(sender, instance, signal, **kwargs):
+    # New users have no tokens, and logins only touch last_login
+    if kwargs.get('created') or kwargs.get('update_fields') == frozenset({'last_login'}):
+        return
+    try:
+        revoke = signal is post_delete or not instance.is_active
+        ImpersonationTokenManager.get_backend().user_changed(instance.pk, revoke)
+    except Exception as e:
+        logger.error(f"Failed to update impersonation tokens for user {instance.pk}: {e}")
+
+
+def _on_identity_model_changed(sender, **kwargs):
+    try:
+        ImpersonationTokenManager.get_backend().identity_models_changed()
+    except Exception as e:
+        logger.error(f"Failed to invalidate impersonation identities: {e}")
+
+
+def connect_signals():
+    from .models import Role, Tenant
+    User = get_user_model()
+    post_save.connect(_on_user_changed, sender=User, dispatch_uid='imp_tokens_user_saved')
+    post_delete.connect(_on_user_changed, sender=User, dispatch_uid='imp_tokens_user_deleted')
+    for model in (Role, Tenant):
+        post_save.connect(_on_identity_model_changed, sender=model, dispatch_uid=f'imp_tokens_{model.__name__}_saved')
+        post_delete.connect(_on_identity_model_changed, sender=model, dispatch_uid=f'imp_tokens_{model.__name__}_deleted')
@@ -0,0 +1,162 @@
+"""
+Tenant logo renditions
+
+After a logo upload commits, a background thread resizes it into the sizes the
+app actually displays (email footer, navbar, favicon) as PNG and WebP and
+stores them under content-hashed names in tenant_logos/renditions/, which
+never change and are served with immutable cache headers. Tenant.logo_renditions
+records them; templates use the rbac_extras tags and fall back to the original
+upload until the renditions exist. Logos uploaded before renditions existed
+are resized by `manage.py generate_logo_renditions`, never on a page view.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from .background import BackgroundExecutor
+from .cache_backends import invalidate_tenant_cache, tenant_cache_key
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'tenant_logos/renditions/'
+# Pixel bounding boxes; 'scale' 2 renditions are displayed at half size for high-density screens
+RENDITIONS = {
+    'email': {'size': (400, 400), 'scale': 2, 'formats': ['png']},  # Email clients don't reliably show WebP
+    'navbar': {'size': (320, 64), 'scale': 2, 'formats': ['webp', 'png']},
+    'favicon': {'size': (32, 32), 'scale': 1, 'formats': ['png'], 'square': True},
+}
+CACHE_TIMEOUT = 60 * 60
+
+renditions_executor = BackgroundExecutor('logo-renditions')
+
+
+def resize(image, spec):
+    resized = image.copy()
+    resized.thumbnail(spec['size'], Image.LANCZOS)
+    if spec.get('square'):
+        canvas = Image.new('RGBA', spec['size'], (0, 0, 0, 0))
+        canvas.paste(resized, ((spec['size'][0] - resized.width) // 2, (spec['size'][1] - resized.height) // 2))
+        resized = canvas
+    return resized
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        image.save(buffer, 'WEBP', quality=85, method=6)
+    else:
+        image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def generate_renditions(tenant_id, source):
+    """
+    Write every rendition of the tenant's logo file `source` and record them.
+    Does nothing if the tenant has uploaded a different logo in the meantime.
+    """
+    from .models import Tenant
+
+    with default_storage.open(source, 'rb') as f:
+        image = Image.open(f)
+        # JPEG decoders can scale down while decoding, which is much cheaper
+        image.draft('RGB', max(spec['size'] for spec in RENDITIONS.values()))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA')
+
+    renditions = {'source': source}
+    for name, spec in RENDITIONS.items():
+        resized = resize(image, spec)
+        # Display size in CSS pixels
+        entry = {'width': resized.width // spec['scale'], 'height': resized.height // spec['scale']}
+        for image_format in spec['formats']:
+            if image_format == 'webp' and not features.check('webp'):
+                continue
+            data = encode(resized, image_format)
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            path = f'{RENDITION_DIR}{tenant_id}/{name}-{digest}.{image_format}'
+            if not default_storage.exists(path):
+                path = default_storage.save(path, ContentFile(data))
+            entry[image_format] = path
+        renditions[name] = entry
+
+    # Files of replaced logos are kept: emails already sent still link to them
+    if Tenant.objects.filter(pk=tenant_id, logo=source).update(logo_renditions=renditions):
+        invalidate_tenant_cache(tenant_id)
+        logger.info(f"Generated logo renditions for tenant {tenant_id}")
+    return renditions
+
+
+def schedule_renditions(tenant_id, source):
+    """Generate renditions once the current transaction commits"""
+    def run():
+        if settings.LOGO_RENDITIONS_BACKGROUND:
+            renditions_executor.submit(
+                f'Failed to generate logo renditions for tenant {tenant_id}', generate_renditions, tenant_id, source
+            )
+        else:
+            generate_renditions(tenant_id, source)
+    transaction.on_commit(run)
+
+
+def logo_images(tenant_id):
+    """The tenant's logo and renditions ({'logo': name, 'email': {...}, ...}), cached per tenant"""
+    key = tenant_cache_key(tenant_id, 'logo_renditions')
+    images = cache.get(key)
+    if images is None:
+        from .models import Tenant
+        row = Tenant.objects.filter(pk=tenant_id).values_list('logo', 'logo_renditions').first()
+        images = {}
+        if row and row[0]:
+            renditions = row[1] or {}
+            # Renditions of a previous logo must not be shown for a new one
+            images = dict(renditions) if renditions.get('source') == row[0] else {}
+            images['logo'] = row[0]
+        cache.set(key, images, CACHE_TIMEOUT)
+    return images
+
+
+def logo_rendition(tenant_id, name):
+    """
+    (urls by format, width, height) for a rendition, falling back to the
+    original upload (no dimensions) until it has been generated; None without a logo
+    """
+    images = logo_images(tenant_id) if tenant_id else {}
+    if not images:
+        return None
+    entry = images.get(name)
+    if not entry:
+        return {'png': default_storage.url(images['logo'])}, None, None
+    urls = {image_format: default_storage.url(entry[image_format])
+            for image_format in ('webp', 'png') if image_format in entry}
+    return urls, entry['width'], entry['height']
+
+
+def logo_url(tenant_id, name):
+    """URL of the PNG (or original) version of a rendition, or '' without a logo"""
+    rendition = logo_rendition(tenant_id, name)
+    return rendition[0]['png'] if rendition else ''
+
+
+def _on_tenant_saved(sender, instance, **kwargs):
+    source = instance.logo.name or ''
+    if source == (instance.logo_renditions or {}).get('source', ''):
+        return
+    if source:
+        schedule_renditions(instance.pk, source)
+    elif instance.logo_renditions:
+        # Logo cleared
+        type(instance).objects.filter(pk=instance.pk).update(logo_renditions={})
+        instance.logo_renditions = {}
+
+
+def connect_signals():
+    from django.db.models.signals import post_save
+    from .models import Tenant
+    post_save.connect(_on_tenant_saved, sender=Tenant, dispatch_uid='tenant_logo_renditions')
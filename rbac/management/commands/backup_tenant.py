@@ -0,0 +1,45 @@
+"""
+Back up every row and uploaded file of a tenant
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rbac.models import Tenant
+from rbac.tenant_backup import backup_tenant
+
+
+class Command(BaseCommand):
+    help = (
+        'Write a tenant\'s rows (rbac and CRM) as gzipped NDJSON per table, a schema manifest and '
+        'its media files into a new directory. Restore or clone it with restore_tenant.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('subdomain', help='Tenant subdomain')
+        parser.add_argument('path', help='Directory to create for the backup')
+        parser.add_argument('--no-media', action='store_true', help='Leave out uploaded files')
+
+    def handle(self, *args, **options):
+        try:
+            tenant = Tenant.objects.get(subdomain=options['subdomain'])
+        except Tenant.DoesNotExist:
+            raise CommandError(f'Tenant "{options["subdomain"]}" not found')
+        if os.path.exists(options['path']):
+            raise CommandError(f'{options["path"]} already exists')
+
+        self.stdout.write(f'💾 Backing up {tenant.name} to {options["path"]}')
+        start = time.perf_counter()
+        manifest = backup_tenant(
+            tenant, options['path'], include_media=not options['no_media'],
+            log=lambda message: self.stdout.write(f'   📦 {message}'),
+        )
+        rows = sum(table['rows'] for table in manifest['tables'])
+        media = manifest['media']
+        self.stdout.write(f'   🖼️  media: {media["files"]} files ({media["bytes"] / 1024 / 1024:.1f} MB)')
+        for name in media['missing']:
+            self.stdout.write(self.style.WARNING(f'   missing media file: {name}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {rows} rows in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,111 @@
+"""
+Benchmark per-request cache and session cost under each cache/session mode
+"""
+import statistics
+import time
+from importlib import import_module
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rbac.cache_backends import TieredCache, shared_cache_alias
+
+SESSION_ENGINES = ['db', 'cache', 'cached_db', 'signed_cookies']
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the cache and session work of a typical request (a few reads, an occasional '
+        'write, one session load) against the shared cache, the two-tier cache and each session engine'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Simulated requests per mode')
+        parser.add_argument('--gets', type=int, default=8, help='Cache reads per request')
+        parser.add_argument('--keys', type=int, default=50, help='Distinct keys read across requests')
+        parser.add_argument('--write-every', type=int, default=10, help='One cache write every N requests')
+        parser.add_argument('--local-timeout', type=int, default=5, help='Local tier TTL for the tiered mode')
+
+    def handle(self, *args, **options):
+        remote_alias = shared_cache_alias()
+        remote = caches[remote_alias]
+        self.stdout.write(f'🗄️ Shared cache: {type(remote).__module__}.{type(remote).__name__}')
+
+        modes = [
+            ('shared cache only', remote),
+            ('two-tier (local LRU + shared)', TieredCache(remote_alias, {
+                'OPTIONS': {'LOCAL_TIMEOUT': options['local_timeout'], 'LOCAL_MAX_ENTRIES': 1000},
+            })),
+            ('process memory only', LocMemCache('benchmark-cache', {})),
+        ]
+        self.stdout.write('\n📦 Cache reads/writes per request')
+        for label, backend in modes:
+            self.report(label, self.measure_cache(backend, options), options['requests'])
+
+        self.stdout.write('\n🍪 Session load per request (one write every --write-every requests)')
+        for engine in SESSION_ENGINES:
+            try:
+                timings = self.measure_session(engine, options)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'   {engine:<30} skipped: {e}'))
+                continue
+            self.report(engine, timings, options['requests'])
+
+    def measure_cache(self, backend, options):
+        keys = [f'benchmark:key:{i}' for i in range(options['keys'])]
+        for key in keys:
+            backend.set(key, {'value': key, 'items': list(range(20))}, 300)
+
+        def request(i):
+            for n in range(options['gets']):
+                backend.get(keys[(i + n * 7) % len(keys)])
+            if i % options['write_every'] == 0:
+                backend.set(keys[i % len(keys)], {'value': i}, 300)
+
+        try:
+            return self.run(request, options['requests'])
+        finally:
+            backend.delete_many(keys)
+
+    def measure_session(self, engine, options):
+        store_class = import_module(f'django.contrib.sessions.backends.{engine}').SessionStore
+        session = store_class()
+        session['_auth_user_id'] = 'benchmark'
+        session['cart'] = list(range(20))
+        session.save()
+        state = {'key': session.session_key}
+
+        def request(i):
+            session = store_class(session_key=state['key'])
+            session.get('_auth_user_id')
+            if i % options['write_every'] == 0:
+                session['last_seen'] = i
+                session.save()
+                state['key'] = session.session_key
+
+        try:
+            return self.run(request, options['requests'])
+        finally:
+            store_class(session_key=state['key']).delete()
+
+    def run(self, request, count):
+        request(0)  # warm up connections
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(1, count + 1):
+                start = time.perf_counter()
+                request(i)
+                timings.append((time.perf_counter() - start) * 1_000_000)
+        return timings, len(queries)
+
+    def report(self, label, result, count):
+        timings, queries = result
+        ordered = sorted(timings)
+        p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+        self.stdout.write(
+            f'   {label:<30} median {statistics.median(ordered):8.1f}µs  p95 {p95:8.1f}µs  '
+            f'{queries / count:5.2f} DB queries/request'
+        )
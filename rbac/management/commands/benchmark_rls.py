@@ -0,0 +1,90 @@
+"""
+Benchmark PostgreSQL row-level security against ORM tenant filtering
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from rbac.models import Tenant
+from rbac.tenant_context import apply_rls_bypass, apply_tenant_guc
+from business_management.models import Client, Trip, Invoice
+
+
+class Command(BaseCommand):
+    help = 'Compare RLS (SET LOCAL app.tenant_id) against ORM tenant filters for common CRM queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help='Tenant subdomain (defaults to the tenant with most clients)')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('RLS benchmarking requires PostgreSQL')
+
+        tenant = self.get_tenant(options['tenant'])
+        iterations = options['iterations']
+        self.stdout.write(f'🏢 Tenant: {tenant.name} ({tenant.id}), {iterations} iterations per query')
+
+        # Each pair is (ORM-filtered query, unfiltered query relying on RLS)
+        queries = [
+            ('client count',
+             lambda: Client.objects.filter(tenant=tenant).count(),
+             lambda: Client.objects.count()),
+            ('recent clients page',
+             lambda: list(Client.objects.filter(tenant=tenant).order_by('-created_at')[:25]),
+             lambda: list(Client.objects.order_by('-created_at')[:25])),
+            ('trip revenue',
+             lambda: Trip.objects.filter(client__tenant=tenant).aggregate(total=Sum('total_amount')),
+             lambda: Trip.objects.aggregate(total=Sum('total_amount'))),
+            ('open invoices',
+             lambda: Invoice.objects.filter(client__tenant=tenant, status__in=['SENT', 'VIEWED']).count(),
+             lambda: Invoice.objects.filter(status__in=['SENT', 'VIEWED']).count()),
+        ]
+
+        for name, orm_query, rls_query in queries:
+            orm_timings = self.measure(orm_query, iterations)
+            rls_timings = self.measure(rls_query, iterations, tenant_id=tenant.id)
+            self.report(name, orm_timings, rls_timings)
+
+    def get_tenant(self, subdomain):
+        if subdomain:
+            try:
+                return Tenant.objects.get(subdomain=subdomain)
+            except Tenant.DoesNotExist:
+                raise CommandError(f'Tenant "{subdomain}" not found')
+        tenant_id = (Client.objects.values('tenant_id')
+                     .annotate(n=Count('id')).order_by('-n')
+                     .values_list('tenant_id', flat=True).first())
+        if not tenant_id:
+            raise CommandError('No clients found - seed data first')
+        return Tenant.objects.get(id=tenant_id)
+
+    def measure(self, query, iterations, tenant_id=None):
+        timings = []
+        for _ in range(iterations):
+            with transaction.atomic():
+                if tenant_id:
+                    apply_tenant_guc(connection, tenant_id, local=True)
+                else:
+                    apply_rls_bypass(connection, local=True)
+                start = time.perf_counter()
+                query()
+                timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, name, orm_timings, rls_timings):
+        def summary(timings):
+            ordered = sorted(timings)
+            p95 = ordered[int(len(ordered) * 0.95) - 1]
+            return statistics.median(ordered), p95
+
+        orm_p50, orm_p95 = summary(orm_timings)
+        rls_p50, rls_p95 = summary(rls_timings)
+        overhead = ((rls_p50 - orm_p50) / orm_p50 * 100) if orm_p50 else 0
+        self.stdout.write(
+            f'📊 {name:<20} ORM p50 {orm_p50:7.2f}ms p95 {orm_p95:7.2f}ms | '
+            f'RLS p50 {rls_p50:7.2f}ms p95 {rls_p95:7.2f}ms | RLS overhead {overhead:+.1f}%'
+        )
@@ -0,0 +1,130 @@
+"""
+Benchmark email template rendering under the Django engine (with and without the
+cached loader) and Jinja2
+"""
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.backends.django import DjangoTemplates
+
+from business_management.models import Client, Invoice, Trip, TripItinerary, TripLineItem
+from rbac.models import Tenant
+
+EMAIL_TEMPLATES = ['generic', 'invoice', 'itinerary', 'trip_update', 'welcome']
+
+
+def django_backend(cached):
+    loaders = settings.TEMPLATE_LOADERS
+    return DjangoTemplates({
+        'NAME': 'benchmark',
+        'DIRS': [settings.BASE_DIR / 'templates'],
+        'APP_DIRS': False,
+        'OPTIONS': {'loaders': [('django.template.loaders.cached.Loader', loaders)] if cached else loaders},
+    })
+
+
+def jinja2_backend():
+    from django.template.backends.jinja2 import Jinja2
+    return Jinja2({
+        'NAME': 'benchmark-jinja2',
+        'DIRS': [settings.BASE_DIR / 'jinja2'],
+        'APP_DIRS': False,
+        'OPTIONS': {'environment': 'vacationdesktop.jinja2.environment'},
+    })
+
+
+def sample_context(days, items):
+    """Unsaved model instances shaped like a real send, so nothing touches the database"""
+    tenant = Tenant(name='Benchmark Travel', subdomain='benchmark', contact_email='hello@example.com',
+                    phone='555-0100', address='1 Harbour Street')
+    client = Client(tenant=tenant, first_name='Ada', last_name='Lovelace', email='ada@example.com')
+    departure = date.today() + timedelta(days=60)
+    trip = Trip(client=client, trip_name='Mediterranean Cruise', trip_type='CRUISE', destination='Barcelona',
+                departure_date=departure, return_date=departure + timedelta(days=days),
+                number_of_travelers=2, total_amount=Decimal('12500.00'),
+                description='Seven nights around the western Mediterranean.\nBalcony cabin, all meals included.')
+    itinerary_days = [
+        TripItinerary(trip=trip, day_number=n, date=departure + timedelta(days=n - 1), title=f'Port {n}',
+                      description='Hotel breakfast, guided tour of the old town\nDinner on board, free time in the evening')
+        for n in range(1, days + 1)
+    ]
+    item_types = TripLineItem.ITEM_TYPE_CHOICES
+    line_items = [
+        TripLineItem(trip=trip, item_type=item_types[n % len(item_types)][0], description=f'Booking {n + 1}',
+                     supplier='Example Supplier', unit_price=Decimal('450.00'), total_price=Decimal('900.00'),
+                     service_date=departure + timedelta(days=n))
+        for n in range(items)
+    ]
+    invoice = Invoice(client=client, trip=trip, invoice_number='INV-1001', subtotal=Decimal('12500.00'),
+                      total_amount=Decimal('12500.00'), invoice_date=date.today(),
+                      due_date=date.today() + timedelta(days=30), notes='Deposit due on booking.')
+    return {
+        'client': client,
+        'tenant': tenant,
+        'tenant_name': tenant.name,
+        'tenant_logo': None,
+        'subject': 'Your trip',
+        'sender_email': tenant.contact_email,
+        'sender_phone': tenant.phone,
+        'sender_name': 'Grace Hopper',
+        'message': 'Here are the details of your upcoming trip.\n\nLet us know if anything should change.',
+        'trip': trip,
+        'invoice': invoice,
+        'itinerary_days': itinerary_days,
+        'line_items': line_items,
+        'line_items_total': sum(item.total_price for item in line_items),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Render each client email template repeatedly and report time per render: Django without the '
+        'cached loader (parse + render), Django with it (render only) and the Jinja2 ports in jinja2/emails/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=300, help='Renders per template and engine')
+        parser.add_argument('--template', action='append', dest='templates',
+                            help=f'Email template name (repeatable; default: {", ".join(EMAIL_TEMPLATES)})')
+        parser.add_argument('--days', type=int, default=7, help='Itinerary days in the sample trip')
+        parser.add_argument('--items', type=int, default=6, help='Line items in the sample trip')
+
+    def handle(self, *args, **options):
+        context = sample_context(options['days'], options['items'])
+        engines = [('django (no cache)', django_backend(cached=False)), ('django (cached)', django_backend(cached=True))]
+        try:
+            engines.append(('jinja2', jinja2_backend()))
+        except ImportError:
+            self.stdout.write(self.style.WARNING('⚠️ Jinja2 is not installed; comparing the Django engine only'))
+
+        for name in options['templates'] or EMAIL_TEMPLATES:
+            template_name = f'emails/{name}.html'
+            self.stdout.write(f'\n✉️ {template_name}')
+            for label, backend in engines:
+                try:
+                    parse_us, timings = self.measure(backend, template_name, context, options['renders'])
+                except Exception as e:
+                    raise CommandError(f'{label} failed to render {template_name}: {e}')
+                ordered = sorted(timings)
+                p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+                self.stdout.write(
+                    f'   {label:<18} first {parse_us:8.1f}µs  median {statistics.median(ordered):8.1f}µs  '
+                    f'p95 {p95:8.1f}µs  {1_000_000 / statistics.mean(ordered):8.0f} renders/s'
+                )
+
+    def measure(self, backend, template_name, context, count):
+        # The first load includes parsing for every engine
+        start = time.perf_counter()
+        backend.get_template(template_name).render(context)
+        first = (time.perf_counter() - start) * 1_000_000
+
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            backend.get_template(template_name).render(context)
+            timings.append((time.perf_counter() - start) * 1_000_000)
+        return first, timings
@@ -0,0 +1,224 @@
+"""
+Single-process, idempotent container bootstrap (replaces the manage.py chain in start.sh)
+"""
+import hashlib
+import inspect
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.finders import get_finders
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.migrations.executor import MigrationExecutor
+
+from rbac.models import Role, Permission, RolePermission
+from rbac.management.commands import setup_rbac
+
+User = get_user_model()
+
+FINGERPRINT_CACHE_KEY = 'bootstrap:fingerprint:{}'
+STATIC_FINGERPRINT_FILE = '.bootstrap-fingerprint'
+
+
+def fingerprint(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        'Prepare the container in one process: media directories, database wait, migrations, '
+        'cache table, RBAC roles/permissions, admin user and static files. Steps whose inputs '
+        'have not changed since the last run are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Ignore stored fingerprints and run every step')
+        parser.add_argument('--db-wait', type=int, default=60, help='Seconds to wait for the database')
+        parser.add_argument('--skip-static', action='store_true', help='Do not run collectstatic')
+        parser.add_argument('--report', action='store_true',
+                            help='Also print the debug_media, verify_volume and debug_rbac reports')
+
+    def handle(self, *args, **options):
+        self.force = options['force']
+        started = time.perf_counter()
+        self.stdout.write('🚀 Bootstrapping VacationDesktop...')
+
+        # Filesystem and static work does not need the database, so overlap it
+        # with waiting for the database to accept connections
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            database = pool.submit(self.in_thread, self.wait_for_database, options['db_wait'])
+            media = pool.submit(self.timed, 'media', self.prepare_media)
+            static = None if options['skip_static'] else pool.submit(self.timed, 'static', self.collect_static)
+            database.result()
+            media.result()
+            self.stdout.write(f'   📧 Email backend: {self.describe_email()}')
+
+            self.timed('migrate', self.migrate)
+            self.timed('cache table', self.create_cache_table)
+
+            self.timed('rbac', self.setup_rbac)
+            self.timed('admin user', self.ensure_admin_user)
+            if static:
+                static.result()
+
+        if options['report']:
+            for command in ('debug_media', 'verify_volume', 'debug_rbac'):
+                call_command(command, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Bootstrap complete in {time.perf_counter() - started:.1f}s'))
+
+    def in_thread(self, func, *args):
+        """Run func in a worker thread and release its database connections"""
+        try:
+            return func(*args)
+        finally:
+            connections.close_all()
+
+    def timed(self, name, func):
+        start = time.perf_counter()
+        result = func()
+        self.stdout.write(f'   ⏱️ {name}: {result} ({time.perf_counter() - start:.2f}s)')
+        return result
+
+    def is_unchanged(self, step, value):
+        if self.force:
+            return False
+        try:
+            return cache.get(FINGERPRINT_CACHE_KEY.format(step)) == value
+        except Exception:
+            return False
+
+    def remember(self, step, value):
+        try:
+            cache.set(FINGERPRINT_CACHE_KEY.format(step), value, timeout=None)
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'⚠️ Could not store {step} fingerprint: {e}'))
+
+    def wait_for_database(self, timeout):
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                connections[DEFAULT_DB_ALIAS].ensure_connection()
+                self.stdout.write(f'   ✅ Database ready (attempt {attempt})')
+                return
+            except Exception as e:
+                if time.monotonic() > deadline:
+                    raise CommandError(f'Database not ready after {timeout}s: {e}')
+                self.stdout.write(f'   ⏳ Database not ready, waiting... (attempt {attempt})')
+                connections[DEFAULT_DB_ALIAS].close()
+                time.sleep(2)
+
+    def prepare_media(self):
+        tenant_logos_dir = os.path.join(settings.MEDIA_ROOT, 'tenant_logos')
+        os.makedirs(tenant_logos_dir, exist_ok=True)
+        if not os.access(tenant_logos_dir, os.W_OK):
+            self.stdout.write(self.style.WARNING(f'⚠️ Media directory may not be writable: {tenant_logos_dir}'))
+            return 'not writable'
+        return f'ok ({settings.MEDIA_ROOT})'
+
+    def describe_email(self):
+        """The email configuration summary settings.py used to print on every import"""
+        backend = settings.EMAIL_BACKEND
+        if backend == 'mailgun_api_backend.MailgunAPIBackend':
+            return f'Mailgun API (domain {settings.MAILGUN_DOMAIN})'
+        if backend == 'django.core.mail.backends.smtp.EmailBackend':
+            return f'SMTP {settings.EMAIL_HOST}:{settings.EMAIL_PORT} (TLS={settings.EMAIL_USE_TLS})'
+        if backend == 'django.core.mail.backends.console.EmailBackend':
+            reason = 'FORCE_CONSOLE_EMAIL=true' if settings.FORCE_CONSOLE_EMAIL else 'SMTP credentials not configured'
+            return f'Console ({reason})'
+        return backend
+
+    def collect_static(self):
+        # The output lives on the container filesystem, so the fingerprint is
+        # kept next to it rather than in the shared cache
+        sources = []
+        for finder in get_finders():
+            for path, storage in finder.list([]):
+                stat = os.stat(storage.path(path))
+                sources.append((path, stat.st_size, stat.st_mtime_ns))
+        value = fingerprint(settings.STATICFILES_STORAGE, sorted(sources))
+
+        marker = os.path.join(settings.STATIC_ROOT, STATIC_FINGERPRINT_FILE)
+        try:
+            with open(marker) as f:
+                if not self.force and f.read() == value:
+                    return f'unchanged ({len(sources)} files)'
+        except OSError:
+            pass
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        os.makedirs(settings.STATIC_ROOT, exist_ok=True)
+        with open(marker, 'w') as f:
+            f.write(value)
+        return f'collected {len(sources)} files'
+
+    def migrate(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if not plan:
+            return 'up to date'
+        call_command('migrate', interactive=False, verbosity=0)
+        return f'applied {len(plan)} migrations'
+
+    def create_cache_table(self):
+        if not any(cache_config.get('BACKEND') == 'django.core.cache.backends.db.DatabaseCache'
+                   for cache_config in settings.CACHES.values()):
+            return 'not using database cache'
+        # createcachetable is itself a no-op when the table exists
+        call_command('createcachetable', verbosity=0)
+        return 'ok'
+
+    def rbac_fingerprint(self):
+        """Role/permission definitions plus row counts, so missing rows also trigger a re-run"""
+        return fingerprint(
+            inspect.getsource(setup_rbac),
+            Role.objects.count(),
+            Permission.objects.count(),
+            RolePermission.objects.filter(role__name='SUPER_ADMIN').count(),
+        )
+
+    def setup_rbac(self):
+        if self.is_unchanged('rbac', self.rbac_fingerprint()):
+            return 'unchanged'
+        # setup_rbac also gives SUPER_ADMIN every permission (what force_fix_rbac did)
+        call_command('setup_rbac', stdout=io.StringIO())
+        self.remember('rbac', self.rbac_fingerprint())
+        return 'roles and permissions synced'
+
+    def ensure_admin_user(self):
+        """Create the system admin if missing and keep it a tenant-less SUPER_ADMIN"""
+        username = config('ADMIN_USERNAME', default='admin')
+        role = Role.objects.get(name='SUPER_ADMIN')
+        admin = User.objects.filter(username=username).first()
+
+        if admin is None:
+            admin = User.objects.create_superuser(
+                username=username,
+                email=config('ADMIN_EMAIL', default='admin@example.com'),
+                password=config('ADMIN_PASSWORD', default='VacationAdmin2024!'),
+                first_name='System',
+                last_name='Administrator',
+                role=role,
+            )
+            return f'created {admin.username}'
+
+        if admin.role_id == role.id and admin.tenant_id is None:
+            return 'ok'
+        admin.role = role
+        admin.tenant = None  # System users don't belong to a specific tenant
+        admin.save(update_fields=['role', 'tenant'])
+        return f'fixed role/tenant for {admin.username}'
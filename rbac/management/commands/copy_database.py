@@ -0,0 +1,153 @@
+"""
+Copy all data between databases (e.g. SQLite to PostgreSQL) in parallel, resumably
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+
+from rbac.db_copy import (
+    CHECKPOINT_TABLE, CHUNK_SIZE, POST_MIGRATE_TABLES, add_database, copied_models, copy_table, dependencies,
+    drop_checkpoint_table, empty_tables, ensure_checkpoint_table, init_worker, read_checkpoints,
+    reset_sequences, tables_with_rows, verify_table,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy every table from --source to --target (aliases or database URLs) in primary key chunks, '
+        'with COPY on PostgreSQL, tables in parallel worker processes, checkpoints to resume an '
+        'interrupted run, and a final row count and checksum comparison'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', required=True, help='Alias or URL, e.g. sqlite:////app/db.sqlite3')
+        parser.add_argument('--target', default='default', help='Alias or URL (default: the "default" database)')
+        parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4))
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--truncate', action='store_true',
+                            help='Empty target tables that already hold rows before a fresh copy')
+        parser.add_argument('--restart', action='store_true', help='Ignore checkpoints of a previous run')
+        parser.add_argument('--no-migrate', action='store_true', help='Do not run migrate on the target first')
+        parser.add_argument('--no-verify', action='store_true', help='Skip the row count and checksum comparison')
+        parser.add_argument('--verify-only', action='store_true', help='Only compare source and target')
+
+    def handle(self, *args, **options):
+        self.databases = {}
+        source = self.alias('copy_source', options['source'])
+        target = self.alias('copy_target', options['target'])
+        if source == target:
+            raise CommandError('Source and target are the same database')
+        self.source, self.target = source, target
+        self.chunk_size = options['chunk_size']
+
+        if not options['verify_only']:
+            if not options['no_migrate']:
+                self.stdout.write(f'🗄️  Migrating {target}')
+                call_command('migrate', database=target, interactive=False, verbosity=0)
+            self.check_migrations()
+
+        models = copied_models(source)
+        labels = {model: model._meta.label for model in models}
+        workers = options['workers']
+        if connections[target].vendor == 'sqlite' and workers > 1:
+            # SQLite allows one writer at a time
+            self.stdout.write('   SQLite target: copying one table at a time')
+            workers = 1
+        # Workers open their own connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(self.databases,)) as pool:
+            if not options['verify_only']:
+                self.prepare_target(models, options)
+                connections.close_all()
+                self.copy(pool, models, labels)
+                reset_sequences(target, models)
+                connections.close_all()
+            if not options['no_verify']:
+                self.verify(pool, models, labels)
+
+    def alias(self, name, value):
+        if '://' not in value:
+            if value not in connections.settings:
+                raise CommandError(f'Unknown database alias "{value}"')
+            return value
+        self.databases[name] = value
+        return add_database(name, value)
+
+    def check_migrations(self):
+        source = set(MigrationRecorder(connections[self.source]).applied_migrations())
+        target = set(MigrationRecorder(connections[self.target]).applied_migrations())
+        if source - target:
+            raise CommandError(f'The target lacks migrations applied to the source: {sorted(source - target)[:5]}')
+        if target - source:
+            raise CommandError(f'Migrate the source first; it lacks {sorted(target - source)[:5]}')
+
+    def prepare_target(self, models, options):
+        has_checkpoints = CHECKPOINT_TABLE in connections[self.target].introspection.table_names()
+        if has_checkpoints and not options['restart'] and read_checkpoints(self.target):
+            self.stdout.write(f'⏯️  Resuming from the checkpoints in {CHECKPOINT_TABLE}')
+            return
+        filled = [table for table in tables_with_rows(self.target, models) if table not in POST_MIGRATE_TABLES]
+        if filled and not options['truncate']:
+            raise CommandError(
+                f'Target tables already hold rows ({", ".join(filled[:5])}); use --truncate to empty them'
+            )
+        drop_checkpoint_table(self.target)
+        # Content types and permissions must keep the source's ids
+        empty_tables(self.target, models)
+        ensure_checkpoint_table(self.target)
+
+    def copy(self, pool, models, labels):
+        deps = dependencies(models)
+        pending, done, running = set(models), set(), {}
+        start = time.perf_counter()
+        total = 0
+        while pending or running:
+            ready = [model for model in pending if deps[model] <= done]
+            if not ready and not running:
+                # A foreign key cycle; its tables' deferred checks decide
+                ready = [next(iter(pending))]
+                self.stdout.write(self.style.WARNING(f'   ⚠️  Dependency cycle at {ready[0]._meta.db_table}'))
+            for model in ready:
+                pending.discard(model)
+                running[pool.submit(copy_table, labels[model], self.source, self.target, self.chunk_size)] = model
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                model = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    for other in running:
+                        other.cancel()
+                    raise CommandError(f'{model._meta.db_table} failed: {e}. Run again to resume.')
+                done.add(model)
+                total += result.rows
+                rate = result.rows / result.seconds if result.seconds else 0
+                self.stdout.write(
+                    f'   📦 {model._meta.db_table}: {result.rows} rows in {result.seconds:.1f}s ({rate:.0f}/s)'
+                )
+        self.stdout.write(self.style.SUCCESS(f'✅ Copied {total} rows in {time.perf_counter() - start:.1f}s'))
+
+    def verify(self, pool, models, labels):
+        self.stdout.write('🔍 Comparing row counts and checksums')
+        futures = [pool.submit(verify_table, labels[model], self.source, self.target, self.chunk_size)
+                   for model in models]
+        tables = {model._meta.label: model._meta.db_table for model in models}
+        mismatched = []
+        for future in futures:
+            check = future.result()
+            table = tables[check.label]
+            if check.source_rows != check.target_rows or check.source_checksum != check.target_checksum:
+                mismatched.append(table)
+                self.stdout.write(self.style.ERROR(
+                    f'   ❌ {table}: {check.source_rows} source rows, {check.target_rows} target rows'
+                    f'{"" if check.source_rows != check.target_rows else ", checksums differ"}'
+                ))
+        if mismatched:
+            raise CommandError(f'{len(mismatched)} tables differ')
+        self.stdout.write(self.style.SUCCESS(f'✅ All {len(models)} tables match'))
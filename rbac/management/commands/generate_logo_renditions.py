@@ -0,0 +1,49 @@
+"""
+Generate tenant logo renditions (backfill, or after changing RENDITIONS)
+"""
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from rbac.logo_renditions import generate_renditions
+from rbac.models import Tenant
+
+
+class Command(BaseCommand):
+    help = (
+        'Resize tenant logos into the email, navbar and favicon renditions in this process. '
+        'Tenants whose renditions match their current logo are skipped unless --force is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', dest='subdomain', help='Only this tenant (subdomain)')
+        parser.add_argument('--force', action='store_true', help='Regenerate up-to-date renditions too')
+
+    def handle(self, *args, **options):
+        tenants = Tenant.objects.exclude(logo='').exclude(logo__isnull=True).order_by('name')
+        if options['subdomain']:
+            tenants = tenants.filter(subdomain=options['subdomain'])
+            if not tenants.exists():
+                raise CommandError(f'Tenant "{options["subdomain"]}" not found or has no logo')
+
+        generated = skipped = failed = 0
+        for tenant in tenants:
+            if not options['force'] and tenant.logo_renditions.get('source') == tenant.logo.name:
+                skipped += 1
+                continue
+            try:
+                renditions = generate_renditions(tenant.pk, tenant.logo.name)
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'❌ {tenant.name}: {e}'))
+                continue
+            generated += 1
+            files = [
+                (f'{name}.{image_format}', default_storage.size(entry[image_format]))
+                for name, entry in renditions.items() if name != 'source'
+                for image_format in ('webp', 'png') if image_format in entry
+            ]
+            summary = ', '.join(f'{label} {size / 1024:.1f}KB' for label, size in files)
+            self.stdout.write(f'🖼️ {tenant.name}: original {tenant.logo.size / 1024:.1f}KB -> {summary}')
+
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f'✅ {generated} generated, {skipped} up to date, {failed} failed'))
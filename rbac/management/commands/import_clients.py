@@ -0,0 +1,90 @@
+"""
+Import clients from a file, or process uploaded imports in a worker
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from business_management.client_import import claim_import, detect_format, run_import
+from business_management.models import ClientImport
+from rbac.models import Tenant, User
+from rbac.tenant_context import get_tenant_database
+
+
+class Command(BaseCommand):
+    help = (
+        'Import a CSV/XLSX/vCard file of clients into a tenant in this process, or with --pending '
+        'run the imports uploaded through the CRM (for CLIENT_IMPORT_BACKGROUND=false workers)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('subdomain', nargs='?', help='Tenant to import into')
+        parser.add_argument('path', nargs='?', help='File to import')
+        parser.add_argument('--user', dest='username', help='Record clients as created by this user')
+        parser.add_argument('--pending', action='store_true', help='Run every pending uploaded import')
+        parser.add_argument('--watch', type=int, metavar='SECONDS',
+                            help='With --pending, keep checking for new imports at this interval')
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            while True:
+                self.run_pending()
+                if not options['watch']:
+                    return
+                time.sleep(options['watch'])
+
+        if not options['subdomain'] or not options['path']:
+            raise CommandError('Give a tenant subdomain and a file, or --pending')
+        try:
+            tenant = Tenant.objects.get(subdomain=options['subdomain'])
+        except Tenant.DoesNotExist:
+            raise CommandError(f'Tenant "{options["subdomain"]}" not found')
+        user = None
+        if options['username']:
+            user = User.objects.filter(username=options['username'], tenant=tenant).first()
+            if user is None:
+                raise CommandError(f'User "{options["username"]}" not found in {tenant.name}')
+        file_format = detect_format(options['path'])
+        if not file_format:
+            raise CommandError('Expected a .csv, .xlsx or .vcf file')
+
+        using = get_tenant_database(tenant.pk)
+        name = os.path.basename(options['path'])
+        job = ClientImport(tenant=tenant, created_by=user, original_name=name[:255], file_format=file_format)
+        with open(options['path'], 'rb') as f:
+            job.file.save(name, File(f), save=False)
+        job.save(using=using)
+        claim_import(job.pk, using)
+        self.run(job.pk, using, f'{name} -> {tenant.name}')
+
+    def run_pending(self):
+        aliases = [DEFAULT_DB_ALIAS] + list(getattr(settings, 'TENANT_DATABASE_ALIASES', ()))
+        for using in aliases:
+            pending = ClientImport.objects.using(using).filter(status='PENDING').order_by('created_at')
+            for job_id, name in pending.values_list('id', 'original_name'):
+                # Another worker may have claimed it since the query
+                if claim_import(job_id, using):
+                    self.run(job_id, using, name)
+
+    def run(self, job_id, using, label):
+        self.stdout.write(f'📥 Importing {label}')
+        start = time.perf_counter()
+        job = run_import(job_id, using)
+        elapsed = time.perf_counter() - start
+        rate = job.processed_rows / elapsed if elapsed else 0
+        summary = (
+            f'{job.processed_rows} rows in {elapsed:.1f}s ({rate:.0f}/s): {job.created_count} created, '
+            f'{job.duplicate_count} duplicates, {job.error_count} errors'
+        )
+        if job.status == 'FAILED':
+            self.stdout.write(self.style.ERROR(f'❌ {job.message} ({summary})'))
+            return
+        for error in job.errors[:20]:
+            self.stdout.write(self.style.WARNING(f'   row {error["row"]}: {"; ".join(error["errors"])}'))
+        if job.error_count > 20:
+            self.stdout.write(self.style.WARNING(f'   ... and {job.error_count - 20} more rows with errors'))
+        self.stdout.write(self.style.SUCCESS(f'✅ {summary}'))
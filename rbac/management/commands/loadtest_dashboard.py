@@ -0,0 +1,99 @@
+"""
+In-process load test of the CRM dashboard under different CONN_MAX_AGE values
+"""
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from rbac.db_metrics import get_connection_stats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive crm_dashboard_view through the test client from several threads and report '
+        'p50/p99 latency for each CONN_MAX_AGE value (e.g. --conn-max-age 0 --conn-max-age 600)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Tenant user to request the dashboard as')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per configuration')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--conn-max-age', type=int, action='append', dest='max_ages',
+                            help='CONN_MAX_AGE values to compare (repeatable)')
+        parser.add_argument('--url', default=None, help='Path to request (defaults to the CRM dashboard)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" not found')
+
+        url = options['url'] or reverse('crm_dashboard')
+        max_ages = options['max_ages'] or [0, settings.DB_CONN_MAX_AGE]
+        original_max_age = settings.DATABASES['default'].get('CONN_MAX_AGE', 0)
+
+        setup_test_environment()
+        try:
+            for max_age in max_ages:
+                self.run_configuration(user, url, max_age, options['requests'], options['concurrency'])
+        finally:
+            settings.DATABASES['default']['CONN_MAX_AGE'] = original_max_age
+            teardown_test_environment()
+
+    def run_configuration(self, user, url, max_age, total_requests, concurrency):
+        # Connections read CONN_MAX_AGE from the shared settings dict on connect
+        settings.DATABASES['default']['CONN_MAX_AGE'] = max_age
+        connections.close_all()
+
+        opened_before = get_connection_stats()['connections_opened']
+        timings = []
+        timings_lock = threading.Lock()
+        errors = []
+        per_thread = total_requests // concurrency
+
+        def worker():
+            client = Client()
+            client.force_login(user)
+            try:
+                for _ in range(per_thread):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+                    with timings_lock:
+                        timings.append(elapsed)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        wall_start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_start
+
+        if not timings:
+            raise CommandError('No requests completed')
+        ordered = sorted(timings)
+        p99 = ordered[max(int(len(ordered) * 0.99) - 1, 0)]
+        opened = get_connection_stats()['connections_opened'] - opened_before
+
+        self.stdout.write(
+            f'📊 CONN_MAX_AGE={max_age:<5} requests={len(timings)} '
+            f'p50={statistics.median(ordered):.1f}ms p99={p99:.1f}ms '
+            f'throughput={len(timings) / wall:.1f} req/s connections opened={opened}'
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f'⚠️ {len(errors)} non-200 responses: {sorted(set(errors))}'))
@@ -0,0 +1,58 @@
+"""
+Apply migrations to the shared database and every tenant schema/database
+"""
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Run migrate on the default database and on each alias in TENANT_DATABASES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', action='append', dest='aliases',
+                            help='Only migrate these tenant aliases (repeatable)')
+        parser.add_argument('--skip-default', action='store_true',
+                            help='Do not migrate the shared database')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or list(settings.TENANT_DATABASE_ALIASES)
+        unknown = [a for a in aliases if a not in settings.TENANT_DATABASE_ALIASES]
+        if unknown:
+            raise CommandError(f'Unknown tenant aliases: {", ".join(unknown)}')
+
+        if not options['skip_default']:
+            self.stdout.write('📊 Migrating shared database...')
+            call_command('migrate', database=DEFAULT_DB_ALIAS, interactive=False,
+                         verbosity=options['verbosity'])
+
+        for alias in aliases:
+            schema = settings.DATABASES[alias].get('TENANT_SCHEMA')
+            if schema:
+                self.prepare_schema(alias, schema)
+            self.stdout.write(f'📊 Migrating {alias}' + (f' (schema {schema})' if schema else '') + '...')
+            call_command('migrate', database=alias, interactive=False,
+                         verbosity=options['verbosity'])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Migrated {len(aliases)} tenant database(s)'))
+
+    def prepare_schema(self, alias, schema):
+        """
+        Create the tenant schema and its own django_migrations table.
+
+        The alias' search_path falls back to public, so without a local
+        django_migrations table Django would read the shared migration history
+        and consider the schema fully migrated.
+        """
+        connection = connections[alias]
+        quoted = connection.ops.quote_name(schema)
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {quoted}')
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {quoted}."django_migrations" ('
+                '"id" bigserial PRIMARY KEY, '
+                '"app" varchar(255) NOT NULL, '
+                '"name" varchar(255) NOT NULL, '
+                '"applied" timestamp with time zone NOT NULL)'
+            )
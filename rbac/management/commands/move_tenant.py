@@ -0,0 +1,181 @@
+"""
+Move a tenant's CRM data between the shared database and a dedicated
+schema/database alias while the tenant stays online
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, DEFAULT_DB_ALIAS
+
+from rbac.models import Tenant, Role
+from rbac.tenant_backup import insert_rows
+from rbac.tenant_context import get_tenant_database, invalidate_tenant_databases, TENANT_DATABASE_MAP_TTL
+from business_management.tenant_data import TENANT_MODELS, tenant_queryset, iter_batches
+
+User = get_user_model()
+
+# Catch-up passes after the switch before giving up on the source going quiet
+SETTLE_PASSES = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy a tenant\'s CRM rows to another database alias in batches, catch up rows '
+        'inserted, changed or deleted during the copy, switch Tenant.database_alias and '
+        'remove the source rows once a catch-up pass finds nothing left to copy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('subdomain', help='Tenant subdomain')
+        parser.add_argument('--to', dest='target', required=True,
+                            help=f'Target alias ("{DEFAULT_DB_ALIAS}" for the shared database)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep-source', action='store_true',
+                            help='Leave the copied rows in the source database')
+
+    def handle(self, *args, **options):
+        try:
+            tenant = Tenant.objects.using(DEFAULT_DB_ALIAS).get(subdomain=options['subdomain'])
+        except Tenant.DoesNotExist:
+            raise CommandError(f'Tenant "{options["subdomain"]}" not found')
+
+        target = options['target']
+        if target != DEFAULT_DB_ALIAS and target not in settings.TENANT_DATABASE_ALIASES:
+            raise CommandError(f'"{target}" is not configured in TENANT_DATABASES')
+
+        invalidate_tenant_databases()
+        source = get_tenant_database(tenant.id)
+        if source == target:
+            raise CommandError(f'{tenant.name} already lives in "{target}"')
+
+        batch_size = options['batch_size']
+        self.stdout.write(f'🚚 Moving {tenant.name}: {source} -> {target}')
+
+        if self.is_standalone(target):
+            self.copy_shared_rows(tenant, source, target)
+
+        for model, lookup in TENANT_MODELS:
+            copied = 0
+            for rows in iter_batches(tenant_queryset(model, lookup, tenant, using=source), batch_size):
+                self.insert_missing(model, target, rows)
+                copied += len(rows)
+            self.stdout.write(f'   📦 {model._meta.db_table}: {copied} rows')
+
+        self.catch_up(tenant, source, target, batch_size=batch_size)
+
+        # Switch placement; other workers pick it up within the map TTL
+        tenant.database_alias = '' if target == DEFAULT_DB_ALIAS else target
+        tenant.save(update_fields=['database_alias'])
+        self.stdout.write(f'🔀 Tenant now routed to "{target}", waiting {TENANT_DATABASE_MAP_TTL}s for workers...')
+        time.sleep(TENANT_DATABASE_MAP_TTL)
+
+        # Workers with a stale map may still write to the source: keep catching
+        # up until a pass changes nothing before the source rows can go
+        for _ in range(SETTLE_PASSES):
+            if not self.catch_up(tenant, source, target, batch_size=batch_size):
+                break
+        else:
+            raise CommandError(
+                f'{tenant.name} is still being written in "{source}"; the source rows were kept. '
+                f'Run the move again once every worker routes the tenant to "{target}".'
+            )
+
+        if not options['keep_source']:
+            with transaction.atomic(using=source):
+                for model, lookup in reversed(TENANT_MODELS):
+                    tenant_queryset(model, lookup, tenant, using=source).order_by()._raw_delete(source)
+            self.stdout.write(f'🧹 Removed source rows from "{source}"')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {tenant.name} moved to "{target}"'))
+
+    def is_standalone(self, alias):
+        """Dedicated databases need their own copies of the shared rbac rows"""
+        return alias != DEFAULT_DB_ALIAS and not settings.DATABASES[alias].get('TENANT_SCHEMA')
+
+    def copy_shared_rows(self, tenant, source, target):
+        """Copy roles, the tenant and every user the tenant's rows reference"""
+        Role.objects.using(target).bulk_create(
+            list(Role.objects.using(DEFAULT_DB_ALIAS).all()), ignore_conflicts=True
+        )
+        Tenant.objects.using(target).bulk_create(
+            list(Tenant.objects.using(DEFAULT_DB_ALIAS).filter(pk=tenant.pk)), ignore_conflicts=True
+        )
+
+        user_ids = set(User.objects.using(DEFAULT_DB_ALIAS).filter(tenant=tenant).values_list('id', flat=True))
+        for model, lookup in TENANT_MODELS:
+            for field in model._meta.concrete_fields:
+                if field.is_relation and field.related_model is User:
+                    user_ids.update(
+                        tenant_queryset(model, lookup, tenant, using=source)
+                        .exclude(**{f'{field.name}__isnull': True})
+                        .values_list(field.attname, flat=True)
+                    )
+        users = list(User.objects.using(DEFAULT_DB_ALIAS).filter(id__in=user_ids))
+        User.objects.using(target).bulk_create(users, ignore_conflicts=True)
+        self.stdout.write(f'   👥 Copied {len(users)} users referenced by {tenant.name}')
+
+    def catch_up(self, tenant, source, target, batch_size=1000):
+        """
+        Make the target's rows for the tenant match the source by primary key
+        and content: copy missing and changed rows, delete rows gone from the
+        source. Returns the number of target rows changed.
+        """
+        source_pks = {}
+        changed = 0
+        for model, lookup in TENANT_MODELS:
+            attnames = [field.attname for field in model._meta.concrete_fields]
+            pk_index = attnames.index(model._meta.pk.attname)
+            source_pks[model] = set()
+            count = 0
+            for rows in iter_batches(tenant_queryset(model, lookup, tenant, using=source), batch_size):
+                pks = [row.pk for row in rows]
+                source_pks[model].update(pks)
+                stored = {
+                    values[pk_index]: values
+                    for values in model.objects.using(target).filter(pk__in=pks).values_list(*attnames)
+                }
+                stale = [row for row in rows if stored.get(row.pk) != tuple(getattr(row, name) for name in attnames)]
+                if not stale:
+                    continue
+                # FK constraints are deferred, so delete + insert keeps children valid
+                with transaction.atomic(using=target):
+                    model.objects.using(target).filter(pk__in=[row.pk for row in stale])._raw_delete(target)
+                    self.insert(model, target, stale)
+                count += len(stale)
+            if count:
+                self.stdout.write(f'   🔁 {model._meta.db_table}: {count} rows caught up')
+            changed += count
+
+        # Children before parents, while the parents still scope them to the tenant
+        for model, lookup in reversed(TENANT_MODELS):
+            deleted = [
+                pk for pk in tenant_queryset(model, lookup, tenant, using=target).values_list('pk', flat=True)
+                if pk not in source_pks[model]
+            ]
+            for start in range(0, len(deleted), batch_size):
+                model.objects.using(target).filter(pk__in=deleted[start:start + batch_size])._raw_delete(target)
+            if deleted:
+                self.stdout.write(f'   🗑️  {model._meta.db_table}: {len(deleted)} rows deleted')
+            changed += len(deleted)
+        return changed
+
+    def insert_missing(self, model, target, rows):
+        """Insert the rows the target does not have yet, so an interrupted move can be re-run"""
+        existing = set(
+            model.objects.using(target).filter(pk__in=[row.pk for row in rows]).values_list('pk', flat=True)
+        )
+        self.insert(model, target, [row for row in rows if row.pk not in existing])
+
+    def insert(self, model, target, rows):
+        """
+        Insert rows with their stored column values; bulk_create would run
+        pre_save and stamp auto_now fields (updated_at) with the time of the move
+        """
+        if not rows:
+            return
+        fields = model._meta.concrete_fields
+        # One transaction per batch: COPY stages RLS tables in a temporary table dropped on commit
+        with transaction.atomic(using=target):
+            insert_rows(target, model, fields, [[getattr(row, field.attname) for field in fields] for row in rows])
@@ -0,0 +1,55 @@
+"""
+Parse and check every template at build time
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+
+from rbac.template_warmup import check_template, template_names
+
+EMAIL_TEMPLATE_PREFIX = 'emails/'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compile every template with each configured engine and fail on syntax errors, '
+        '{% extends %}/{% include %} of missing templates and {% url %} names that do not exist. '
+        'Jinja2 bytecode is written to JINJA2_BYTECODE_DIR when set.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Also check templates shipped by Django and third-party apps')
+
+    def handle(self, *args, **options):
+        checked = 0
+        failures = []
+        names_by_engine = {}
+        for backend in engines.all():
+            names = template_names(backend, project_only=not options['all'])
+            names_by_engine[backend.name] = names
+            self.stdout.write(f'🧩 {backend.name}: {len(names)} templates')
+            for name, path in names.items():
+                checked += 1
+                own = path.startswith(str(settings.BASE_DIR))
+                for problem in check_template(backend, name, references=own):
+                    failures.append(f'{path}: {problem}')
+
+        failures.extend(self.missing_email_ports(names_by_engine))
+
+        for failure in failures:
+            self.stdout.write(self.style.ERROR(f'   ❌ {failure}'))
+        if failures:
+            raise CommandError(f'{len(failures)} template problem(s) in {checked} templates')
+        self.stdout.write(self.style.SUCCESS(f'✅ {checked} templates compiled'))
+
+    def missing_email_ports(self, names_by_engine):
+        """With EMAIL_TEMPLATE_ENGINE=jinja2 every client email needs a port in jinja2/emails/"""
+        if 'jinja2' not in names_by_engine:
+            return []
+        ported = set(names_by_engine['jinja2'])
+        return [
+            f'{path}: no Jinja2 port in jinja2/{name}'
+            for name, path in names_by_engine['django'].items()
+            if name.startswith(EMAIL_TEMPLATE_PREFIX) and name not in ported
+        ]
@@ -0,0 +1,143 @@
+"""
+Profile process startup: per-module import times and a startup-time benchmark
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before serving its first request: configure Django,
+# populate the app registry and load the URLconf with every included view module
+STARTUP_CODE = (
+    'import django; django.setup(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns'
+)
+
+
+def parse_importtime(stderr):
+    """
+    Parse `python -X importtime` output into (module, self_us, cumulative_us, depth)
+    rows. Nesting is encoded as two spaces of indentation per level.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        rows.append((stripped, int(parts[0]), int(parts[1]), depth))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Show which modules dominate startup (python -X importtime, run in a fresh interpreter) '
+        'and benchmark startup time against a budget or a saved baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Number of modules to list')
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative')
+        parser.add_argument('--by-package', action='store_true',
+                            help='Aggregate self time by top-level package instead of listing modules')
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to time for the benchmark')
+        parser.add_argument('--max-ms', type=float, help='Fail if median startup exceeds this many milliseconds')
+        parser.add_argument('--baseline', help='JSON file with a previous result to compare against')
+        parser.add_argument('--tolerance', type=float, default=20.0,
+                            help='Allowed slowdown against --baseline, in percent')
+        parser.add_argument('--save-baseline', action='store_true', help='Write this result to --baseline')
+
+    def handle(self, *args, **options):
+        rows = parse_importtime(self.run_startup(['-X', 'importtime']).stderr)
+        if not rows:
+            raise CommandError('No import timings captured')
+
+        total_us = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+        self.stdout.write(f'📦 {len(rows)} modules imported in {total_us / 1000:.1f}ms (import time only)')
+        if options['by_package']:
+            self.report_packages(rows, options['top'])
+        else:
+            self.report_modules(rows, options['top'], options['sort'])
+
+        timings = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            self.run_startup()
+            timings.append((time.perf_counter() - start) * 1000)
+        median = statistics.median(timings)
+        self.stdout.write(
+            f'⏱️ Startup over {len(timings)} runs: median {median:.0f}ms '
+            f'(min {min(timings):.0f}ms, max {max(timings):.0f}ms)'
+        )
+
+        result = {'median_ms': round(median, 1), 'modules': len(rows), 'import_ms': round(total_us / 1000, 1)}
+        self.check_budget(result, options)
+
+    def run_startup(self, flags=()):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'vacationdesktop.settings'))
+        proc = subprocess.run(
+            [sys.executable, *flags, '-c', STARTUP_CODE],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise CommandError(f'Startup failed:\n{proc.stderr[-2000:]}')
+        return proc
+
+    def report_modules(self, rows, top, sort):
+        index = 1 if sort == 'self' else 2
+        self.stdout.write(f'{"self ms":>9} {"cumul ms":>9}  module')
+        for name, self_us, cumulative_us, depth in sorted(rows, key=lambda row: row[index], reverse=True)[:top]:
+            self.stdout.write(f'{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {name}')
+
+    def report_packages(self, rows, top):
+        packages = defaultdict(lambda: [0, 0])
+        for name, self_us, _, _ in rows:
+            package = packages[name.split('.')[0]]
+            package[0] += self_us
+            package[1] += 1
+        self.stdout.write(f'{"self ms":>9} {"modules":>8}  package')
+        for name, (self_us, count) in sorted(packages.items(), key=lambda item: item[1][0], reverse=True)[:top]:
+            self.stdout.write(f'{self_us / 1000:9.1f} {count:8}  {name}')
+
+    def check_budget(self, result, options):
+        failures = []
+        if options['max_ms'] and result['median_ms'] > options['max_ms']:
+            failures.append(f'median {result["median_ms"]}ms exceeds budget of {options["max_ms"]}ms')
+
+        path = options['baseline']
+        if path and options['save_baseline']:
+            with open(path, 'w') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(f'💾 Baseline saved to {path}')
+        elif path:
+            try:
+                with open(path) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read baseline {path}: {e}')
+            limit = baseline['median_ms'] * (1 + options['tolerance'] / 100)
+            self.stdout.write(
+                f'📊 Baseline: {baseline["median_ms"]}ms, {baseline["modules"]} modules '
+                f'-> now {result["median_ms"]}ms, {result["modules"]} modules'
+            )
+            if result['median_ms'] > limit:
+                failures.append(
+                    f'median {result["median_ms"]}ms is more than {options["tolerance"]:.0f}% '
+                    f'slower than baseline {baseline["median_ms"]}ms'
+                )
+
+        if failures:
+            raise CommandError('Startup regression: ' + '; '.join(failures))
+        if options['max_ms'] or (path and not options['save_baseline']):
+            self.stdout.write(self.style.SUCCESS('✅ Startup within budget'))
@@ -0,0 +1,36 @@
+"""
+Restore a tenant backup, or clone it under a new subdomain
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rbac.tenant_backup import BackupError, restore_tenant
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a backup_tenant directory into the shared database in one transaction (COPY on PostgreSQL). '
+        'With --as, clone it under a new subdomain with new ids. Place it with move_tenant afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Backup directory')
+        parser.add_argument('--as', dest='subdomain', help='Clone under this subdomain')
+        parser.add_argument('--name', help='Name of the cloned tenant')
+        parser.add_argument('--no-media', action='store_true', help='Do not copy the backed-up files')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        self.stdout.write(f'📂 Restoring {options["path"]}')
+        try:
+            tenant = restore_tenant(
+                options['path'], subdomain=options['subdomain'], name=options['name'],
+                include_media=not options['no_media'],
+                log=lambda message: self.stdout.write(f'   📦 {message}'),
+            )
+        except BackupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {tenant.name} ({tenant.subdomain}) restored in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,71 @@
+"""
+Benchmark the key views against a seeded tenant and compare with a baseline
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from rbac.benchmarks import BenchmarkError, compare, load_baseline, run_benchmarks, save_baseline
+from rbac.models import Tenant
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the CRM and helpdesk views through the test client as a seeded tenant '
+        '(see seed_benchmark_data), report p50/p95/p99 latency and query counts, and fail '
+        'when they regress against the stored baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subdomain', default='bench')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', action='append', help='Run only this scenario (repeatable)')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+        parser.add_argument('--no-compare', action='store_true')
+        parser.add_argument('--latency-threshold', type=float, default=25,
+                            help='Allowed p50/p95 slowdown in percent (default 25)')
+        parser.add_argument('--min-delta-ms', type=float, default=5,
+                            help='Slowdowns smaller than this are noise (default 5ms)')
+        parser.add_argument('--query-threshold', type=int, default=0, help='Allowed extra queries (default 0)')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        try:
+            tenant = Tenant.objects.using(options['database']).get(subdomain=options['subdomain'])
+        except Tenant.DoesNotExist:
+            raise CommandError(f'Tenant "{options["subdomain"]}" not found; run seed_benchmark_data first')
+
+        self.stdout.write(f'⏱️  Benchmarking as "{tenant.subdomain}", {options["iterations"]} requests per scenario')
+        setup_test_environment()
+        try:
+            results = run_benchmarks(
+                tenant, iterations=options['iterations'], warmup=options['warmup'], only=options['only'],
+                using=options['database'], log=lambda message: self.stdout.write(f'   {message}'),
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            teardown_test_environment()
+
+        if options['save_baseline']:
+            save_baseline(options['baseline'], results, tenant, using=options['database'])
+            self.stdout.write(self.style.SUCCESS(f'💾 Baseline saved to {options["baseline"]}'))
+            return
+        if options['no_compare']:
+            return
+
+        try:
+            baseline = load_baseline(options['baseline'])
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        regressions = compare(results, baseline, options['latency_threshold'], options['min_delta_ms'],
+                              options['query_threshold'])
+        for name, message in regressions:
+            self.stdout.write(self.style.ERROR(f'   ❌ {name}: {message}'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+        self.stdout.write(self.style.SUCCESS(f'✅ No regressions against {options["baseline"]}'))
@@ -9,10 +9,13 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         """Create cache table if using database cache"""
         
-        # Check if we're using database cache
-        cache_config = settings.CACHES.get('default', {})
+        # Check if we're using database cache (directly or behind the local tier)
+        cache_config = next(
+            (c for c in settings.CACHES.values() if c.get('BACKEND') == 'django.core.cache.backends.db.DatabaseCache'),
+            {}
+        )
         
-        if cache_config.get('BACKEND') == 'django.core.cache.backends.db.DatabaseCache':
+        if cache_config:
             table_name = cache_config.get('LOCATION', 'django_cache_table')
             
             self.stdout.write(f'Setting up cache table: {table_name}')
@@ -1,29 +1,233 @@
 """
-Middleware for handling impersonation tokens
+Middleware for request logging, metrics, profiling and N+1 detection, impersonation tokens, tenant scoping and
+database routing
 """
+import functools
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async, async_to_sync
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+from django_otp.middleware import OTPMiddleware
+from whitenoise.middleware import WhiteNoiseMiddleware
 from .impersonation_tokens import ImpersonationTokenManager
+from .db_routers import begin_replica_reads, end_replica_reads
+from .nplusone import begin_detection, end_detection
+from .profiling import profile_requested, profile_trigger, save_profile, start_profile, stop_profile
+from .request_metrics import begin_request_stats, end_request_stats, record_request
+from .structured_logging import REQUEST_ID_HEADER, begin_request_log, end_request_log, log_request
+from .tenant_context import (
+    get_request_tenant_id, set_current_tenant_id, reset_current_tenant_id,
+    get_tenant_database, rls_enabled, apply_tenant_guc, apply_rls_bypass
+)
 
 User = get_user_model()
 
-class ImpersonationTokenMiddleware:
-    """Middleware to handle impersonation via URL tokens"""
+class RequestLogMiddleware:
+    """
+    Give each request an id (X-Request-ID) that every log record made while
+    it runs carries, and log one `rbac.requests` line with its status and
+    duration (rbac/structured_logging.py).
+
+    Comes before RequestMetricsMiddleware so query budget warnings carry the id.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        token = begin_request_log(request)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+            response[REQUEST_ID_HEADER] = request.request_id
+        finally:
+            log_request(request, response, time.perf_counter() - start)
+            end_request_log(token)
+        return response
+    
+    async def __acall__(self, request):
+        token = begin_request_log(request)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+            response[REQUEST_ID_HEADER] = request.request_id
+        finally:
+            log_request(request, response, time.perf_counter() - start)
+            end_request_log(token)
+        return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Record each request's query count, DB time, cache hits and misses,
+    template time and latency under its URL name and tenant
+    (rbac/request_metrics.py), and enforce @query_budget.
+
+    Must come before SessionMiddleware so session and user lookups count.
+    Streaming response bodies are produced after it returns and are not timed.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        token = begin_request_stats()
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = end_request_stats(token)
+            record_request(request, response, stats, time.perf_counter() - start)
+        return response
+    
+    async def __acall__(self, request):
+        # Threads running the request's ORM calls copy this context and so
+        # update the same RequestStats
+        token = begin_request_stats()
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            stats = end_request_stats(token)
+            record_request(request, response, stats, time.perf_counter() - start)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Take a sampling profile of requests that ask for one (X-Profile-Token,
+    or ?_profile=1 from a system user, profiled from process_view on) and of
+    a random PROFILE_SAMPLE_RATE share of requests (rbac/profiling.py).
+
+    Must come right after RequestMetricsMiddleware, whose per-request trace
+    supplies the SQL statements and template renders.
+    """
+    
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
     
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        trigger = profile_trigger(request)
+        request.profiling = start_profile(trigger) if trigger else None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request.profiling:
+                stop_profile(request.profiling[1])
+        if not request.profiling:
+            return response
+        return self.add_profile_header(response, save_profile(request.profiling[0], request, response))
+    
+    async def __acall__(self, request):
+        trigger = profile_trigger(request)
+        request.profiling = start_profile(trigger, sample_current_thread=False) if trigger else None
+        try:
+            response = await self.get_response(request)
+        finally:
+            if request.profiling:
+                await sync_to_async(stop_profile, thread_sensitive=False)(request.profiling[1])
+        if not request.profiling:
+            return response
+        profile_id = await sync_to_async(save_profile, thread_sensitive=False)(request.profiling[0], request, response)
+        return self.add_profile_header(response, profile_id)
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # ?_profile=1 is checked once AuthenticationMiddleware has set
+        # request.user, so other users' requests never start a sampler
+        if request.profiling is None and profile_requested(request):
+            request.profiling = start_profile('param', sample_current_thread=not iscoroutinefunction(self))
+        return None
+    
+    def add_profile_header(self, response, profile_id):
+        if profile_id:
+            response['X-Profile-Id'] = profile_id
+        return response
+
+
+class NPlusOneMiddleware:
+    """
+    With NPLUSONE_DETECT, report SELECTs a request repeats (rbac/nplusone.py):
+    logged, or raised as NPlusOneDetected with NPLUSONE_RAISE.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        if not settings.NPLUSONE_DETECT:
+            return self.get_response(request)
+        token = begin_detection()
+        try:
+            response = self.get_response(request)
+        finally:
+            detector = end_detection(token)
+        detector.report(f'{request.method} {request.path}')
+        return response
+    
+    async def __acall__(self, request):
+        if not settings.NPLUSONE_DETECT:
+            return await self.get_response(request)
+        token = begin_detection()
+        try:
+            response = await self.get_response(request)
+        finally:
+            detector = end_detection(token)
+        detector.report(f'{request.method} {request.path}')
+        return response
+
+
+class ImpersonationTokenMiddleware(MiddlewareMixin):
+    """Middleware to handle impersonation via URL tokens"""
+    
+    def process_request(self, request):
         # Check for impersonation token in URL or POST data
         impersonation_token = request.GET.get('imp_token') or request.POST.get('imp_token')
         
         if impersonation_token:
             self.handle_impersonation_token(request, impersonation_token)
-        
-        response = self.get_response(request)
-        return response
     
     def handle_impersonation_token(self, request, token):
         """Handle impersonation token with robust error handling"""
@@ -34,9 +238,10 @@ class ImpersonationTokenMiddleware:
                 # Don't show error message as token might be expired - just silently ignore
                 return
             
-            # Get the target user to impersonate
-            target_user = User.objects.get(id=token_data['target_user_id'])
-            original_user = User.objects.get(id=token_data['original_user_id'])
+            # The target comes from the identity cached with the token; the
+            # original user is rarely needed, so only load it on access
+            target_user = ImpersonationTokenManager.get_target_user(token_data)
+            original_user = SimpleLazyObject(lambda: User.objects.get(id=token_data['original_user_id']))
             
             # Store impersonation info in request for this session
             request.impersonation_data = {
@@ -63,4 +268,206 @@ class ImpersonationTokenMiddleware:
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f"Impersonation middleware error: {e}")
-            return
\ No newline at end of file
+            return
+
+
+class TenantRLSMiddleware:
+    """
+    Bind the requesting tenant to the request and, when TENANT_RLS_ENABLED is
+    set on PostgreSQL, run the request in a transaction with
+    SET LOCAL app.tenant_id so row-level security policies enforce isolation.
+    System users (no tenant) run with SET LOCAL app.bypass_rls instead;
+    anonymous requests get neither and see no tenant rows.
+
+    Must come after ImpersonationTokenMiddleware so impersonated requests are
+    scoped to the impersonated user's tenant.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        tenant_id = get_request_tenant_id(request)
+        context_token = set_current_tenant_id(tenant_id)
+        
+        try:
+            alias = self.get_rls_alias(request, tenant_id)
+            if alias is None:
+                return self.get_response(request)
+            return self.run_in_tenant_transaction(request, tenant_id, alias, self.get_response)
+        finally:
+            reset_current_tenant_id(context_token)
+    
+    async def __acall__(self, request):
+        # Loading request.user touches the session and database
+        tenant_id = await sync_to_async(get_request_tenant_id)(request)
+        context_token = set_current_tenant_id(tenant_id)
+        
+        try:
+            alias = self.get_rls_alias(request, tenant_id)
+            if alias is None:
+                return await self.get_response(request)
+            # The transaction lives on the request's sync thread; ORM calls made
+            # by async views via sync_to_async are routed back to that thread.
+            return await sync_to_async(self.run_in_tenant_transaction)(
+                request, tenant_id, alias, async_to_sync(self.get_response)
+            )
+        finally:
+            reset_current_tenant_id(context_token)
+    
+    def get_rls_alias(self, request, tenant_id):
+        """Database alias to scope with SET LOCAL, or None when RLS does not apply"""
+        if tenant_id:
+            alias = get_tenant_database(tenant_id)
+        elif getattr(request, 'user', None) is not None and request.user.is_authenticated:
+            # System users (no tenant) are not restricted by the policies
+            alias = DEFAULT_DB_ALIAS
+        else:
+            return None
+        return alias if rls_enabled(connections[alias]) else None
+    
+    def run_in_tenant_transaction(self, request, tenant_id, alias, get_response):
+        with transaction.atomic(using=alias):
+            if tenant_id:
+                apply_tenant_guc(connections[alias], tenant_id, local=True)
+            else:
+                apply_rls_bypass(connections[alias], local=True)
+            response = get_response(request)
+            if response.status_code >= 500:
+                transaction.set_rollback(True, using=alias)
+            return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Allow replica reads for GET/HEAD requests and pin the browser to the
+    primary for REPLICA_PIN_SECONDS after any request that wrote, so users
+    always read their own writes.
+    """
+    
+    PIN_COOKIE = 'vd_primary_until'
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            return self.get_response(request)
+        
+        token = begin_replica_reads(self.allow_replica_reads(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = end_replica_reads(token)
+        return self.process_pin(request, response, wrote)
+    
+    async def __acall__(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            return await self.get_response(request)
+        
+        # The routing state is a mutable dict, so writes made in sync_to_async
+        # threads (which run in a copy of this context) are still seen here
+        token = begin_replica_reads(self.allow_replica_reads(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = end_replica_reads(token)
+        return self.process_pin(request, response, wrote)
+    
+    def allow_replica_reads(self, request):
+        return request.method in ('GET', 'HEAD') and not self.is_pinned(request)
+    
+    def process_pin(self, request, response, wrote):
+        if wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+            response.set_cookie(
+                self.PIN_COOKIE, str(time.time() + pin_seconds),
+                max_age=pin_seconds, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+    
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(self.PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+class AsyncOTPMiddleware(OTPMiddleware):
+    """
+    django_otp's OTPMiddleware, usable without a thread hop under ASGI.
+
+    The upstream middleware is sync-only, which forces Django to run every
+    async view behind a blocked worker thread. Wrapping request.user is lazy
+    and does no I/O, so it is safe to do directly in either mode.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+    
+    async def __acall__(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None:
+            request.user = SimpleLazyObject(
+                functools.partial(self._verify_user, request, user)
+            )
+        return await self.get_response(request)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise static file serving, usable without a thread hop under ASGI.
+
+    WhiteNoise 6.5 is sync-only; as the outermost middleware that would
+    force the whole stack (and every async view) onto a worker thread.
+    Non-static requests are a dictionary lookup and pass straight through.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+    
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
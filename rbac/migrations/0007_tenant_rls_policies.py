@@ -0,0 +1,49 @@
+# Row-level security policies for tenant-owned rbac tables (PostgreSQL only)
+
+from django.db import migrations
+
+# Tenant bound by rbac.middleware.TenantRLSMiddleware; empty/unset means system scope
+TENANT_SCOPE = "NULLIF(current_setting('app.tenant_id', true), '')"
+
+TENANT_TABLES = {
+    'audit_logs': f"tenant_id = {TENANT_SCOPE}::uuid",
+    'client_accounts': f"tenant_id = {TENANT_SCOPE}::uuid",
+    'sales_opportunities': f"tenant_id = {TENANT_SCOPE}::uuid",
+    'support_tickets': f"tenant_id = {TENANT_SCOPE}::uuid",
+    'onboarding_tasks': f"tenant_id = {TENANT_SCOPE}::uuid",
+    # Child rows inherit visibility from their (RLS-filtered) parent ticket
+    'ticket_comments': "EXISTS (SELECT 1 FROM support_tickets p WHERE p.id = ticket_comments.ticket_id)",
+}
+
+
+def create_policies(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, predicate in TENANT_TABLES.items():
+        condition = f"{TENANT_SCOPE} IS NULL OR ({predicate})"
+        schema_editor.execute(f'ALTER TABLE {table} ENABLE ROW LEVEL SECURITY')
+        schema_editor.execute(f'ALTER TABLE {table} FORCE ROW LEVEL SECURITY')
+        schema_editor.execute(f'DROP POLICY IF EXISTS tenant_isolation ON {table}')
+        schema_editor.execute(
+            f'CREATE POLICY tenant_isolation ON {table} USING ({condition}) WITH CHECK ({condition})'
+        )
+
+
+def drop_policies(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TENANT_TABLES:
+        schema_editor.execute(f'DROP POLICY IF EXISTS tenant_isolation ON {table}')
+        schema_editor.execute(f'ALTER TABLE {table} NO FORCE ROW LEVEL SECURITY')
+        schema_editor.execute(f'ALTER TABLE {table} DISABLE ROW LEVEL SECURITY')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rbac', '0006_add_tenant_logo'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_policies, drop_policies),
+    ]
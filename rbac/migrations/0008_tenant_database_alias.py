@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rbac', '0007_tenant_rls_policies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='database_alias',
+            field=models.CharField(blank=True, default='', help_text="Alias from TENANT_DATABASES holding this tenant's CRM data; blank uses the shared database", max_length=64),
+        ),
+    ]
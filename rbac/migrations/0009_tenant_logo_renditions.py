@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rbac', '0008_tenant_database_alias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='logo_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the logo, filled in by rbac.logo_renditions after upload'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Indexes for the admin changelists' date hierarchies and default ordering.
+# audit_logs is large and written on every request, so on PostgreSQL the
+# indexes are built with CREATE INDEX CONCURRENTLY (outside a transaction).
+
+from django.db import migrations, models
+
+INDEXES = [
+    ('auditlog', models.Index(fields=['created_at'], name='audit_logs_created_at_idx')),
+    ('salesopportunity', models.Index(fields=['expected_close_date'], name='sales_opps_close_date_idx')),
+    ('supportticket', models.Index(fields=['created_at'], name='support_tickets_created_idx')),
+]
+
+
+def concurrently(schema_editor):
+    return {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+
+
+def add_indexes(apps, schema_editor):
+    for model_name, index in INDEXES:
+        schema_editor.add_index(apps.get_model('rbac', model_name), index, **concurrently(schema_editor))
+
+
+def remove_indexes(apps, schema_editor):
+    for model_name, index in INDEXES:
+        schema_editor.remove_index(apps.get_model('rbac', model_name), index, **concurrently(schema_editor))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('rbac', '0009_tenant_logo_renditions'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index)
+                for model_name, index in INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_indexes, remove_indexes),
+            ],
+        ),
+    ]
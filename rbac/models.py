@@ -46,10 +46,26 @@ class Tenant(models.Model):
     
     # Branding
     logo = models.ImageField(upload_to='tenant_logos/', blank=True, null=True)
+    logo_renditions = models.JSONField(
+        default=dict, blank=True, editable=False,
+        help_text='Resized copies of the logo, filled in by rbac.logo_renditions after upload'
+    )
+    
+    # Data placement - large tenants can live in their own schema or database
+    database_alias = models.CharField(
+        max_length=64, blank=True, default='',
+        help_text='Alias from TENANT_DATABASES holding this tenant\'s CRM data; blank uses the shared database'
+    )
     
     class Meta:
         db_table = 'tenants'
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Placement may have changed - reload the router's tenant map
+        from .tenant_context import invalidate_tenant_databases
+        invalidate_tenant_databases()
+    
     def __str__(self):
         return self.name
 
@@ -222,6 +238,9 @@ class AuditLog(models.Model):
     class Meta:
         db_table = 'audit_logs'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='audit_logs_created_at_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user} - {self.action} at {self.created_at}"
@@ -346,6 +365,9 @@ class SalesOpportunity(models.Model):
         db_table = 'sales_opportunities'
         ordering = ['-created_at']
         verbose_name_plural = 'Sales Opportunities'
+        indexes = [
+            models.Index(fields=['expected_close_date'], name='sales_opps_close_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.get_stage_display()}"
@@ -417,6 +439,9 @@ class SupportTicket(models.Model):
     class Meta:
         db_table = 'support_tickets'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='support_tickets_created_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.ticket_number:
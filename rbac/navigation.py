@@ -0,0 +1,103 @@
+"""
+Cached navbar menu for base.html
+
+The menu only depends on the user's role, financial access, tenant and whether
+the request is impersonating, so it is rendered once per combination and
+reused. Role/permission changes bump a global version; tenant changes bump the
+tenant's key version (rbac.cache_backends).
+"""
+import hashlib
+import logging
+
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from .cache_backends import tenant_cache_key
+
+logger = logging.getLogger(__name__)
+
+NAVIGATION_TEMPLATE = 'rbac/navigation_menu.html'
+NAVIGATION_VERSION_KEY = 'navigation:version'
+NAVIGATION_CACHE_TIMEOUT = 60 * 60
+
+_template_hash = None
+
+
+def template_version():
+    """Hash of the menu template, so a deploy that changes it never serves old fragments"""
+    global _template_hash
+    if _template_hash is None:
+        source = get_template(NAVIGATION_TEMPLATE).template.source
+        _template_hash = hashlib.sha1(source.encode()).hexdigest()[:12]
+    return _template_hash
+
+
+def navigation_version():
+    version = cache.get(NAVIGATION_VERSION_KEY)
+    if version is None:
+        cache.add(NAVIGATION_VERSION_KEY, 1, timeout=None)
+        version = 1
+    return version
+
+
+def invalidate_navigation():
+    try:
+        cache.incr(NAVIGATION_VERSION_KEY)
+    except ValueError:
+        cache.set(NAVIGATION_VERSION_KEY, 2, timeout=None)
+
+
+def role_permission_codenames(role_id, version):
+    key = f'navigation:v{version}:role:{role_id}:permissions'
+    codenames = cache.get(key)
+    if codenames is None:
+        from .models import Permission
+        codenames = set(
+            Permission.objects.filter(rolepermission__role_id=role_id).values_list('codename', flat=True)
+        )
+        cache.set(key, codenames, NAVIGATION_CACHE_TIMEOUT)
+    return codenames
+
+
+def can_access_financial_data(user, version):
+    """User.can_access_financial_data() with the role's permissions served from the cache"""
+    if user.role.name == 'CLIENT_USER':
+        return user.has_financial_access
+    return 'view_financial_data' in role_permission_codenames(user.role_id, version)
+
+
+def render_navigation_menu(request, user):
+    version = navigation_version()
+    context = {
+        'role_name': user.role.name,
+        'is_system_role': user.role.is_system_role,
+        'financial_access': can_access_financial_data(user, version),
+        # Same test as the impersonation banner
+        'impersonating': bool(request and request.GET.get('imp_token')),
+    }
+    key = tenant_cache_key(
+        user.tenant_id or 'system',
+        f'navigation:v{version}:{template_version()}:{user.role_id}:'
+        f'{int(context["financial_access"])}:{int(context["impersonating"])}',
+    )
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(NAVIGATION_TEMPLATE, context)
+        cache.set(key, html, NAVIGATION_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def _on_permissions_changed(sender, **kwargs):
+    try:
+        invalidate_navigation()
+    except Exception as e:
+        logger.error(f"Failed to invalidate cached navigation: {e}")
+
+
+def connect_signals():
+    from django.db.models.signals import post_save, post_delete
+    from .models import Role, Permission, RolePermission
+    for model in (Role, Permission, RolePermission):
+        post_save.connect(_on_permissions_changed, sender=model, dispatch_uid=f'navigation_{model.__name__}_saved')
+        post_delete.connect(_on_permissions_changed, sender=model, dispatch_uid=f'navigation_{model.__name__}_deleted')
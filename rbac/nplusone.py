@@ -0,0 +1,168 @@
+"""
+N+1 query detection for development and CI
+
+A database wrapper (installed on every connection, like the request metrics
+one) fingerprints each SELECT while a detector is bound: parameters are
+already separate, numbers and quoted literals become ?, and IN lists
+collapse. Per request (NPlusOneMiddleware) or per block (detect_nplusone()),
+it flags statement shapes run NPLUSONE_THRESHOLD or more times, which is
+what a lazy relation or model __str__ read in a loop looks like, with the
+template line and the project code line that issued the repeats. Cache
+traffic (request_metrics.is_cache_query) is not fingerprinted: repeated
+DatabaseCache lookups are cache misses, not N+1s.
+Findings are logged, and raise NPlusOneDetected when NPLUSONE_RAISE is set
+(as rbac/test_runner.py does for test runs), so CI fails on new N+1s.
+"""
+import contextlib
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.base import Node
+
+from .request_metrics import is_cache_query
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('nplusone_detector', default=None)
+
+RENDER_ANNOTATED = Node.render_annotated.__code__
+# The database wrappers themselves
+SKIPPED_FILES = tuple(os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                      for name in ('nplusone.py', 'request_metrics.py'))
+
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r'\bIN \((?:[^()]*)\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneDetected(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """The statement's shape: literals as ?, IN lists collapsed, whitespace folded"""
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = LITERAL.sub('?', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def query_origin():
+    """(template:line, file:line in function) of the project code running the current query"""
+    template = code = None
+    frame = sys._getframe(1)
+    base = str(settings.BASE_DIR)
+    while frame is not None and (template is None or code is None):
+        if template is None and frame.f_code is RENDER_ANNOTATED:
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                template = f'{origin.template_name or origin.name}:{token.lineno}'
+        elif code is None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(base) and 'site-packages' not in filename and filename not in SKIPPED_FILES:
+                code = f'{filename[len(base) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return template, code
+
+
+class Finding:
+    __slots__ = ('count', 'distinct', 'sql', 'template', 'code')
+
+    def __init__(self, count, distinct, sql, template, code):
+        self.count = count
+        self.distinct = distinct
+        self.sql = sql
+        self.template = template
+        self.code = code
+
+    def __str__(self):
+        where = ', '.join(filter(None, (self.template, self.code))) or 'unknown origin'
+        label = 'identical queries' if self.distinct == 1 else f'similar queries ({self.distinct} distinct)'
+        return f'{self.count} {label} from {where}: {self.sql[:300]}'
+
+
+class NPlusOneDetector:
+    """Repeated SELECT shapes seen while bound (see detect_nplusone)"""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold or settings.NPLUSONE_THRESHOLD
+        self.shapes = Counter()
+        self.parameters = {}
+        self.origins = {}
+
+    def record(self, sql, params):
+        if not sql.lstrip()[:6].upper() == 'SELECT':
+            return
+        shape = fingerprint(sql)
+        self.shapes[shape] += 1
+        self.parameters.setdefault(shape, set()).add(repr(params))
+        # Where the second run came from is where the repeats come from
+        if self.shapes[shape] == 2:
+            self.origins[shape] = query_origin()
+
+    def findings(self):
+        found = [
+            Finding(count, len(self.parameters[shape]), shape, *self.origins[shape])
+            for shape, count in self.shapes.items() if count >= self.threshold
+        ]
+        return sorted(found, key=lambda finding: finding.count, reverse=True)
+
+    def report(self, label):
+        """Log the findings; raise NPlusOneDetected if there are any and NPLUSONE_RAISE is set"""
+        found = self.findings()
+        if not found:
+            return found
+        message = f'{label}: ' + '; '.join(str(finding) for finding in found)
+        if settings.NPLUSONE_RAISE:
+            raise NPlusOneDetected(message)
+        logger.warning(message, extra={'nplusone': [str(finding) for finding in found]})
+        return found
+
+
+def detect_queries(execute, sql, params, many, context):
+    """connection.execute_wrapper feeding the bound detector"""
+    detector = _current.get()
+    if detector is not None and not many and not is_cache_query(sql, context['connection']):
+        detector.record(sql, params)
+    return execute(sql, params, many, context)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    if detect_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, detect_queries)
+
+
+def connect_signals():
+    from django.db.backends.signals import connection_created
+    connection_created.connect(_on_connection_created, dispatch_uid='rbac_nplusone_connection')
+
+
+@contextlib.contextmanager
+def detect_nplusone(label='block', threshold=None):
+    """
+    Bind a detector for the block and report its findings at the end, e.g.
+    in a test: `with detect_nplusone('client import'): import_rows(...)`
+    """
+    detector = NPlusOneDetector(threshold)
+    token = _current.set(detector)
+    try:
+        yield detector
+    finally:
+        _current.reset(token)
+    detector.report(label)
+
+
+def begin_detection():
+    return _current.set(NPlusOneDetector())
+
+
+def end_detection(token):
+    detector = _current.get()
+    _current.reset(token)
+    return detector
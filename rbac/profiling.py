@@ -0,0 +1,277 @@
+"""
+On-demand sampling profiles of single requests
+
+ProfilingMiddleware profiles a request when it carries the X-Profile-Token
+header (PROFILER_TOKEN), when a system user adds ?_profile=1 to the URL (from
+the view on: the user is only known after AuthenticationMiddleware), or at
+random for PROFILE_SAMPLE_RATE of requests. While the request runs, a
+sampler thread records the request thread's Python stack every
+PROFILE_INTERVAL_MS; the SQL statements (without their parameters) and
+template renders come from the request's RequestStats trace
+(rbac/request_metrics.py). Under ASGI the threads that run the request's ORM
+calls are sampled from their first query on.
+
+Profiles are JSON files in PROFILE_DIR, which keeps the newest
+PROFILE_MAX_FILES. System users browse them at /ops/profiles/ and can
+download the stacks in the folded format read by flamegraph.pl and speedscope.
+"""
+import functools
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import thread as futures_thread
+
+from django.conf import settings
+from django.utils import timezone
+
+from .request_metrics import current_stats, request_labels
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_PARAM = '_profile'
+MAX_EVENTS = 2000
+MAX_SQL_LENGTH = 2000
+PROFILE_ID = re.compile(r'^[0-9TZ]+-[0-9a-f]{8}$')
+# A sync_to_async thread waiting for its next call
+IDLE_CODE = futures_thread._worker.__code__
+
+
+def profile_trigger(request):
+    """Why to profile this request from its start ('header' or 'sample'), or None"""
+    token = settings.PROFILER_TOKEN
+    header = request.headers.get(PROFILE_HEADER)
+    if token and header and hmac.compare_digest(header, token):
+        return 'header'
+    rate = settings.PROFILE_SAMPLE_RATE
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def may_request_profiles(user):
+    """Only system users may profile with ?_profile=1 and browse profiles"""
+    return bool(user and user.is_authenticated and user.role and user.role.is_system_role)
+
+
+def profile_requested(request):
+    """
+    Whether a system user asked for a profile with ?_profile=1; needs
+    request.user, so it is decided just before the view runs
+    """
+    return PROFILE_PARAM in request.GET and may_request_profiles(request.user)
+
+
+@functools.lru_cache(maxsize=4096)
+def frame_label(filename, name, first_line):
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = filename[len(base) + 1:]
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages', 1)[1].lstrip(os.sep)
+    elif filename.startswith(sys.prefix):
+        filename = os.path.basename(filename)
+    return f'{name} ({filename}:{first_line})'
+
+
+class Profile:
+    """Stack samples and traced events of one request"""
+
+    def __init__(self, trigger, sample_current_thread=True):
+        self.trigger = trigger
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.events = []
+        self.dropped_events = 0
+        self.threads = {threading.get_ident()} if sample_current_thread else set()
+
+    def record(self, kind, name, start, seconds, **extra):
+        """Called by the query wrapper and the template backend"""
+        self.threads.add(threading.get_ident())
+        if len(self.events) >= MAX_EVENTS:
+            self.dropped_events += 1
+            return
+        self.events.append({
+            'kind': kind, 'name': name[:MAX_SQL_LENGTH], 'start_ms': round((start - self.started) * 1000, 3),
+            'ms': round(seconds * 1000, 3), **extra,
+        })
+
+    def sample(self, frames):
+        for ident in tuple(self.threads):
+            frame = frames.get(ident)
+            if frame is None or frame.f_code is IDLE_CODE:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(frame_label(code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+
+class Sampler(threading.Thread):
+    """Samples a Profile's threads every `interval` seconds until stopped"""
+
+    def __init__(self, profile, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.profile = profile
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.profile.sample(sys._current_frames())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def start_profile(trigger, sample_current_thread=True):
+    """
+    Start profiling the current request; returns (profile, sampler). Async
+    requests don't sample the event loop thread, which serves other requests too.
+    """
+    profile = Profile(trigger, sample_current_thread)
+    stats = current_stats()
+    if stats is not None:
+        stats.trace = profile
+    sampler = Sampler(profile, settings.PROFILE_INTERVAL_MS / 1000)
+    sampler.start()
+    return profile, sampler
+
+
+def stop_profile(sampler):
+    sampler.stop()
+    stats = current_stats()
+    if stats is not None:
+        stats.trace = None
+
+
+# ============================================================================
+# STORAGE (a bounded ring of files)
+# ============================================================================
+
+def profile_dir():
+    return settings.PROFILE_DIR
+
+
+def save_profile(profile, request, response):
+    """Write the profile to PROFILE_DIR, dropping the oldest beyond PROFILE_MAX_FILES; returns its id"""
+    view, tenant = request_labels(request)
+    user = getattr(request, 'user', None)
+    profile_id = f'{timezone.now().strftime("%Y%m%dT%H%M%S%fZ")}-{uuid.uuid4().hex[:8]}'
+    data = {
+        'id': profile_id,
+        'created_at': timezone.now().isoformat(),
+        'trigger': profile.trigger,
+        'method': request.method,
+        'path': request.path,
+        'view': view,
+        'tenant': tenant,
+        'user': user.username if user is not None and user.is_authenticated else '',
+        'status': response.status_code if response is not None else None,
+        'duration_ms': round((time.perf_counter() - profile.started) * 1000, 3),
+        'interval_ms': settings.PROFILE_INTERVAL_MS,
+        'samples': profile.samples,
+        'stacks': dict(profile.stacks.most_common()),
+        'events': profile.events,
+        'dropped_events': profile.dropped_events,
+    }
+    directory = profile_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{profile_id}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(f'{path}.tmp', path)
+        prune_profiles(directory)
+    except OSError as e:
+        logger.warning(f'Could not write profile to {directory}: {e}')
+        return None
+    return profile_id
+
+
+def profile_files(directory=None):
+    """Profile file names, newest first"""
+    directory = directory or profile_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted((name for name in names if name.endswith('.json')), reverse=True)
+
+
+def prune_profiles(directory):
+    for name in profile_files(directory)[settings.PROFILE_MAX_FILES:]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def load_profile(profile_id):
+    """The stored profile, or None"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(profile_dir(), f'{profile_id}.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first"""
+    summaries = []
+    for name in profile_files():
+        data = load_profile(name[:-len('.json')])
+        if data is None:
+            continue
+        sql = [event for event in data['events'] if event['kind'] == 'sql']
+        summaries.append({
+            key: data[key] for key in ('id', 'created_at', 'trigger', 'method', 'path', 'view', 'tenant',
+                                       'user', 'status', 'duration_ms', 'samples')
+        } | {'queries': len(sql), 'sql_ms': round(sum(event['ms'] for event in sql), 3)})
+    return summaries
+
+
+# ============================================================================
+# ANALYSIS
+# ============================================================================
+
+def folded_stacks(data):
+    """The stacks in the folded format (`frame;frame;frame count` per line)"""
+    return ''.join(f'{stack} {count}\n' for stack, count in data['stacks'].items())
+
+
+def top_functions(data, limit=25):
+    """[(frame, self samples, total samples)] by total samples"""
+    own, total = Counter(), Counter()
+    for stack, count in data['stacks'].items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [(frame, own[frame], count) for frame, count in total.most_common(limit)]
+
+
+def grouped_queries(data):
+    """[(sql, executions, total ms)] by total time, so repeated statements stand out"""
+    groups = {}
+    for event in data['events']:
+        if event['kind'] == 'sql':
+            count, ms = groups.get(event['name'], (0, 0.0))
+            groups[event['name']] = (count + 1, ms + event['ms'])
+    return sorted(((sql, count, round(ms, 3)) for sql, (count, ms) in groups.items()),
+                  key=lambda row: row[2], reverse=True)
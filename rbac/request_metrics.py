@@ -0,0 +1,427 @@
+"""
+Per-request instrumentation: query count, DB time, cache hits and misses,
+template render time and latency, aggregated by URL name and tenant and
+exported in the Prometheus text format
+
+RequestMetricsMiddleware binds a RequestStats to the request's context; the
+database wrapper (installed on every connection), TieredCache and the
+DjangoTemplates backend below add to it. Each worker keeps its totals in
+memory and, when METRICS_DIR is set, writes them to <METRICS_DIR>/<pid>.json
+every METRICS_FLUSH_SECONDS so the endpoint can add up all workers.
+gunicorn.conf.py folds the files of exited workers into retired.json.
+
+Views declare a query budget with @query_budget(n) (rbac/decorators.py).
+Queries against DatabaseCache tables, and everything the shared tier of
+TieredCache runs, are cache traffic: they add to DB time but not to the
+query count, so budgets hold whichever cache backend is configured. Requests that exceed it are logged and counted, and raise QueryBudgetExceeded
+when QUERY_BUDGET_STRICT is set (as rbac/test_runner.py does for test runs).
+"""
+import atexit
+import contextlib
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.backends import django as django_backend
+from django.utils.functional import SimpleLazyObject, empty
+
+from .tenant_context import get_request_tenant_id
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+RETIRED_FILE = 'retired.json'
+UNRESOLVED_VIEW = '<unresolved>'
+
+_current = ContextVar('request_stats', default=None)
+_cache_queries = ContextVar('cache_queries', default=False)
+_lock = threading.Lock()
+_series = {}
+_last_flush = time.monotonic()
+_cache_tables = None
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    """What one request spent; shared with the threads it runs ORM calls in"""
+
+    __slots__ = ('queries', 'db_seconds', 'cache_hits', 'cache_misses', 'template_seconds', 'rendering', 'trace')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_seconds = 0.0
+        self.rendering = False
+        # Set by the profiler (rbac/profiling.py) to record every query and render
+        self.trace = None
+
+
+def begin_request_stats():
+    """Bind a new RequestStats to the current context; returns a token for end_request_stats"""
+    return _current.set(RequestStats())
+
+
+def end_request_stats(token):
+    """Unbind the stats bound by begin_request_stats and return them"""
+    stats = _current.get()
+    _current.reset(token)
+    return stats
+
+
+def current_stats():
+    """The RequestStats of the request being served, or None"""
+    return _current.get()
+
+
+# ============================================================================
+# COLLECTORS
+# ============================================================================
+
+def cache_tables():
+    """The tables of the configured DatabaseCache caches"""
+    global _cache_tables
+    if _cache_tables is None:
+        _cache_tables = tuple(
+            params['LOCATION'] for params in settings.CACHES.values()
+            if params['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache'
+        )
+    return _cache_tables
+
+
+@contextlib.contextmanager
+def cache_queries():
+    """Queries run in the block are cache traffic, including the savepoints of DatabaseCache writes"""
+    token = _cache_queries.set(True)
+    try:
+        yield
+    finally:
+        _cache_queries.reset(token)
+
+
+def is_cache_query(sql, connection):
+    """Whether `sql` runs inside cache_queries() or against a DatabaseCache table"""
+    return _cache_queries.get() or any(connection.ops.quote_name(table) in sql for table in cache_tables())
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrapper that times every query of a request"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        if not is_cache_query(sql, context['connection']):
+            stats.queries += 1
+        stats.db_seconds += seconds
+        if stats.trace is not None:
+            stats.trace.record('sql', sql, start, seconds, alias=context['connection'].alias, many=many)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    # First in line, so execute_wrapper() blocks entered earlier pop their own wrapper
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def record_cache(hits, misses):
+    stats = _current.get()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+class TimedTemplate:
+    """A backend template whose top-level renders count as template time (every render when traced)"""
+
+    def __init__(self, template):
+        self.backend_template = template
+
+    def __getattr__(self, name):
+        return getattr(self.backend_template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None or (stats.rendering and stats.trace is None):
+            return self.backend_template.render(context, request)
+        outermost = not stats.rendering
+        stats.rendering = True
+        start = time.perf_counter()
+        try:
+            return self.backend_template.render(context, request)
+        finally:
+            seconds = time.perf_counter() - start
+            if outermost:
+                stats.template_seconds += seconds
+                stats.rendering = False
+            if stats.trace is not None:
+                stats.trace.record('template', self.origin.template_name or '<string>', start, seconds)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend, timing renders for the request metrics"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def _on_setting_changed(sender, setting, **kwargs):
+    global _cache_tables
+    if setting == 'CACHES':
+        _cache_tables = None
+
+
+def connect_signals():
+    from django.core.signals import setting_changed
+    from django.db.backends.signals import connection_created
+    connection_created.connect(_on_connection_created, dispatch_uid='rbac_request_metrics_connection')
+    setting_changed.connect(_on_setting_changed, dispatch_uid='rbac_request_metrics_setting')
+    atexit.register(flush)
+
+
+# ============================================================================
+# AGGREGATION
+# ============================================================================
+
+def new_series():
+    return {
+        'requests': {},
+        'seconds': 0.0,
+        'seconds_buckets': [0] * len(LATENCY_BUCKETS),
+        'queries': 0,
+        'queries_buckets': [0] * len(QUERY_BUCKETS),
+        'db_seconds': 0.0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'template_seconds': 0.0,
+        'over_budget': 0,
+    }
+
+
+def observe(buckets, bounds, value):
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            buckets[i] += 1
+
+
+def request_labels(request):
+    """(URL name, tenant id) of a finished request"""
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else UNRESOLVED_VIEW
+    tenant = ''
+    if getattr(settings, 'METRICS_PER_TENANT', True):
+        user = getattr(request, 'user', None)
+        # Only read a user something already loaded; loading it here could query
+        # the database from async code
+        if not (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+            tenant = get_request_tenant_id(request) or ''
+    return view, tenant
+
+
+def record_request(request, response, stats, seconds):
+    view, tenant = request_labels(request)
+    status = f'{response.status_code // 100}xx' if response is not None else '5xx'
+    budget = getattr(getattr(request, 'resolver_match', None), 'func', None)
+    budget = getattr(budget, 'query_budget', None)
+    over_budget = budget is not None and stats.queries > budget
+
+    with _lock:
+        series = _series.get((view, tenant))
+        if series is None:
+            series = _series[(view, tenant)] = new_series()
+        series['requests'][status] = series['requests'].get(status, 0) + 1
+        series['seconds'] += seconds
+        observe(series['seconds_buckets'], LATENCY_BUCKETS, seconds)
+        series['queries'] += stats.queries
+        observe(series['queries_buckets'], QUERY_BUCKETS, stats.queries)
+        series['db_seconds'] += stats.db_seconds
+        series['cache_hits'] += stats.cache_hits
+        series['cache_misses'] += stats.cache_misses
+        series['template_seconds'] += stats.template_seconds
+        series['over_budget'] += over_budget
+    maybe_flush()
+
+    if over_budget:
+        message = f'{view} ran {stats.queries} queries (budget {budget}) for {request.method} {request.path}'
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(f'Query budget exceeded: {message}')
+
+
+def merge_series(total, series):
+    for key, value in series.items():
+        if key == 'requests':
+            for status, count in value.items():
+                total[key][status] = total[key].get(status, 0) + count
+        elif isinstance(value, list):
+            total[key] = [a + b for a, b in zip(total[key], value)]
+        else:
+            total[key] += value
+
+
+def snapshot():
+    """[(view, tenant, series)] of this worker"""
+    with _lock:
+        return [(view, tenant, json.loads(json.dumps(series))) for (view, tenant), series in _series.items()]
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', '')
+
+
+def write_json(path, rows):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(rows, f)
+    os.replace(tmp, path)
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def flush():
+    """Write this worker's totals to METRICS_DIR"""
+    global _last_flush
+    directory = metrics_dir()
+    _last_flush = time.monotonic()
+    if not directory or not _series:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        write_json(os.path.join(directory, f'{os.getpid()}.json'), snapshot())
+    except OSError as e:
+        logger.warning(f'Could not write request metrics to {directory}: {e}')
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_SECONDS', 10):
+        flush()
+
+
+def retire_worker(pid, directory=None):
+    """Fold an exited worker's file into retired.json (run by the gunicorn master)"""
+    directory = directory or metrics_dir()
+    path = os.path.join(directory, f'{pid}.json')
+    rows = read_json(path) if directory else []
+    if not rows:
+        return
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    write_json(retired_path, combine([read_json(retired_path), rows]))
+    os.remove(path)
+
+
+def clear_metrics_dir(directory=None):
+    """Start counting from zero (run by the gunicorn master on start)"""
+    directory = directory or metrics_dir()
+    for path in glob.glob(os.path.join(directory, '*.json')) if directory else []:
+        os.remove(path)
+
+
+def combine(row_lists):
+    totals = {}
+    for rows in row_lists:
+        for view, tenant, series in rows:
+            merge_series(totals.setdefault((view, tenant), new_series()), series)
+    return [(view, tenant, series) for (view, tenant), series in sorted(totals.items())]
+
+
+def collect():
+    """Totals of every worker (this one's live, the others' from METRICS_DIR)"""
+    row_lists = [snapshot()]
+    directory = metrics_dir()
+    if directory:
+        own = f'{os.getpid()}.json'
+        row_lists.extend(
+            read_json(path) for path in glob.glob(os.path.join(directory, '*.json'))
+            if os.path.basename(path) != own
+        )
+    return combine(row_lists)
+
+
+# ============================================================================
+# PROMETHEUS TEXT FORMAT
+# ============================================================================
+
+METRICS = (
+    ('vd_http_requests_total', 'counter', 'Requests served'),
+    ('vd_http_request_duration_seconds', 'histogram', 'Time to produce the response'),
+    ('vd_http_request_queries', 'histogram', 'Database queries per request'),
+    ('vd_db_query_seconds_total', 'counter', 'Time spent in database queries'),
+    ('vd_cache_hits_total', 'counter', 'Cache reads that found a value'),
+    ('vd_cache_misses_total', 'counter', 'Cache reads that found nothing'),
+    ('vd_template_render_seconds_total', 'counter', 'Time spent rendering templates (including their queries)'),
+    ('vd_query_budget_exceeded_total', 'counter', 'Requests that ran more queries than their view allows'),
+)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def label_text(**labels):
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+
+def histogram_lines(name, labels, bounds, buckets, total, count):
+    lines = [
+        f'{name}_bucket{label_text(**labels, le=bound)} {cumulative}'
+        for bound, cumulative in zip(bounds, buckets)
+    ]
+    lines.append(f'{name}_bucket{label_text(**labels, le="+Inf")} {count}')
+    lines.append(f'{name}_sum{label_text(**labels)} {total}')
+    lines.append(f'{name}_count{label_text(**labels)} {count}')
+    return lines
+
+
+def render_prometheus(rows=None):
+    rows = collect() if rows is None else rows
+    samples = {name: [] for name, _, _ in METRICS}
+    for view, tenant, series in rows:
+        labels = {'view': view, 'tenant': tenant}
+        count = sum(series['requests'].values())
+        for status, requests in sorted(series['requests'].items()):
+            samples['vd_http_requests_total'].append(
+                f'vd_http_requests_total{label_text(**labels, status=status)} {requests}'
+            )
+        samples['vd_http_request_duration_seconds'] += histogram_lines(
+            'vd_http_request_duration_seconds', labels, LATENCY_BUCKETS, series['seconds_buckets'],
+            round(series['seconds'], 6), count,
+        )
+        samples['vd_http_request_queries'] += histogram_lines(
+            'vd_http_request_queries', labels, QUERY_BUCKETS, series['queries_buckets'], series['queries'], count,
+        )
+        for name, key in (
+            ('vd_db_query_seconds_total', 'db_seconds'), ('vd_cache_hits_total', 'cache_hits'),
+            ('vd_cache_misses_total', 'cache_misses'), ('vd_template_render_seconds_total', 'template_seconds'),
+            ('vd_query_budget_exceeded_total', 'over_budget'),
+        ):
+            value = series[key]
+            samples[name].append(f'{name}{label_text(**labels)} {round(value, 6) if isinstance(value, float) else value}')
+
+    lines = []
+    for name, kind, help_text in METRICS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(samples[name])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,309 @@
+"""
+Stateless impersonation tokens (IMPERSONATION_TOKEN_BACKEND = 'signed')
+
+The token itself is a compressed payload signed with SECRET_KEY
+(django.core.signing) holding the original/target user ids, a snapshot of the
+target user and role, and the expiry, so validating one is pure CPU. The
+payload is readable by anyone holding the token, which travels in URLs, so
+names and email addresses stay out of it: they are read from the database and
+kept per worker for IMPERSONATION_LOCAL_CACHE_SECONDS.
+
+Early invalidation (stop_impersonation, deactivated users, changed users) is
+recorded as exact entries in the cache plus bits in a bloom filter. Each worker
+keeps a copy of the filter, refreshed every IMPERSONATION_LOCAL_CACHE_SECONDS,
+and only asks the cache when the filter reports a possible match.
+"""
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+
+from .impersonation_tokens import (
+    REVOKED_COUNT_UNKNOWN, TOKEN_EXPIRY, LocalTokenCache, get_token_store, local_cache_seconds, restore_instance,
+    snapshot_instance, token_id,
+)
+
+logger = logging.getLogger(__name__)
+
+SIGNING_SALT = 'rbac.impersonation'
+USER_SNAPSHOT_FIELDS = (
+    'id', 'tenant', 'role', 'is_active', 'is_staff', 'is_superuser', 'is_tenant_admin',
+    'has_financial_access', 'mfa_enabled', 'user_timezone',
+)
+# Personal data, never put in the token
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name', 'email')
+ROLE_SNAPSHOT_FIELDS = ('id', 'name', 'hierarchy_level', 'is_system_role')
+BLOOM_BITS = 1 << 16  # 8KB per filter; ~1% false positives at ~6,800 entries
+BLOOM_HASHES = 4
+
+
+def bloom_positions(key):
+    digest = hashlib.sha256(key.encode()).digest()
+    return [int.from_bytes(digest[i * 4:i * 4 + 4], 'big') % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+
+def bits_contain(bits, positions):
+    for position in positions:
+        byte = position // 8
+        if not bits or byte >= len(bits) or not bits[byte] & (0x80 >> (position % 8)):
+            return False
+    return True
+
+
+def pick_fields(snapshot, model, names):
+    attnames = {model._meta.get_field(name).attname for name in names}
+    return {key: value for key, value in snapshot.items() if key in attnames}
+
+
+_user_names = LocalTokenCache()
+
+
+def user_names(user_ids):
+    """{user id: {name field: value}} for the users that exist, from this worker's cache or one query"""
+    names = {}
+    missing = []
+    for user_id in user_ids:
+        cached = _user_names.get(user_id)
+        if cached is None:
+            missing.append(user_id)
+        else:
+            names[user_id] = cached
+    if missing:
+        for row in get_user_model().objects.filter(id__in=missing).values('id', *USER_NAME_FIELDS):
+            user_id = str(row.pop('id'))
+            names[user_id] = row
+            _user_names.set(user_id, row, local_cache_seconds())
+    return names
+
+
+class TokenData(dict):
+    """get_token_data() result; the usernames, which the token doesn't carry, load on first access"""
+
+    def __missing__(self, key):
+        if key not in ('original_username', 'target_username'):
+            raise KeyError(key)
+        names = user_names([self['original_user_id'], self['target_user_id']])
+        for party in ('original', 'target'):
+            self[f'{party}_username'] = names.get(self[f'{party}_user_id'], {}).get('username', '')
+        return self[key]
+
+
+class RevocationFilter:
+    """
+    Worker-local copy of the revocation bloom filters. Filters rotate every
+    TOKEN_EXPIRY; the current and previous one cover every live token.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = 0
+        self._filters = {}
+
+    @staticmethod
+    def generations():
+        current = int(time.time() // TOKEN_EXPIRY.total_seconds())
+        return [current, current - 1]
+
+    def refresh(self):
+        if time.monotonic() - self._loaded_at < local_cache_seconds():
+            return
+        generations = self.generations()
+        try:
+            values = get_token_store().get_bits([f'bloom:{generation}' for generation in generations])
+        except Exception as e:
+            # Fail closed: every lookup goes to the cache until the filter loads
+            logger.error(f"Failed to load impersonation revocation filter: {e}")
+            filters = {generation: None for generation in generations}
+        else:
+            filters = {generation: bytearray(value or b'') for generation, value in zip(generations, values)}
+        with self._lock:
+            self._filters = filters
+            self._loaded_at = time.monotonic()
+
+    def might_contain(self, key):
+        self.refresh()
+        positions = bloom_positions(key)
+        with self._lock:
+            filters = list(self._filters.values())
+        return any(bits is None or bits_contain(bits, positions) for bits in filters)
+
+    def add(self, key):
+        """Record the key in the shared filter, and locally so this worker sees it at once"""
+        generation = self.generations()[0]
+        positions = bloom_positions(key)
+        get_token_store().set_bits(f'bloom:{generation}', positions, 2 * TOKEN_EXPIRY.total_seconds())
+        with self._lock:
+            bits = self._filters.setdefault(generation, bytearray())
+            if bits is None:
+                return
+            for position in positions:
+                if len(bits) <= position // 8:
+                    bits.extend(bytes(position // 8 + 1 - len(bits)))
+                bits[position // 8] |= 0x80 >> (position % 8)
+
+    def clear(self):
+        with self._lock:
+            self._filters = {}
+            self._loaded_at = 0
+
+
+class SignedTokenBackend:
+    """Signed, self-contained tokens with a bloom-filtered revocation list"""
+
+    TOKEN_EXPIRY = TOKEN_EXPIRY
+    IDENTITY_CHANGED_KEY = 'identity_changed_at'
+
+    _revocations = RevocationFilter()
+    _identity_changed = (0, None)  # (monotonic time read, timestamp)
+
+    token_id = staticmethod(token_id)
+
+    @classmethod
+    def create_token(cls, original_user_id, target_user_id, original_username, target_username):
+        """Create a signed token; nothing is stored"""
+        User = get_user_model()
+        target = User.objects.select_related('role').get(id=target_user_id)
+        now = time.time()
+        payload = {
+            'o': str(original_user_id),
+            't': str(target_user_id),
+            'u': pick_fields(snapshot_instance(target), User, USER_SNAPSHOT_FIELDS),
+            'r': pick_fields(snapshot_instance(target.role), type(target.role), ROLE_SNAPSHOT_FIELDS),
+            'c': round(now, 3),
+            'e': int(now + TOKEN_EXPIRY.total_seconds()),
+        }
+        token = signing.dumps(payload, salt=SIGNING_SALT, compress=True)
+        logger.info(f"Created signed impersonation token {token_id(token)[:12]} for {original_username} -> {target_username}")
+        return token
+
+    @classmethod
+    def get_token_data(cls, token):
+        """Verify the signature and expiry, then check the revocation filter"""
+        if not token:
+            return None
+        try:
+            payload = signing.loads(token, salt=SIGNING_SALT)
+            created, expires = payload['c'], payload['e']
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+        if time.time() > expires:
+            return None
+
+        tid = token_id(token)
+        token_key = f'token:{tid}'
+        if cls.is_revoked(token_key, payload):
+            return None
+
+        return TokenData({
+            'original_user_id': payload['o'],
+            'target_user_id': payload['t'],
+            'created_at': datetime.fromtimestamp(created, tz=timezone.utc).isoformat(),
+            'expires_at': datetime.fromtimestamp(expires, tz=timezone.utc).isoformat(),
+            'token_id': tid,
+            'created_ts': created,
+            'user': payload['u'],
+            'role': payload['r'],
+        })
+
+    @classmethod
+    def is_revoked(cls, token_key, payload):
+        candidates = [key for key in (token_key, f'user:{payload["o"]}', f'user:{payload["t"]}')
+                      if cls._revocations.might_contain(key)]
+        if not candidates:
+            return False
+        # Possible match (or false positive) - confirm against the exact entries
+        values = get_token_store().get_many([f'revoked:{key}' for key in candidates])
+        for key, revoked_at in zip(candidates, values):
+            if revoked_at is not None and (key == token_key or payload['c'] <= float(revoked_at)):
+                return True
+        return False
+
+    @classmethod
+    def get_target_user(cls, token_data):
+        """
+        The target user rebuilt from the snapshot in the token and its names
+        (tenant loads on access). Falls back to the database when the user, a
+        role or a tenant changed after the token was issued.
+        """
+        User = get_user_model()
+        if cls.identity_is_stale(token_data):
+            return User.objects.select_related('role', 'tenant').get(id=token_data['target_user_id'])
+
+        from .models import Role
+        names = user_names([token_data['target_user_id']]).get(token_data['target_user_id'])
+        if names is None:
+            raise User.DoesNotExist(f"User {token_data['target_user_id']} no longer exists")
+        user = restore_instance(User, {**token_data['user'], **names})
+        user.role = restore_instance(Role, token_data['role'])
+        return user
+
+    @classmethod
+    def identity_is_stale(cls, token_data):
+        # Role/tenant changes are global and re-read at most every
+        # IMPERSONATION_LOCAL_CACHE_SECONDS; user changes go through the filter
+        changed = [cls.identity_changed_at()]
+        stale_key = f'stale:{token_data["target_user_id"]}'
+        if cls._revocations.might_contain(stale_key):
+            changed.append(get_token_store().get_many([f'revoked:{stale_key}'])[0])
+        return any(value is not None and token_data['created_ts'] <= float(value) for value in changed)
+
+    @classmethod
+    def identity_changed_at(cls):
+        loaded_at, value = cls._identity_changed
+        if time.monotonic() - loaded_at >= local_cache_seconds():
+            try:
+                value = get_token_store().get_many([cls.IDENTITY_CHANGED_KEY])[0]
+            except Exception as e:
+                logger.error(f"Failed to read impersonation identity timestamp: {e}")
+                value = time.time()  # Treat every snapshot as stale
+            cls._identity_changed = (time.monotonic(), value)
+        return value
+
+    @classmethod
+    def revoke(cls, key):
+        """Record an exact revocation entry and its bloom filter bits"""
+        get_token_store().set(f'revoked:{key}', repr(time.time()), TOKEN_EXPIRY.total_seconds())
+        cls._revocations.add(key)
+
+    @classmethod
+    def invalidate_token(cls, token):
+        """Invalidate a token (e.g. from stop_impersonation) before it expires"""
+        if token:
+            cls.revoke(f'token:{token_id(token)}')
+
+    @classmethod
+    def extend_token(cls, token, additional_hours=2):
+        """Signed tokens carry their expiry, so they can't be extended in place"""
+        return False
+
+    @classmethod
+    def get_user_tokens(cls, user_id):
+        """Nothing is stored per token, so there is nothing to list"""
+        return []
+
+    @classmethod
+    def revoke_user_tokens(cls, user_id):
+        """
+        Reject every token issued so far where the user is either party.
+        Issued tokens are not recorded, so returns REVOKED_COUNT_UNKNOWN.
+        """
+        cls.revoke(f'user:{user_id}')
+        logger.info(f"Revoked signed impersonation tokens for user {user_id}")
+        return REVOKED_COUNT_UNKNOWN
+
+    @classmethod
+    def user_changed(cls, user_id, revoke):
+        _user_names.delete(str(user_id))
+        if revoke:
+            cls.revoke_user_tokens(user_id)
+        else:
+            cls.revoke(f'stale:{user_id}')
+
+    @classmethod
+    def identity_models_changed(cls):
+        get_token_store().set(cls.IDENTITY_CHANGED_KEY, repr(time.time()), TOKEN_EXPIRY.total_seconds())
+        cls._identity_changed = (0, None)
@@ -0,0 +1,261 @@
+"""
+Structured logging: JSON lines with request context, written off the request thread
+
+RequestLogMiddleware gives each request an id (a well-formed incoming
+X-Request-ID, or a new one), returns it in X-Request-ID and logs one
+`rbac.requests` line per request with its status and duration.
+RequestContextFilter adds request_id, view, tenant and user_id to every
+record logged while the request runs, on any thread serving it.
+
+queue_handler() builds the handler LOGGING uses: records are queued and a
+QueueListener thread formats and writes them, so log I/O never blocks a
+request. When LOG_QUEUE_SIZE records are waiting, new ones are dropped and
+counted. SamplingFilter keeps only a share of the records below WARNING
+from the loggers in LOG_SAMPLING, whole requests at a time.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from django.utils.functional import SimpleLazyObject, empty
+
+_request = contextvars.ContextVar('log_request', default=None)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{8,128}$')
+CONTEXT_FIELDS = ('request_id', 'view', 'tenant', 'user_id')
+
+# Attributes of every LogRecord; anything else came from `extra=`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+access_logger = logging.getLogger('rbac.requests')
+
+
+# ============================================================================
+# REQUEST CONTEXT
+# ============================================================================
+
+def begin_request_log(request):
+    """Bind the request to the current context; returns a token for end_request_log"""
+    request_id = request.headers.get(REQUEST_ID_HEADER, '')
+    if not VALID_REQUEST_ID.match(request_id):
+        request_id = uuid.uuid4().hex
+    request.request_id = request_id
+    return _request.set(request)
+
+
+def end_request_log(token):
+    _request.reset(token)
+
+
+def request_context(request=None):
+    """request_id, view, tenant and user_id of `request` or the current request, or {}"""
+    request = request or _request.get()
+    if request is None or not hasattr(request, 'request_id'):
+        return {}
+    from .tenant_context import get_current_tenant_id, get_request_tenant_id
+
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'user', None)
+    # Only read a user something already loaded; loading it here could query
+    # the database from async code
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        user = None
+    tenant = get_current_tenant_id()
+    if tenant is None and user is not None:
+        # Outside TenantRLSMiddleware, e.g. the access log line
+        tenant = get_request_tenant_id(request)
+    return {
+        'request_id': request.request_id,
+        'view': match.view_name if match else None,
+        'tenant': tenant,
+        'user_id': str(user.pk) if user is not None and user.is_authenticated else None,
+    }
+
+
+def log_request(request, response, seconds):
+    """The access log line of a finished request"""
+    status = response.status_code if response is not None else 500
+    level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO
+    access_logger.log(level, f'{request.method} {request.path} {status}', extra={
+        'method': request.method,
+        'path': request.path,
+        'status': status,
+        'duration_ms': round(seconds * 1000, 1),
+    })
+
+
+# ============================================================================
+# FILTERS AND FORMATTERS
+# ============================================================================
+
+class RequestContextFilter(logging.Filter):
+    """Adds the current request's context fields to each record"""
+
+    def filter(self, record):
+        # django.request logs after the middleware has returned, with the request attached
+        context = request_context(getattr(record, 'request', None))
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps `rate` of the DEBUG/INFO records of each configured logger (and its
+    children), e.g. rates='django.db.backends=0.01,rbac.requests=0.1'.
+    Records of a request are kept or dropped together.
+    """
+
+    def __init__(self, rates=''):
+        super().__init__()
+        self.rates = {}
+        for item in filter(None, (part.strip() for part in rates.split(','))):
+            name, _, rate = item.partition('=')
+            self.rates[name.strip()] = float(rate)
+
+    def rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rate(record.name)
+        if rate >= 1:
+            return True
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            return zlib.crc32(request_id.encode()) / 0xFFFFFFFF < rate
+        return random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request context and `extra=` fields"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and value is not None and key not in data:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The plain format for development, with the request id when there is one"""
+
+    def format(self, record):
+        text = super().format(record)
+        request_id = getattr(record, 'request_id', None)
+        return f'{text} [{request_id[:8]}]' if request_id else text
+
+
+# ============================================================================
+# NON-BLOCKING HANDLER
+# ============================================================================
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Queues records without waiting for `listener`; drops them when the queue is full"""
+
+    def __init__(self, records, listener):
+        super().__init__(records)
+        self.listener = listener
+        self.dropped = 0
+        listener.start()
+        _handlers.append(self)
+
+    def prepare(self, record):
+        # Render the message and traceback here: arguments and frames must not
+        # be read on another thread after the request has moved on
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        # The request's fields are in the record already (RequestContextFilter)
+        record.__dict__.pop('request', None)
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f'Dropped {self.dropped} log records while the log queue was full',
+                }))
+                self.dropped = 0
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=1.0):
+        """Wait (up to `timeout` seconds) until the listener has written every queued record"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def close(self):
+        # Reconfiguring logging closes the old handlers
+        if self in _handlers:
+            _handlers.remove(self)
+            self.flush()
+            if self.listener._thread is not None:
+                self.listener.stop()
+        super().close()
+
+
+_handlers = []
+
+
+def restart_listeners_after_fork():
+    # Forked workers (gunicorn --preload) inherit the queues but not the
+    # listener threads. Each gets a new queue: the inherited one still lists
+    # the parent's listener as its waiter, so puts would never wake the new
+    # thread, and the records queued before the fork are the parent's to write
+    for handler in _handlers:
+        handler.queue = handler.listener.queue = queue.Queue(maxsize=handler.queue.maxsize)
+        handler.listener._thread = None
+        handler.listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=restart_listeners_after_fork)
+
+
+def queue_handler(format='json', queue_size=10000, stream=None):
+    """
+    A QueueHandler whose listener thread writes to stderr in the 'json' or
+    'text' format (the LOGGING handler factory)
+    """
+    target = logging.StreamHandler(stream or sys.stderr)
+    if format == 'json':
+        target.setFormatter(JSONFormatter())
+    else:
+        target.setFormatter(TextFormatter('{levelname} {asctime} {name} {message}', style='{'))
+    records = queue.Queue(maxsize=queue_size)
+    return QueueHandler(records, logging.handlers.QueueListener(records, target))
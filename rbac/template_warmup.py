@@ -0,0 +1,116 @@
+"""
+Parse every template ahead of time
+
+warm_templates() fills the cached template loader (and Jinja2's template and
+bytecode caches) so no request pays for parsing; gunicorn.conf.py runs it in the
+master when preloading, so every worker starts with compiled templates.
+check_template() backs the precompile_templates build check.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.defaulttags import URLNode
+from django.template.loader_tags import ExtendsNode, IncludeNode
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SUFFIXES = ('.html', '.txt', '.xml')
+
+
+def template_dirs(backend):
+    """Directories searched by a backend's loaders, in lookup order"""
+    if not isinstance(backend, DjangoTemplates):
+        return [str(d) for d in backend.template_dirs]
+    dirs = []
+    for loader in backend.engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            dirs.extend(str(d) for d in inner.get_dirs())
+    return list(dict.fromkeys(dirs))
+
+
+def template_names(backend, project_only=False):
+    """Relative names of every template a backend can load; the first directory wins, as in lookups"""
+    names = {}
+    for directory in template_dirs(backend):
+        if project_only and not directory.startswith(str(settings.BASE_DIR)):
+            continue
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith(TEMPLATE_SUFFIXES):
+                    name = os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/')
+                    names.setdefault(name, os.path.join(root, filename))
+    return dict(sorted(names.items()))
+
+
+def literal(filter_expression):
+    """The string an {% extends/include/url %} argument always evaluates to, or None"""
+    if filter_expression is None or filter_expression.filters or not isinstance(filter_expression.var, str):
+        return None
+    return str(filter_expression.var)
+
+
+def url_name_exists(name):
+    resolver = get_resolver()
+    *namespaces, view_name = name.split(':')
+    for namespace in namespaces:
+        if namespace in resolver.app_dict:
+            namespace = resolver.app_dict[namespace][0]
+        if namespace not in resolver.namespace_dict:
+            return False
+        resolver = resolver.namespace_dict[namespace][1]
+    return view_name in resolver.reverse_dict
+
+
+def check_template(backend, name, references=True):
+    """
+    Compile one template; returns a list of problems (empty when it is fine).
+    references=False skips the extends/include/url checks, for templates from
+    other apps that are only used in setups this project doesn't have.
+    """
+    try:
+        template = backend.get_template(name)
+    except TemplateSyntaxError as e:
+        return [f'syntax error: {e}']
+    except TemplateDoesNotExist as e:
+        return [f'not found: {e}']
+    except Exception as e:
+        # Jinja2 raises its own exception types
+        return [f'{type(e).__name__}: {e}']
+
+    if not references or not isinstance(backend, DjangoTemplates):
+        return []
+
+    problems = []
+    nodelist = template.template.nodelist
+    # extends/include/url arguments are only resolved when rendering, so check
+    # the ones that are plain strings now
+    for node in nodelist.get_nodes_by_type(ExtendsNode) + nodelist.get_nodes_by_type(IncludeNode):
+        target = literal(node.parent_name if isinstance(node, ExtendsNode) else node.template)
+        if target:
+            try:
+                backend.engine.find_template(target)
+            except TemplateDoesNotExist:
+                problems.append(f'{"extends" if isinstance(node, ExtendsNode) else "includes"} missing template "{target}"')
+    for node in nodelist.get_nodes_by_type(URLNode):
+        view_name = literal(node.view_name)
+        if view_name and not url_name_exists(view_name):
+            problems.append(f'{{% url %}} names unknown view "{view_name}"')
+    return problems
+
+
+def warm_templates():
+    """Compile every template into its engine's cache; returns (compiled, failed)"""
+    compiled = failed = 0
+    for backend in engines.all():
+        for name in template_names(backend):
+            try:
+                backend.get_template(name)
+                compiled += 1
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Could not precompile template {name} ({backend.name}): {e}")
+    return compiled, failed
@@ -3,6 +3,7 @@ Template tags for RBAC and impersonation functionality
 """
 from django import template
 from django.http import QueryDict
+from django.utils.html import format_html
 from ..impersonation import is_impersonating, get_impersonation_info
 
 register = template.Library()
@@ -38,4 +39,43 @@ def add_imp_token(url, request):
 def preserve_impersonation_params(request):
     """Include hidden inputs to preserve impersonation parameters in forms"""
     token = request.GET.get('imp_token')
-    return {'imp_token': token}
\ No newline at end of file
+    return {'imp_token': token}
+
+
+@register.simple_tag(takes_context=True)
+def navigation_menu(context):
+    """Role-dependent navbar menu, rendered once per role/tenant/impersonation state and cached"""
+    from ..navigation import render_navigation_menu
+    return render_navigation_menu(context.get('request'), context['user'])
+
+
+@register.simple_tag
+def tenant_logo(tenant, rendition='navbar', alt='', css_class='', style=''):
+    """<img> (in a <picture> with a WebP source when there is one) for a logo rendition; empty without a logo"""
+    from ..logo_renditions import logo_rendition
+    found = logo_rendition(getattr(tenant, 'pk', tenant), rendition)
+    if not found:
+        return ''
+    urls, width, height = found
+    size = format_html(' width="{}" height="{}"', width, height) if width else ''
+    img = format_html('<img src="{}" alt="{}" class="{}" style="{}"{}>', urls['png'], alt, css_class, style, size)
+    if 'webp' not in urls:
+        return img
+    return format_html('<picture><source srcset="{}" type="image/webp">{}</picture>', urls['webp'], img)
+
+
+@register.simple_tag
+def tenant_logo_url(tenant, rendition='email'):
+    """URL of a logo rendition (the original upload until it is generated)"""
+    from ..logo_renditions import logo_url
+    return logo_url(getattr(tenant, 'pk', tenant), rendition)
+
+
+@register.simple_tag
+def tenant_favicon(tenant):
+    """<link rel="icon"> for the tenant's favicon rendition, once generated"""
+    from ..logo_renditions import logo_rendition
+    found = logo_rendition(getattr(tenant, 'pk', tenant), 'favicon')
+    if not found or not found[1]:
+        return ''
+    return format_html('<link rel="icon" type="image/png" href="{}">', found[0]['png'])
@@ -0,0 +1,521 @@
+"""
+Tenant backup and restore
+
+A backup is a directory holding manifest.json (schema, row counts and the
+shared rows the tenant references), one gzipped newline-delimited JSON file
+per table (a JSON array of column values per row, in the column order listed
+in the manifest) and media/ with the tenant's uploaded files.
+
+Backups stream rows with a server-side cursor inside one read-only snapshot
+per database. Restores insert tables in foreign-key order inside a single
+transaction, with COPY on PostgreSQL and batched INSERTs elsewhere. Roles,
+permissions and account statuses are matched by name in the target database
+(and created if missing); users outside the tenant are matched by username.
+
+Restoring under a new subdomain clones the tenant: UUID primary keys are
+rewritten to uuid5(new tenant id, old id), so references stay consistent
+without keeping a map of every row in memory; usernames and invoice numbers
+get the new subdomain as a prefix, and the platform's own records about the
+tenant (audit log, account, opportunities, tickets, onboarding) are left out.
+"""
+import datetime
+import decimal
+import gzip
+import json
+import logging
+import os
+import shutil
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+from business_management.models import Invoice
+from business_management.tenant_data import TENANT_MODELS, iter_values, tenant_queryset
+from .cache_backends import invalidate_tenant_cache
+from .db_routers import TENANT_APPS
+from .models import (
+    AccountStatus, AuditLog, ClientAccount, OnboardingTask, Permission, Role, SalesOpportunity,
+    SupportTicket, Tenant, TicketComment, User, UserPermissionOverride,
+)
+from .tenant_context import get_tenant_database, invalidate_tenant_databases
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 'vacationdesktop-tenant-backup'
+VERSION = 1
+MANIFEST = 'manifest.json'
+MEDIA_DIR = 'media'
+CHUNK_SIZE = 5000
+BATCH_SIZE = 5000
+
+# Every table holding tenant rows, parents before children
+BACKUP_MODELS = [
+    (Tenant, 'pk'),
+    (User, 'tenant'),
+    (UserPermissionOverride, 'user__tenant'),
+    (AuditLog, 'tenant'),
+    (ClientAccount, 'tenant'),
+    (SalesOpportunity, 'tenant'),
+    (SupportTicket, 'tenant'),
+    (TicketComment, 'ticket__tenant'),
+    (OnboardingTask, 'tenant'),
+] + TENANT_MODELS
+
+# The platform's records about the tenant as a customer; not part of a clone
+PLATFORM_MODELS = {AuditLog, ClientAccount, SalesOpportunity, SupportTicket, TicketComment, OnboardingTask}
+
+# Shared rows the tenant references, matched by this unique field on restore
+SHARED_MODELS = {Role: 'name', Permission: 'codename', AccountStatus: 'name'}
+
+# Globally unique columns a clone must not reuse
+CLONE_PREFIXED = {(User, 'username'), (Invoice, 'invoice_number')}
+
+
+class BackupError(Exception):
+    pass
+
+
+def table_file(model):
+    return f'{model._meta.label_lower}.ndjson.gz'
+
+
+def model_database(model, tenant_id):
+    """CRM tables can live in the tenant's own schema/database; rbac tables are shared"""
+    if model._meta.app_label in TENANT_APPS:
+        return get_tenant_database(tenant_id)
+    return DEFAULT_DB_ALIAS
+
+
+def json_default(value):
+    # Unlike DjangoJSONEncoder, keep full microsecond precision
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, decimal.Decimal)):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def encode_row(row):
+    return json.dumps(row, default=json_default, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def applied_migrations(using=DEFAULT_DB_ALIAS):
+    """The latest applied migration of each backed-up app"""
+    latest = {}
+    apps = {model._meta.app_label for model, _ in BACKUP_MODELS}
+    for app_label, name in MigrationRecorder(connections[using]).applied_migrations():
+        if app_label in apps and name > latest.get(app_label, ''):
+            latest[app_label] = name
+    return latest
+
+
+@contextmanager
+def read_snapshot(using):
+    """One consistent, read-only view of the database for the whole backup"""
+    with transaction.atomic(using=using):
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        yield
+
+
+def media_names(field, value):
+    """Storage names of the uploaded files a column value points at"""
+    if isinstance(field, models.FileField):
+        # Client import uploads live in their own storage and are removed once imported
+        if value and field.storage is default_storage:
+            yield value
+    elif field.name == 'logo_renditions' and value:
+        for entry in value.values():
+            if isinstance(entry, dict):
+                yield from (path for key, path in entry.items() if key in ('png', 'webp'))
+
+
+# ============================================================================
+# BACKUP
+# ============================================================================
+
+def backup_tenant(tenant, path, include_media=True, log=None):
+    """Write a backup of `tenant` to the directory `path` and return the manifest"""
+    log = log or logger.info
+    os.makedirs(path, exist_ok=False)
+    media_root = os.path.join(path, MEDIA_DIR)
+    tenant_users = set()
+    shared_ids = {model: set() for model in SHARED_MODELS}
+    external_users = set()
+    media = {'files': 0, 'bytes': 0, 'missing': []}
+    tables = []
+
+    with ExitStack() as stack:
+        snapshots = set()
+        for model, lookup in BACKUP_MODELS:
+            using = model_database(model, tenant.pk)
+            if using not in snapshots:
+                stack.enter_context(read_snapshot(using))
+                snapshots.add(using)
+
+            fields = model._meta.concrete_fields
+            # Column positions to collect references and media from
+            shared_columns = [(i, f.related_model) for i, f in enumerate(fields)
+                              if f.is_relation and f.related_model in SHARED_MODELS]
+            user_columns = [i for i, f in enumerate(fields) if f.is_relation and f.related_model is User]
+            pk_column = fields.index(model._meta.pk)
+            media_columns = [(i, f) for i, f in enumerate(fields)
+                             if isinstance(f, models.FileField) or f.name == 'logo_renditions']
+
+            queryset = tenant_queryset(model, lookup, tenant.pk, using=using)
+            count = 0
+            with gzip.open(os.path.join(path, table_file(model)), 'wt', encoding='utf-8') as f:
+                for row in iter_values(queryset, [field.attname for field in fields], chunk_size=CHUNK_SIZE):
+                    f.write(encode_row(row))
+                    count += 1
+                    if model is User:
+                        tenant_users.add(row[pk_column])
+                    for i, related in shared_columns:
+                        if row[i] is not None:
+                            shared_ids[related].add(row[i])
+                    for i in user_columns:
+                        if row[i] is not None and row[i] not in tenant_users:
+                            external_users.add(row[i])
+                    if include_media:
+                        for i, field in media_columns:
+                            for name in media_names(field, row[i]):
+                                copy_media(name, media_root, media)
+
+            tables.append({
+                'model': model._meta.label_lower,
+                'table': model._meta.db_table,
+                'file': table_file(model),
+                'columns': [field.attname for field in fields],
+                'rows': count,
+            })
+            log(f'{model._meta.db_table}: {count} rows')
+
+    # Users created after the users table was read are referenced but not backed up
+    external_users -= tenant_users
+    manifest = {
+        'format': FORMAT,
+        'version': VERSION,
+        'created_at': timezone.now().isoformat(),
+        'tenant': {'id': str(tenant.pk), 'subdomain': tenant.subdomain, 'name': tenant.name},
+        'migrations': applied_migrations(),
+        'tables': tables,
+        'shared': {
+            model._meta.label_lower: {
+                str(row['id']): row
+                for row in model.objects.filter(pk__in=ids).values(*[f.attname for f in model._meta.concrete_fields])
+            }
+            for model, ids in shared_ids.items()
+        },
+        'external_users': dict(
+            (str(pk), username) for pk, username in User.objects.filter(pk__in=external_users).values_list('id', 'username')
+        ),
+        'media': media,
+    }
+    with open(os.path.join(path, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, default=json_default, indent=2)
+    return manifest
+
+
+def copy_media(name, media_root, media):
+    target = os.path.join(media_root, name)
+    if os.path.exists(target):
+        return
+    try:
+        with default_storage.open(name, 'rb') as source:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                shutil.copyfileobj(source, f, 1024 * 1024)
+    except (FileNotFoundError, OSError):
+        if len(media['missing']) < 100:
+            media['missing'].append(name)
+        return
+    media['files'] += 1
+    media['bytes'] += os.path.getsize(target)
+
+
+# ============================================================================
+# RESTORE
+# ============================================================================
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise BackupError(f'No {MANIFEST} in {path}')
+    if manifest.get('format') != FORMAT or manifest.get('version') != VERSION:
+        raise BackupError(f'{path} is not a version {VERSION} tenant backup')
+    return manifest
+
+
+def read_rows(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class RestorePlan:
+    """How each backed-up value becomes a value in the target database"""
+
+    def __init__(self, manifest, using, subdomain=None, name=None):
+        self.manifest = manifest
+        self.using = using
+        self.old_tenant_id = uuid.UUID(manifest['tenant']['id'])
+        self.clone = bool(subdomain) and subdomain != manifest['tenant']['subdomain']
+        self.subdomain = subdomain or manifest['tenant']['subdomain']
+        self.name = name
+        self.tenant_id = uuid.uuid4() if self.clone else self.old_tenant_id
+        self.tenant_owned = {model for model, _ in BACKUP_MODELS}
+        self.tenant_users = set()
+        self.shared = {model: self.match_shared(model, key) for model, key in SHARED_MODELS.items()}
+        usernames = manifest['external_users']
+        by_username = dict(User.objects.using(using).filter(username__in=usernames.values())
+                           .values_list('username', 'id'))
+        self.external_users = {uuid.UUID(pk): by_username.get(username) for pk, username in usernames.items()}
+        self.skipped = 0
+
+    def match_shared(self, model, key):
+        """old pk -> target pk of the shared rows the backup references, creating missing ones"""
+        rows = self.manifest['shared'].get(model._meta.label_lower, {})
+        existing = dict(model.objects.using(self.using).filter(**{f'{key}__in': [row[key] for row in rows.values()]})
+                        .values_list(key, 'pk'))
+        mapping = {}
+        for old_pk, row in rows.items():
+            if row[key] not in existing:
+                values = {f.attname: f.to_python(row[f.attname]) for f in model._meta.concrete_fields
+                          if not f.primary_key and f.attname in row}
+                existing[row[key]] = model.objects.using(self.using).create(**values).pk
+            mapping[int(old_pk)] = existing[row[key]]
+        return mapping
+
+    def new_id(self, value):
+        return uuid.uuid5(self.tenant_id, str(value)) if self.clone and value is not None else value
+
+    def converters(self, model, columns):
+        """(target field, column index or None, convert) for every column written"""
+        positions = {attname: i for i, attname in enumerate(columns)}
+        missing = set(columns) - {f.attname for f in model._meta.concrete_fields}
+        if missing:
+            raise BackupError(f'{model._meta.db_table} has no column(s) {", ".join(sorted(missing))}; '
+                              f'migrate the target database first')
+        plan = []
+        for field in model._meta.concrete_fields:
+            if field.primary_key and self.clone and not isinstance(field, models.UUIDField):
+                # Integer keys nothing refers to; let the database number them
+                continue
+            plan.append((field, positions.get(field.attname), self.converter(model, field)))
+        return plan
+
+    def converter(self, model, field):
+        to_python = field.to_python
+        if model is Tenant and field.name in ('subdomain', 'name', 'database_alias'):
+            # CRM rows are restored into the shared database; move_tenant can place them again
+            fixed = {'subdomain': self.subdomain, 'name': self.name, 'database_alias': ''}[field.name]
+            return (lambda value: fixed) if fixed is not None else to_python
+        if self.clone and (model, field.name) in CLONE_PREFIXED:
+            limit = field.max_length
+            return lambda value: f'{self.subdomain}-{value}'[:limit]
+        if field.primary_key and model is Tenant:
+            return lambda value: self.tenant_id
+        if field.primary_key:
+            return lambda value: self.new_id(to_python(value))
+        if not field.is_relation:
+            return to_python
+        related = field.related_model
+        if related is Tenant:
+            return lambda value: self.tenant_id if value is not None else None
+        if related in self.shared:
+            mapping = self.shared[related]
+            return lambda value: mapping.get(value) if value is not None else None
+        if related is User:
+            def convert_user(value):
+                value = to_python(value)
+                if value is None or value in self.tenant_users:
+                    return self.new_id(value)
+                return self.external_users.get(value)
+            return convert_user
+        if related in self.tenant_owned:
+            return lambda value: self.new_id(to_python(value))
+        return to_python
+
+    def rows(self, model, table, path):
+        """Converted rows of a table file; rows whose required references are gone are skipped"""
+        plan = self.converters(model, table['columns'])
+        required = [i for i, (field, _, _) in enumerate(plan) if field.is_relation and not field.null]
+        user_id = table['columns'].index(model._meta.pk.attname) if model is User else None
+        for values in read_rows(os.path.join(path, table['file'])):
+            if user_id is not None:
+                self.tenant_users.add(uuid.UUID(values[user_id]))
+            row = [
+                field.get_default() if position is None
+                else None if values[position] is None else convert(values[position])
+                for field, position, convert in plan
+            ]
+            if any(row[i] is None for i in required):
+                self.skipped += 1
+                continue
+            yield row
+
+    def fields(self, model, table):
+        return [field for field, _, _ in self.converters(model, table['columns'])]
+
+
+def copy_text(value, field):
+    """A value in PostgreSQL's COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(field, models.JSONField):
+        value = json.dumps(value, cls=field.encoder)
+    elif value is True or value is False:
+        value = 't' if value else 'f'
+    elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class CopyStream:
+    """File-like reader of rows in COPY text format, for cursor.copy_expert"""
+
+    def __init__(self, rows, fields, batch_size):
+        self.rows = rows
+        self.fields = fields
+        self.batch_size = batch_size
+        self.buffer = ''
+        self.count = 0
+
+    def read(self, size=-1):
+        while not self.buffer:
+            lines = []
+            for row in self.rows:
+                lines.append('\t'.join(copy_text(value, field) for value, field in zip(row, self.fields)))
+                if len(lines) == self.batch_size:
+                    break
+            if not lines:
+                return ''
+            self.count += len(lines)
+            self.buffer = '\n'.join(lines) + '\n'
+        data, self.buffer = self.buffer, ''
+        return data
+
+
+def copy_rows(connection, model, fields, rows, batch_size):
+    """
+    COPY rows into the model's table. PostgreSQL refuses COPY FROM into tables
+    with row-level security, so those are staged in a temporary table and
+    moved with one INSERT ... SELECT.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+    stream = CopyStream(rows, fields, batch_size)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relrowsecurity FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        if not cursor.fetchone()[0]:
+            cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN', stream)
+            return stream.count
+        staging = quote(f'restore_{model._meta.db_table}')
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA'
+        )
+        cursor.copy_expert(f'COPY {staging} ({columns}) FROM STDIN', stream)
+        cursor.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}')
+        cursor.execute(f'DROP TABLE {staging}')
+    return stream.count
+
+
+def insert_rows(using, model, fields, rows, batch_size=BATCH_SIZE):
+    """
+    Insert converted rows with COPY on PostgreSQL, or batched INSERTs elsewhere
+    (not bulk_create, which would overwrite auto_now timestamps). Returns the row count.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return copy_rows(connection, model, fields, rows, batch_size)
+
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    sql = (f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) '
+           f'VALUES ({", ".join(["%s"] * len(fields))})')
+    count = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append([field.get_db_prep_save(value, connection) for value, field in zip(row, fields)])
+            if len(batch) == batch_size:
+                cursor.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    return count
+
+
+def restore_tenant(path, subdomain=None, name=None, include_media=True, using=DEFAULT_DB_ALIAS, log=None):
+    """
+    Restore the backup in `path`, or clone it under a new `subdomain`. Returns
+    the restored tenant. Everything is inserted in one transaction.
+    """
+    log = log or logger.info
+    manifest = read_manifest(path)
+    source = manifest['tenant']
+    subdomain = subdomain or source['subdomain']
+    if Tenant.objects.using(using).filter(subdomain=subdomain).exists():
+        raise BackupError(f'Tenant "{subdomain}" already exists; restore under a new subdomain to clone it')
+    if subdomain == source['subdomain'] and Tenant.objects.using(using).filter(pk=source['id']).exists():
+        raise BackupError(f'Tenant {source["id"]} already exists under another subdomain')
+    migrations = applied_migrations(using)
+    if migrations != manifest['migrations']:
+        log(f'Backup was taken at migrations {manifest["migrations"]}, this database is at {migrations}')
+
+    models_by_label = {model._meta.label_lower: model for model, _ in BACKUP_MODELS}
+    with transaction.atomic(using=using):
+        plan = RestorePlan(manifest, using, subdomain=subdomain, name=name)
+        for table in manifest['tables']:
+            model = models_by_label.get(table['model'])
+            if model is None:
+                raise BackupError(f'Unknown table {table["model"]} in backup')
+            if plan.clone and model in PLATFORM_MODELS:
+                continue
+            count = insert_rows(using, model, plan.fields(model, table), plan.rows(model, table, path))
+            log(f'{model._meta.db_table}: {count} rows')
+
+        if plan.skipped:
+            log(f'Skipped {plan.skipped} rows referencing users that are not in this database')
+        connection = connections[using]
+        sequences = connection.ops.sequence_reset_sql(no_style(), [model for model, _ in BACKUP_MODELS])
+        if sequences:
+            with connection.cursor() as cursor:
+                for sql in sequences:
+                    cursor.execute(sql)
+
+    invalidate_tenant_databases()
+    invalidate_tenant_cache(plan.tenant_id)
+    if include_media:
+        restore_media(path, log)
+    return Tenant.objects.using(using).get(pk=plan.tenant_id)
+
+
+def restore_media(path, log):
+    """Copy the backup's files into media storage, keeping files already there"""
+    media_root = os.path.join(path, MEDIA_DIR)
+    copied = 0
+    for directory, _, filenames in os.walk(media_root):
+        for filename in filenames:
+            full_path = os.path.join(directory, filename)
+            name = os.path.relpath(full_path, media_root).replace(os.sep, '/')
+            if default_storage.exists(name):
+                continue
+            with open(full_path, 'rb') as f:
+                default_storage.save(name, File(f))
+            copied += 1
+    log(f'media: {copied} files copied')
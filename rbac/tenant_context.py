@@ -0,0 +1,112 @@
+"""
+Per-request tenant context shared by middleware, database helpers and logging
+"""
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_current_tenant_id = contextvars.ContextVar('current_tenant_id', default=None)
+
+# PostgreSQL settings read by the row-level security policies: a connection
+# sees the rows of the tenant in app.tenant_id, every row with app.bypass_rls
+# on, and no rows otherwise
+TENANT_GUC = 'app.tenant_id'
+BYPASS_GUC = 'app.bypass_rls'
+
+
+def get_request_tenant_id(request):
+    """Return the tenant id (as a string) the request is acting for, if any"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    tenant_id = getattr(user, 'tenant_id', None)
+    return str(tenant_id) if tenant_id else None
+
+
+def get_current_tenant_id():
+    """Tenant id bound to the current request/task, or None for system scope"""
+    return _current_tenant_id.get()
+
+
+def set_current_tenant_id(tenant_id):
+    """Bind a tenant id to the current context; returns a token for reset"""
+    return _current_tenant_id.set(str(tenant_id) if tenant_id else None)
+
+
+def reset_current_tenant_id(token):
+    """Restore the tenant context captured by set_current_tenant_id"""
+    _current_tenant_id.reset(token)
+
+
+# tenant_id -> database alias for tenants placed outside the shared database
+_tenant_databases = {}
+_tenant_databases_loaded_at = 0.0
+_tenant_databases_lock = threading.Lock()
+TENANT_DATABASE_MAP_TTL = 60  # seconds
+
+
+def invalidate_tenant_databases():
+    """Force the tenant placement map to be reloaded on next lookup"""
+    global _tenant_databases_loaded_at
+    _tenant_databases_loaded_at = 0.0
+
+
+def get_tenant_database(tenant_id):
+    """Database alias holding the given tenant's CRM data"""
+    global _tenant_databases, _tenant_databases_loaded_at
+    if not tenant_id or not getattr(settings, 'TENANT_DATABASE_ALIASES', None):
+        return DEFAULT_DB_ALIAS
+    
+    if time.monotonic() - _tenant_databases_loaded_at > TENANT_DATABASE_MAP_TTL:
+        with _tenant_databases_lock:
+            if time.monotonic() - _tenant_databases_loaded_at > TENANT_DATABASE_MAP_TTL:
+                from .models import Tenant
+                placements = Tenant.objects.using(DEFAULT_DB_ALIAS).exclude(
+                    database_alias=''
+                ).values_list('id', 'database_alias')
+                _tenant_databases = {
+                    str(tid): alias for tid, alias in placements
+                    if alias in settings.DATABASES
+                }
+                _tenant_databases_loaded_at = time.monotonic()
+    
+    return _tenant_databases.get(str(tenant_id), DEFAULT_DB_ALIAS)
+
+
+def get_current_database():
+    """Database alias for the tenant bound to the current context"""
+    return get_tenant_database(get_current_tenant_id())
+
+
+def rls_enabled(connection):
+    """Check whether RLS tenant scoping applies to the given connection"""
+    return getattr(settings, 'TENANT_RLS_ENABLED', False) and connection.vendor == 'postgresql'
+
+
+def apply_tenant_guc(connection, tenant_id, local=True):
+    """
+    Set app.tenant_id on a PostgreSQL connection and turn app.bypass_rls off,
+    so connections opened with the bypass (TENANT_RLS_BYPASS) are scoped too.
+    Without a tenant_id the connection sees no tenant rows.
+
+    With local=True this is equivalent to SET LOCAL and only lasts until the
+    end of the current transaction, which keeps it safe behind PgBouncer in
+    transaction pooling mode.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT set_config(%s, %s, %s), set_config(%s, %s, %s)',
+            [TENANT_GUC, str(tenant_id) if tenant_id else '', local, BYPASS_GUC, 'off', local]
+        )
+
+
+def apply_rls_bypass(connection, local=True):
+    """Let a PostgreSQL connection see every tenant's rows (system admins, maintenance)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT set_config(%s, %s, %s), set_config(%s, %s, %s)',
+            [TENANT_GUC, '', local, BYPASS_GUC, 'on', local]
+        )
@@ -0,0 +1,42 @@
+"""
+Test runner (TEST_RUNNER): Django's, with the checks meant to fail tests
+rather than log switched on for the whole run
+"""
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_SETTINGS = {
+    # Requests over a view's @query_budget raise QueryBudgetExceeded
+    'QUERY_BUDGET_STRICT': True,
+    # Requests repeating a SELECT shape raise NPlusOneDetected
+    'NPLUSONE_DETECT': True,
+    'NPLUSONE_RAISE': True,
+}
+
+# Second database for tests moving tenant data between aliases; created only
+# when a test case lists it in `databases`
+TENANT_TEST_DATABASE = 'tenant_test'
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(**TEST_SETTINGS)
+        self.test_settings.enable()
+
+    def setup_databases(self, **kwargs):
+        databases = settings.DATABASES
+        databases.setdefault(TENANT_TEST_DATABASE, {
+            **databases[DEFAULT_DB_ALIAS],
+            'NAME': f'{databases[DEFAULT_DB_ALIAS]["NAME"]}_{TENANT_TEST_DATABASE}',
+            'TEST': {},
+        })
+        # Fill in the new alias' defaults in the dict the connections read
+        connections.configure_settings(databases)
+        return super().setup_databases(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
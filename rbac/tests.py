@@ -1,3 +1,1008 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib import admin
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.http import Http404, HttpResponse
+from unittest import mock, skipUnless
+
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, features
+
+from custom_media_view import resolve_media_path, serve_media_file
+from business_management.models import (
+    Client, ClientCommunication, ClientDocument, ClientImport, ClientNote, Invoice, InvoiceLineItem,
+    Payment, PaymentSchedule, Trip, TripCommunication, TripItinerary, TripParticipant,
+)
+from business_management import views as crm_views
+from .models import (
+    AccountStatus, AuditLog, ClientAccount, OnboardingTask, Permission, Role, RolePermission,
+    SalesOpportunity, SupportTicket, Tenant, TicketComment, User, UserPermissionOverride,
+)
+from . import navigation
+from .benchmarks import compare, run_benchmarks, seed_tenant
+from .logo_renditions import logo_rendition, logo_url
+from .impersonation_tokens import (
+    REVOKED_COUNT_UNKNOWN, TOKEN_PREFIX, CacheTokenStore, ImpersonationTokenManager, StoredTokenBackend,
+)
+from .management.commands.move_tenant import Command as MoveTenantCommand
+from .nplusone import NPlusOneDetected, detect_nplusone
+from .profiling import list_profiles, load_profile
+from .middleware import TenantRLSMiddleware
+from .test_runner import TENANT_TEST_DATABASE
+from .signed_impersonation_tokens import SIGNING_SALT, SignedTokenBackend
+from .request_metrics import QueryBudgetExceeded, begin_request_stats, end_request_stats
+from .structured_logging import RequestContextFilter, SamplingFilter, queue_handler
+from .tenant_context import BYPASS_GUC, TENANT_GUC, apply_rls_bypass, apply_tenant_guc, get_current_tenant_id
+
+# Queries every changelist may run for its page of rows (session, user,
+# counts, date hierarchy, the rows themselves)
+CHANGELIST_QUERY_BUDGET = 10
+
+# For the classes rendering templates: {% static %} must not need a
+# collectstatic manifest
+plain_static_files = override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+# For the classes whose assertions must not depend on REDIS_URL
+locmem_caches = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'remote': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-remote'},
+})
+
+
+class TenantRLSMiddlewareTests(TestCase):
+    """Tenant requests run scoped to their tenant, system users with the bypass, anonymous ones with neither"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        cls.agent = User.objects.create_user('agent', 'agent@example.com', 'password', tenant=cls.tenant, role=role)
+        cls.system_user = User.objects.create_user('system', 'system@example.com', 'password', role=role)
+
+    def call(self, user, status=200):
+        seen = {}
+
+        def view(request):
+            seen['tenant_id'] = get_current_tenant_id()
+            seen['in_transaction'] = connection.in_atomic_block
+            Client.objects.create(tenant=self.tenant, first_name='Ada', last_name='Client', email='c@example.com')
+            return HttpResponse(status=status)
+
+        request = RequestFactory().get('/')
+        request.user = user
+        with mock.patch('rbac.middleware.rls_enabled', return_value=True), \
+                mock.patch('rbac.middleware.apply_tenant_guc') as tenant_guc, \
+                mock.patch('rbac.middleware.apply_rls_bypass') as bypass:
+            TenantRLSMiddleware(view)(request)
+        self.assertIsNone(get_current_tenant_id())
+        return seen, tenant_guc, bypass
+
+    def test_tenant_request_scoped(self):
+        seen, tenant_guc, bypass = self.call(self.agent)
+        self.assertEqual(seen['tenant_id'], str(self.tenant.id))
+        tenant_guc.assert_called_once_with(connection, str(self.tenant.id), local=True)
+        bypass.assert_not_called()
+
+    def test_system_user_bypasses(self):
+        seen, tenant_guc, bypass = self.call(self.system_user)
+        self.assertIsNone(seen['tenant_id'])
+        bypass.assert_called_once_with(connection, local=True)
+        tenant_guc.assert_not_called()
+
+    def test_anonymous_request_unscoped(self):
+        seen, tenant_guc, bypass = self.call(AnonymousUser())
+        tenant_guc.assert_not_called()
+        bypass.assert_not_called()
+
+    def test_server_error_rolls_back(self):
+        self.call(self.agent, status=500)
+        self.assertFalse(Client.objects.exists())
+        self.call(self.agent)
+        self.assertTrue(Client.objects.exists())
+
+    def test_gucs(self):
+        scoped = mock.MagicMock()
+        apply_tenant_guc(scoped, self.tenant.id)
+        sql, params = scoped.cursor.return_value.__enter__.return_value.execute.call_args.args
+        self.assertEqual(params, [TENANT_GUC, str(self.tenant.id), True, BYPASS_GUC, 'off', True])
+
+        bypassed = mock.MagicMock()
+        apply_rls_bypass(bypassed, local=False)
+        sql, params = bypassed.cursor.return_value.__enter__.return_value.execute.call_args.args
+        self.assertEqual(params, [TENANT_GUC, '', False, BYPASS_GUC, 'on', False])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Row-level security needs PostgreSQL')
+class TenantRLSPolicyTests(TestCase):
+    """The policies show a tenant only its own rows, and no rows without app.tenant_id or the bypass"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenants = [
+            Tenant.objects.create(name=name, subdomain=name.lower(), contact_email=f'{name}@example.com')
+            for name in ('Agency', 'Other')
+        ]
+        cls.clients = [
+            Client.objects.create(tenant=tenant, first_name='Ada', last_name='Client', email='c@example.com')
+            for tenant in cls.tenants
+        ]
+
+    def visible_clients(self, apply_guc):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SELECT rolsuper OR rolbypassrls FROM pg_roles WHERE rolname = current_user')
+            if cursor.fetchone()[0]:
+                # Superusers skip the policies: query as a role of no privileges of its own
+                cursor.execute('CREATE ROLE rls_probe NOLOGIN')
+                cursor.execute('GRANT SELECT ON clients TO rls_probe')
+                cursor.execute('SET LOCAL ROLE rls_probe')
+            apply_guc(connection)
+            cursor.execute('SELECT id FROM clients')
+            visible = {row[0] for row in cursor.fetchall()}
+            transaction.set_rollback(True)
+        return visible
+
+    def test_tenant_sees_only_its_rows(self):
+        agency, other = self.tenants
+        self.assertEqual(
+            self.visible_clients(lambda c: apply_tenant_guc(c, agency.id)), {self.clients[0].id}
+        )
+        self.assertEqual(
+            self.visible_clients(lambda c: apply_tenant_guc(c, other.id)), {self.clients[1].id}
+        )
+
+    def test_fails_closed(self):
+        self.assertEqual(self.visible_clients(lambda c: apply_tenant_guc(c, None)), set())
+        self.assertEqual(
+            self.visible_clients(lambda c: apply_rls_bypass(c)), {client.id for client in self.clients}
+        )
+
+
+@override_settings(TENANT_DATABASE_ALIASES=[TENANT_TEST_DATABASE])
+class MoveTenantTests(TestCase):
+    """A move leaves the target matching the source, writes made during the move included"""
+    databases = {'default', TENANT_TEST_DATABASE}
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        self.client_row = Client.objects.create(
+            tenant=self.tenant, first_name='Ada', last_name='Client', email='c@example.com'
+        )
+        self.trip = Trip.objects.create(client=self.client_row, trip_name='Trip', departure_date=date.today())
+        self.note = ClientNote.objects.create(client=self.client_row, title='Note', content='Call back')
+        self.communication = ClientCommunication.objects.create(
+            client=self.client_row, communication_type='EMAIL', direction='OUTBOUND', subject='Hello', content='Hi'
+        )
+        self.trip_communication = TripCommunication.objects.create(
+            trip=self.trip, communication_type='ITINERARY', subject='Itinerary', content='Attached'
+        )
+        self.stamp = timezone.now() - timedelta(days=30)
+        Client.objects.filter(pk=self.client_row.pk).update(updated_at=self.stamp)
+
+    def move(self, during_wait=None, **options):
+        with mock.patch('rbac.management.commands.move_tenant.time.sleep', side_effect=during_wait):
+            call_command('move_tenant', 'agency', f'--to={TENANT_TEST_DATABASE}', stdout=io.StringIO(), **options)
+
+    def test_writes_during_move_are_copied(self):
+        def stale_worker_writes(seconds):
+            # Models with only created_at, or no timestamps at all
+            ClientCommunication.objects.filter(pk=self.communication.pk).update(subject='Edited')
+            TripCommunication.objects.filter(pk=self.trip_communication.pk).update(content='Edited')
+            ClientNote.objects.filter(pk=self.note.pk).delete()
+            Client.objects.create(tenant=self.tenant, first_name='Late', last_name='Client', email='l@example.com')
+
+        self.move(during_wait=stale_worker_writes)
+
+        target = TENANT_TEST_DATABASE
+        self.assertEqual(Tenant.objects.get(pk=self.tenant.pk).database_alias, target)
+        self.assertEqual(ClientCommunication.objects.using(target).get(pk=self.communication.pk).subject, 'Edited')
+        self.assertEqual(TripCommunication.objects.using(target).get(pk=self.trip_communication.pk).content, 'Edited')
+        self.assertFalse(ClientNote.objects.using(target).exists())
+        self.assertEqual(
+            sorted(Client.objects.using(target).values_list('first_name', flat=True)), ['Ada', 'Late']
+        )
+        # Stored column values are copied, auto_now timestamps included
+        self.assertEqual(Client.objects.using(target).get(pk=self.client_row.pk).updated_at, self.stamp)
+        for model in (Client, Trip, ClientCommunication, TripCommunication):
+            self.assertFalse(model.objects.using('default').exists())
+
+    def test_source_kept_while_still_written(self):
+        def busy_source(*args, **kwargs):
+            ClientCommunication.objects.using('default').filter(pk=self.communication.pk).update(
+                subject=str(timezone.now())
+            )
+            return original(*args, **kwargs)
+
+        original = MoveTenantCommand.catch_up
+        with mock.patch.object(MoveTenantCommand, 'catch_up', autospec=True, side_effect=busy_source):
+            with self.assertRaisesMessage(CommandError, 'source rows were kept'):
+                self.move()
+        self.assertTrue(Client.objects.using('default').filter(pk=self.client_row.pk).exists())
+
+    def test_interrupted_copy_is_resumed(self):
+        # Rows already in the target are not copied twice
+        command = MoveTenantCommand(stdout=io.StringIO())
+        command.copy_shared_rows(self.tenant, 'default', TENANT_TEST_DATABASE)
+        command.insert_missing(Client, TENANT_TEST_DATABASE, [self.client_row])
+        self.move(keep_source=True)
+        self.assertEqual(Client.objects.using(TENANT_TEST_DATABASE).count(), 1)
+        self.assertEqual(Client.objects.using('default').count(), 1)
+
+
+@locmem_caches
+@override_settings(IMPERSONATION_TOKEN_BACKEND='stored')
+class StoredImpersonationTokenTests(TestCase):
+    """Stored tokens validate until revoked, and their cached identity follows role and tenant changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        cls.role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        cls.staff = User.objects.create_user('grace', 'grace@example.com', 'password', role=cls.role)
+        cls.target = User.objects.create_user('ada', 'ada@example.com', 'password', tenant=cls.tenant, role=cls.role)
+        cls.other = User.objects.create_user('alan', 'alan@example.com', 'password', tenant=cls.tenant, role=cls.role)
+
+    def setUp(self):
+        caches['default'].clear()
+        StoredTokenBackend._local.clear()
+        for patcher in (
+            mock.patch('rbac.impersonation_tokens._store', CacheTokenStore(TOKEN_PREFIX, 'default')),
+            mock.patch('rbac.impersonation_tokens.logger'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_token(self, target):
+        return ImpersonationTokenManager.create_token(self.staff.id, target.id, self.staff.username, target.username)
+
+    def target_user(self, token):
+        token_data = ImpersonationTokenManager.get_token_data(token)
+        return ImpersonationTokenManager.get_target_user(token_data)
+
+    def test_issue_and_validate(self):
+        token = self.create_token(self.target)
+        token_data = ImpersonationTokenManager.get_token_data(token)
+        self.assertEqual(
+            (token_data['original_user_id'], token_data['target_user_id']), (str(self.staff.id), str(self.target.id))
+        )
+        # Only the token's hash is stored
+        self.assertIsNone(caches['default'].get(f'{TOKEN_PREFIX}:token:{token}'))
+        self.assertIsNone(ImpersonationTokenManager.get_token_data('not-a-token'))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.target_user(token).tenant, self.tenant)
+        StoredTokenBackend._local.clear()
+        with self.assertNumQueries(0):
+            user = self.target_user(token)
+        self.assertEqual((user.pk, user.role.name, user.tenant.name), (self.target.pk, 'CLIENT_ADMIN', 'Agency'))
+
+    def test_revoke_token(self):
+        token = self.create_token(self.target)
+        other_token = self.create_token(self.other)
+        ImpersonationTokenManager.invalidate_token(token)
+        self.assertIsNone(ImpersonationTokenManager.get_token_data(token))
+        self.assertIsNotNone(ImpersonationTokenManager.get_token_data(other_token))
+
+    def test_revoke_user_tokens(self):
+        token = self.create_token(self.target)
+        other_token = self.create_token(self.other)
+        self.assertEqual(len(ImpersonationTokenManager.get_user_tokens(self.staff.id)), 2)
+
+        self.assertEqual(ImpersonationTokenManager.revoke_user_tokens(self.target.id), 1)
+        self.assertIsNone(ImpersonationTokenManager.get_token_data(token))
+        self.assertIsNotNone(ImpersonationTokenManager.get_token_data(other_token))
+
+        # The impersonator's index still lists the revoked token; only the active one counts
+        self.assertEqual(ImpersonationTokenManager.revoke_user_tokens(self.staff.id), 1)
+        self.assertIsNone(ImpersonationTokenManager.get_token_data(other_token))
+        self.assertEqual(ImpersonationTokenManager.get_user_tokens(self.staff.id), [])
+
+        # Deactivating a user revokes their tokens too
+        token = self.create_token(self.target)
+        self.target.is_active = False
+        self.target.save()
+        self.assertIsNone(ImpersonationTokenManager.get_token_data(token))
+
+    def test_role_and_tenant_changes_refresh_identity(self):
+        token = self.create_token(self.target)
+        self.target_user(token)
+
+        self.role.description = 'Agency owner'
+        self.role.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.target_user(token).role.description, 'Agency owner')
+
+        self.tenant.name = 'Renamed'
+        self.tenant.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.target_user(token).tenant.name, 'Renamed')
+        with self.assertNumQueries(0):
+            self.target_user(token)
+
+        # Changes to the user drop only that user's identity
+        self.target.first_name = 'Ada'
+        self.target.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.target_user(token).first_name, 'Ada')
+
+
+@locmem_caches
+class SignedImpersonationTokenTests(TestCase):
+    """Signed tokens travel in URLs, so they carry ids and flags but no personal data"""
+
+    def test_token_has_no_names(self):
+        role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        staff = User.objects.create_user('grace', 'grace@example.com', 'password', role=role)
+        target = User.objects.create_user(
+            'ada', 'ada@example.com', 'password', role=role, first_name='Ada', last_name='Lovelace'
+        )
+        token = SignedTokenBackend.create_token(staff.id, target.id, staff.username, target.username)
+        payload = json.dumps(signing.loads(token, salt=SIGNING_SALT))
+        for value in ('ada', 'Ada', 'Lovelace', 'example.com', 'grace'):
+            self.assertNotIn(value, payload)
+
+        token_data = SignedTokenBackend.get_token_data(token)
+        with self.assertNumQueries(1):
+            self.assertEqual((token_data['original_username'], token_data['target_username']), ('grace', 'ada'))
+        user = SignedTokenBackend.get_target_user(token_data)
+        self.assertEqual(
+            (user.get_full_name(), user.email, user.role.name), ('Ada Lovelace', 'ada@example.com', 'CLIENT_ADMIN')
+        )
+
+    @override_settings(IMPERSONATION_TOKEN_BACKEND='signed')
+    def test_revoke_user_tokens(self):
+        role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        staff = User.objects.create_user('grace', 'grace@example.com', 'password', role=role)
+        target = User.objects.create_user('ada', 'ada@example.com', 'password', role=role)
+        token = ImpersonationTokenManager.create_token(staff.id, target.id, staff.username, target.username)
+        self.assertIsNotNone(ImpersonationTokenManager.get_token_data(token))
+
+        # Same contract as stored tokens, but the count cannot be known
+        self.assertEqual(ImpersonationTokenManager.revoke_user_tokens(target.id), REVOKED_COUNT_UNKNOWN)
+        self.assertIsNone(ImpersonationTokenManager.get_token_data(token))
+
+
+@plain_static_files
+@locmem_caches
+class NavigationMenuTests(TestCase):
+    """The cached menu is keyed by everything it shows, and re-rendered after role or tenant changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        cls.other_tenant = Tenant.objects.create(name='Other', subdomain='other', contact_email='o@example.com')
+        cls.admin_role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        cls.user_role = Role.objects.create(name='CLIENT_USER', description='Agent', hierarchy_level=5)
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'password', tenant=cls.tenant, role=cls.admin_role)
+        cls.agent = User.objects.create_user('agent', 'agent@example.com', 'password', tenant=cls.tenant, role=cls.user_role)
+
+    def setUp(self):
+        caches['default'].clear()
+        self.factory = RequestFactory()
+
+    def render(self, user, **params):
+        with mock.patch('rbac.navigation.render_to_string', wraps=navigation.render_to_string) as render:
+            html = navigation.render_navigation_menu(self.factory.get('/', params), user)
+        return html, render.called
+
+    def test_cache_key(self):
+        html, rendered = self.render(self.admin)
+        self.assertTrue(rendered)
+        self.assertIn('Add New User', html)
+        self.assertEqual(self.render(self.admin), (html, False))
+
+        # Another role, financial access, tenant or impersonation state is another entry
+        agent_html, rendered = self.render(self.agent)
+        self.assertTrue(rendered)
+        self.assertNotIn('Add New User', agent_html)
+        self.agent.has_financial_access = True
+        html, rendered = self.render(self.agent)
+        self.assertTrue(rendered)
+        self.assertIn('Financial', html)
+        self.assertNotIn('Financial', agent_html)
+        self.agent.tenant = self.other_tenant
+        self.assertTrue(self.render(self.agent)[1])
+        self.assertTrue(self.render(self.admin, imp_token='token')[1])
+        self.assertFalse(self.render(self.admin, imp_token='token')[1])
+
+    def test_invalidated_by_role_and_tenant_changes(self):
+        html, _ = self.render(self.admin)
+        self.assertNotIn('Financial', html)
+
+        permission = Permission.objects.create(
+            name='View financial data', codename='view_financial_data', description='', category='FINANCIAL'
+        )
+        RolePermission.objects.create(role=self.admin_role, permission=permission)
+        html, rendered = self.render(self.admin)
+        self.assertTrue(rendered)
+        self.assertIn('Financial', html)
+
+        self.assertFalse(self.render(self.admin)[1])
+        self.tenant.name = 'Renamed'
+        self.tenant.save()
+        self.assertTrue(self.render(self.admin)[1])
+        # Other tenants keep their entries
+        self.agent.tenant = self.other_tenant
+        self.render(self.agent)
+        self.admin_role.save()
+        self.assertTrue(self.render(self.agent)[1])
+
+
+class TenantUsersAjaxTests(TestCase):
+    """get_tenant_users_ajax (an async view) needs a login and a system role, and lists a tenant's active users"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        staff_role = Role.objects.create(
+            name='SUPER_ADMIN', description='Platform staff', hierarchy_level=1, is_system_role=True
+        )
+        agent_role = Role.objects.create(name='CLIENT_USER', description='Agent', hierarchy_level=5)
+        cls.staff = User.objects.create_user('grace', 'grace@example.com', 'password', role=staff_role)
+        cls.agent = User.objects.create_user(
+            'ada', 'ada@example.com', 'password', tenant=cls.tenant, role=agent_role,
+            first_name='Ada', last_name='Lovelace',
+        )
+        User.objects.create_user(
+            'gone', 'gone@example.com', 'password', tenant=cls.tenant, role=agent_role, is_active=False
+        )
+        cls.url = reverse('get_tenant_users_ajax')
+
+    async def get(self, user=None, **params):
+        if user:
+            await sync_to_async(self.async_client.force_login)(user)
+        return await self.async_client.get(self.url, params)
+
+    async def test_login_required(self):
+        response = await self.get(tenant_id=self.tenant.id)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(f'{reverse("login")}?next='))
+
+    async def test_system_role_required(self):
+        response = await self.get(self.agent, tenant_id=self.tenant.id)
+        self.assertEqual(response.status_code, 403)
+
+    async def test_lists_active_tenant_users(self):
+        response = await self.get(self.staff, tenant_id=self.tenant.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['users'], [
+            {'id': str(self.agent.id), 'name': 'Ada Lovelace', 'email': 'ada@example.com', 'username': 'ada'},
+        ])
+        self.assertEqual((await self.get(tenant_id='00000000-0000-0000-0000-000000000000')).status_code, 404)
+        self.assertEqual((await self.get()).status_code, 400)
+
+
+@locmem_caches
+@override_settings(LOGO_RENDITIONS_BACKGROUND=False)
+class LogoRenditionTests(TestCase):
+    """Uploads are resized into every rendition; pages show the original until then"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        caches['default'].clear()
+        patcher = mock.patch('rbac.logo_renditions.logger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, tenant, size=(1000, 500)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            tenant.logo.save('logo.png', ContentFile(buffer.getvalue()))
+        tenant.refresh_from_db()
+
+    def pixels(self, path):
+        with default_storage.open(path, 'rb') as f:
+            return Image.open(f).size
+
+    def test_rendition_sizes(self):
+        tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        self.upload(tenant)
+        renditions = tenant.logo_renditions
+        self.assertEqual(renditions['source'], tenant.logo.name)
+        # Pixels at 'scale', width and height in CSS pixels
+        expected = {'email': ((400, 200), (200, 100)), 'navbar': ((128, 64), (64, 32)), 'favicon': ((32, 32), (32, 32))}
+        for name, (pixels, display) in expected.items():
+            with self.subTest(rendition=name):
+                entry = renditions[name]
+                self.assertEqual((entry['width'], entry['height']), display)
+                self.assertEqual(self.pixels(entry['png']), pixels)
+        self.assertNotIn('webp', renditions['email'])
+        self.assertNotIn('webp', renditions['favicon'])
+
+        urls, width, height = logo_rendition(tenant.pk, 'email')
+        self.assertEqual(urls, {'png': default_storage.url(renditions['email']['png'])})
+        self.assertEqual((width, height), (200, 100))
+
+    @skipUnless(features.check('webp'), 'Pillow was built without WebP')
+    def test_navbar_webp(self):
+        tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        self.upload(tenant)
+        self.assertEqual(self.pixels(tenant.logo_renditions['navbar']['webp']), (128, 64))
+        html = Template("{% load rbac_extras %}{% tenant_logo tenant 'navbar' %}").render(Context({'tenant': tenant}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('width="64" height="32"', html)
+
+    def test_png_without_webp_support(self):
+        tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        with mock.patch('rbac.logo_renditions.features.check', return_value=False):
+            self.upload(tenant)
+        navbar = tenant.logo_renditions['navbar']
+        self.assertNotIn('webp', navbar)
+        self.assertEqual(self.pixels(navbar['png']), (128, 64))
+        html = Template("{% load rbac_extras %}{% tenant_logo tenant 'navbar' %}").render(Context({'tenant': tenant}))
+        self.assertNotIn('<picture>', html)
+        self.assertIn(default_storage.url(navbar['png']), html)
+
+    @override_settings(LOGO_RENDITIONS_BACKGROUND=True)
+    def test_reads_fall_back_to_original(self):
+        tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        with mock.patch('rbac.logo_renditions.schedule_renditions'):
+            self.upload(tenant)
+        self.assertEqual(tenant.logo_renditions, {})
+
+        # A page view shows the original and leaves resizing to the backfill
+        with mock.patch('rbac.logo_renditions.generate_renditions') as generate, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(logo_url(tenant.pk, 'email'), default_storage.url(tenant.logo.name))
+            self.assertEqual(logo_rendition(tenant.pk, 'navbar'), ({'png': tenant.logo.url}, None, None))
+        self.assertEqual(callbacks, [])
+        generate.assert_not_called()
+
+        out = io.StringIO()
+        call_command('generate_logo_renditions', stdout=out)
+        self.assertIn('1 generated, 0 up to date, 0 failed', out.getvalue())
+        tenant.refresh_from_db()
+        self.assertEqual(tenant.logo_renditions['source'], tenant.logo.name)
+        self.assertEqual(logo_rendition(tenant.pk, 'navbar')[1:], (64, 32))
+        call_command('generate_logo_renditions', stdout=out)
+        self.assertIn('0 generated, 1 up to date, 0 failed', out.getvalue())
+
+
+@override_settings(MEDIA_SENDFILE='')
+class MediaViewTests(SimpleTestCase):
+    """Media files stay inside MEDIA_ROOT and answer conditional and range requests"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = os.path.join(directory.name, 'media')
+        os.makedirs(os.path.join(self.root, 'docs'))
+        with open(os.path.join(self.root, 'docs', 'itinerary.txt'), 'wb') as f:
+            f.write(b'0123456789')
+        with open(os.path.join(directory.name, 'secret.txt'), 'wb') as f:
+            f.write(b'secret')
+        os.symlink(os.path.join(directory.name, 'secret.txt'), os.path.join(self.root, 'docs', 'link.txt'))
+        patcher = mock.patch('custom_media_view.get_media_root', return_value=self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, path, **headers):
+        response = async_to_sync(serve_media_file)(RequestFactory().get(f'/media/{path}', **headers), path)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_traversal_rejected(self):
+        for path in ('../secret.txt', 'docs/../../secret.txt', '/etc/passwd', 'docs/link.txt', ''):
+            with self.subTest(path=path):
+                self.assertIsNone(resolve_media_path(self.root, path))
+                with self.assertRaises(Http404):
+                    self.get(path)
+
+    def test_not_modified(self):
+        response = self.get('docs/itinerary.txt')
+        self.assertEqual((response.status_code, self.body(response)), (200, b'0123456789'))
+        response = self.get('docs/itinerary.txt', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        for header, content_range, body in (
+            ('bytes=2-5', 'bytes 2-5/10', b'2345'),
+            ('bytes=7-', 'bytes 7-9/10', b'789'),
+            ('bytes=-3', 'bytes 7-9/10', b'789'),
+            ('bytes=8-100', 'bytes 8-9/10', b'89'),
+        ):
+            with self.subTest(header=header):
+                response = self.get('docs/itinerary.txt', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(self.body(response), body)
+
+        for header in ('bytes=10-', 'bytes=5-2', 'bytes=-0'):
+            with self.subTest(header=header):
+                response = self.get('docs/itinerary.txt', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_serves_whole_file(self):
+        etag = self.get('docs/itinerary.txt')['ETag']
+        response = self.get('docs/itinerary.txt', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.get('docs/itinerary.txt', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, self.body(response)), (200, b'0123456789'))
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_SENDFILE_PREFIX='/protected-media/')
+    def test_sendfile_offload(self):
+        response = self.get('docs/itinerary.txt')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/docs/itinerary.txt')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get('docs/itinerary.txt', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+@plain_static_files
+class AdminChangelistQueryCountTests(TestCase):
+    """Changelists must run the same number of queries however many rows they show"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name='SUPER_ADMIN', description='Platform staff', hierarchy_level=1)
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password', role=cls.role)
+        cls.rows = 0
+
+    def add_rows(self, count):
+        """`count` rows of every model with an admin, each with its own related objects"""
+        for _ in range(count):
+            n = self.rows = self.rows + 1
+            tenant = Tenant.objects.create(name=f'Agency {n}', subdomain=f'agency-{n}', contact_email=f'a{n}@example.com')
+            user = User.objects.create_user(f'agent{n}', f'agent{n}@example.com', 'password', tenant=tenant, role=self.role)
+            permission = Permission.objects.create(
+                name=f'Permission {n}', codename=f'permission_{n}', description='Test', category='CRM'
+            )
+            RolePermission.objects.create(role=self.role, permission=permission)
+            UserPermissionOverride.objects.create(user=user, permission=permission, is_granted=True, granted_by=user)
+            AuditLog.objects.create(user=user, tenant=tenant, action='LOGIN')
+            account = ClientAccount.objects.create(
+                tenant=tenant, status=AccountStatus.objects.create(name=f'Status {n}'),
+                business_name=f'Agency {n}', primary_contact=user, sales_rep=user
+            )
+            SalesOpportunity.objects.create(
+                tenant=tenant, client_account=account, name=f'Deal {n}', sales_rep=user,
+                expected_close_date=date.today() + timedelta(days=n)
+            )
+            ticket = SupportTicket.objects.create(
+                ticket_number=f'VD-{n}', subject='Help', description='Test', tenant=tenant,
+                client_account=account, assigned_to=user
+            )
+            TicketComment.objects.create(ticket=ticket, author=user, comment='Test')
+            OnboardingTask.objects.create(tenant=tenant, client_account=account, name='Setup', assigned_to=user)
+
+            client = Client.objects.create(tenant=tenant, first_name='Ada', last_name=f'Client {n}', email=f'c{n}@example.com')
+            ClientCommunication.objects.create(client=client, communication_type='EMAIL', direction='OUTBOUND', content='Hi')
+            ClientNote.objects.create(client=client, content='Note')
+            ClientDocument.objects.create(client=client, document_type='PASSPORT', title='Passport', file='documents/p.pdf')
+            ClientImport.objects.create(tenant=tenant, created_by=user, original_name='clients.csv', file_format='csv')
+            trip = Trip.objects.create(client=client, trip_name=f'Trip {n}', departure_date=date.today())
+            TripItinerary.objects.create(trip=trip, day_number=1, date=date.today())
+            TripParticipant.objects.create(trip=trip, first_name='Bob', last_name='Guest')
+            TripCommunication.objects.create(trip=trip, communication_type='ITINERARY', subject='Trip', content='Trip')
+            invoice = Invoice.objects.create(
+                client=client, trip=trip, invoice_number=f'INV-{n}', subtotal=Decimal('100'),
+                total_amount=Decimal('100'), due_date=date.today()
+            )
+            InvoiceLineItem.objects.create(invoice=invoice, description='Flight', unit_price=Decimal('100'), total_price=Decimal('100'))
+            payment = Payment.objects.create(invoice=invoice, amount=Decimal('50'), payment_method='CARD')
+            PaymentSchedule.objects.create(
+                invoice=invoice, installment_number=1, amount=Decimal('50'), due_date=date.today(), payment=payment
+            )
+
+    def changelist_queries(self):
+        counts = {}
+        for model in admin.site._registry:
+            url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = len(queries)
+        return counts
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.client.force_login(self.admin_user)
+        self.add_rows(1)
+        few = self.changelist_queries()
+        self.add_rows(4)
+        many = self.changelist_queries()
+        for url, count in many.items():
+            with self.subTest(url=url):
+                self.assertEqual(count, few[url], f'{url} runs extra queries per row')
+                self.assertLessEqual(count, CHANGELIST_QUERY_BUDGET)
+
+    def test_autocomplete_filter(self):
+        self.client.force_login(self.admin_user)
+        self.add_rows(2)
+        tenant = Tenant.objects.get(subdomain='agency-1')
+        response = self.client.get(reverse('admin:rbac_auditlog_changelist'), {'tenant__id__exact': tenant.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertContains(response, 'admin-autocomplete-filter')
+        self.assertContains(response, 'js/admin_autocomplete_filter.js')
+
+
+@plain_static_files
+@override_settings(QUERY_BUDGET_STRICT=True, METRICS_TOKEN='metrics-token')
+class RequestMetricsTests(TestCase):
+    """Views with @query_budget stay within it, and the metrics endpoint reports them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        cls.user = User.objects.create_user('agent', 'agent@example.com', 'password', tenant=cls.tenant, role=role)
+        for n in range(5):
+            client = Client.objects.create(tenant=cls.tenant, first_name='Ada', last_name=f'Client {n}', email=f'c{n}@example.com')
+            trip = Trip.objects.create(client=client, trip_name=f'Trip {n}', departure_date=date.today())
+            Invoice.objects.create(
+                client=client, trip=trip, invoice_number=f'INV-{n}', subtotal=Decimal('100'),
+                total_amount=Decimal('100'), due_date=date.today()
+            )
+        cls.client_obj = client
+
+    def test_views_within_budget(self):
+        self.client.force_login(self.user)
+        for url in [
+            reverse('dashboard'), reverse('profile'), reverse('user_list'), reverse('crm_dashboard'),
+            reverse('client_list'), reverse('trip_list'), reverse('invoice_list'),
+            reverse('client_detail', args=[self.client_obj.pk]),
+            reverse('client_communications', args=[self.client_obj.pk]),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_over_budget_fails(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(crm_views.client_list_view, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('client_list'))
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'rbac.cache_backends.TieredCache', 'LOCATION': 'remote'},
+        'remote': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'metrics_cache_table'},
+    })
+    def test_database_cache_queries_not_counted(self):
+        call_command('createcachetable', 'metrics_cache_table')
+        token = begin_request_stats()
+        caches['default'].set('key', 'value')
+        caches['remote'].get('key')
+        list(Client.objects.all())
+        stats = end_request_stats(token)
+        self.assertEqual(stats.queries, 1)
+
+    def test_prometheus_endpoint(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('client_list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.logout()
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, f'vd_http_requests_total{{view="client_list",tenant="{self.tenant.pk}",status="2xx"}}'
+        )
+        self.assertContains(response, '# TYPE vd_http_request_queries histogram')
+
+
+@plain_static_files
+@locmem_caches
+class BenchmarkSuiteTests(TestCase):
+    """The benchmark scenarios run against a (tiny) seeded tenant"""
+
+    def test_seeded_tenant_benchmarks(self):
+        counts = {'clients': 3, 'trips': 6, 'invoices': 6, 'audit_rows': 20, 'tickets': 2}
+        tenant = seed_tenant('bench', counts)
+        self.assertEqual(Client.objects.filter(tenant=tenant).count(), 3)
+        self.assertEqual(TripItinerary.objects.filter(trip__client__tenant=tenant).count(), 18)
+        self.assertEqual(AuditLog.objects.filter(tenant=tenant).count(), 20)
+
+        results = run_benchmarks(tenant, iterations=1, warmup=0)
+        self.assertIn('helpdesk_dashboard', results)
+        baseline = {'results': {name: dict(result) for name, result in results.items()}}
+        self.assertEqual(compare(results, baseline), [])
+        baseline['results']['client_list']['queries'] -= 1
+        self.assertEqual([name for name, _ in compare(results, baseline)], ['client_list'])
+
+
+@plain_static_files
+@locmem_caches
+class RequestProfilingTests(TestCase):
+    """Profiled requests are stored with their stacks and SQL, and only system users see them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        agent_role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        staff_role = Role.objects.create(
+            name='SUPER_ADMIN', description='Platform staff', hierarchy_level=1, is_system_role=True
+        )
+        cls.agent = User.objects.create_user('agent', 'agent@example.com', 'password', tenant=cls.tenant, role=agent_role)
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', role=staff_role)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(PROFILE_DIR=directory.name, PROFILER_TOKEN='profile-token', PROFILE_INTERVAL_MS=1)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_token_profiles_request(self):
+        self.client.force_login(self.agent)
+        response = self.client.get(reverse('client_list'), HTTP_X_PROFILE_TOKEN='profile-token')
+        profile = load_profile(response['X-Profile-Id'])
+        self.assertEqual(profile['view'], 'client_list')
+        self.assertEqual(profile['user'], 'agent')
+        self.assertTrue(any(event['kind'] == 'sql' for event in profile['events']))
+        self.assertTrue(any(event['kind'] == 'template' for event in profile['events']))
+
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('client_list')))
+        # Only system users may profile with ?_profile=1; nobody else starts a sampler
+        with mock.patch('rbac.middleware.start_profile') as start:
+            self.assertNotIn('X-Profile-Id', self.client.get(reverse('client_list'), {'_profile': 1}))
+            self.client.logout()
+            self.client.get(reverse('client_list'), {'_profile': 1})
+        start.assert_not_called()
+        self.client.force_login(self.agent)
+        self.assertEqual(len(list_profiles()), 1)
+        self.assertRedirects(self.client.get(reverse('profile_list')), reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_system_user_views_profiles(self):
+        self.client.force_login(self.staff)
+        profile_id = self.client.get(reverse('profile'), {'_profile': 1})['X-Profile-Id']
+        self.assertContains(self.client.get(reverse('profile_list')), reverse('profile_detail', args=[profile_id]))
+        self.assertContains(self.client.get(reverse('profile_detail', args=[profile_id])), 'SQL by Statement')
+        response = self.client.get(reverse('profile_stacks', args=[profile_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('profile_detail', args=['..passwd'])).status_code, 404)
+
+
+@plain_static_files
+@locmem_caches
+class StructuredLoggingTests(TestCase):
+    """Log records carry the request's context and are written by the listener thread"""
+
+    def test_access_log_line(self):
+        role = Role.objects.create(name='CLIENT_ADMIN', description='Agency admin', hierarchy_level=4)
+        tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        user = User.objects.create_user('agent', 'agent@example.com', 'password', tenant=tenant, role=role)
+        stream = io.StringIO()
+        handler = queue_handler(stream=stream)
+        handler.addFilter(RequestContextFilter())
+        logger = logging.getLogger('rbac.requests')
+        logger.addHandler(handler)
+        self.addCleanup(handler.close)
+        self.addCleanup(logger.removeHandler, handler)
+
+        self.client.force_login(user)
+        response = self.client.get(reverse('client_list'), HTTP_X_REQUEST_ID='req-12345678')
+        self.assertEqual(response['X-Request-ID'], 'req-12345678')
+        handler.flush()
+        line = json.loads(stream.getvalue().splitlines()[-1])
+        self.assertEqual(line['request_id'], 'req-12345678')
+        self.assertEqual(line['view'], 'client_list')
+        self.assertEqual(line['tenant'], str(tenant.pk))
+        self.assertEqual(line['user_id'], str(user.pk))
+        self.assertEqual(line['status'], 200)
+        self.assertIn('duration_ms', line)
+
+        # Malformed ids are replaced
+        response = self.client.get(reverse('client_list'), HTTP_X_REQUEST_ID='bad id\n')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_sampling_keeps_whole_requests(self):
+        sampling = SamplingFilter('rbac.views=0.5')
+        kept = set()
+        for n in range(200):
+            record = logging.makeLogRecord({'name': 'rbac.views.detail', 'levelno': logging.INFO})
+            record.request_id = f'request-{n}'
+            if sampling.filter(record):
+                kept.add(record.request_id)
+                self.assertTrue(sampling.filter(record))
+        self.assertTrue(50 < len(kept) < 150)
+        warning = logging.makeLogRecord({'name': 'rbac.views', 'levelno': logging.WARNING})
+        self.assertTrue(all(sampling.filter(warning) for _ in range(20)))
+
+    @skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_forked_child_writes_and_closes(self):
+        # A forked worker (copy_database, gunicorn --preload) logs through its
+        # own listener and can reconfigure logging without hanging
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        stream = open(path, 'w')
+        self.addCleanup(stream.close)
+        handler = queue_handler(format='text', stream=stream)
+        self.addCleanup(handler.close)
+        logger = logging.getLogger('rbac.fork_test')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        pid = os.fork()
+        if pid == 0:
+            written = False
+            try:
+                logger.warning('from the child')
+                handler.flush()
+                with open(path) as f:
+                    written = 'from the child' in f.read()
+                handler.close()
+            finally:
+                os._exit(0 if written else 1)
+        deadline = time.monotonic() + 10
+        while True:
+            finished, status = os.waitpid(pid, os.WNOHANG)
+            if finished:
+                break
+            if time.monotonic() > deadline:
+                os.kill(pid, 9)
+                os.waitpid(pid, 0)
+                self.fail('The forked child hung closing the log handler')
+            time.sleep(0.01)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0, 'The forked child did not write its record')
+
+
+@plain_static_files
+@override_settings(NPLUSONE_RAISE=True, NPLUSONE_THRESHOLD=3)
+class NPlusOneDetectionTests(TestCase):
+    """Queries repeated per row are reported with the code and template lines behind them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name='SUPER_ADMIN', description='Platform staff', hierarchy_level=1, is_system_role=True)
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password', role=cls.role)
+        cls.tenant = Tenant.objects.create(name='Agency', subdomain='agency', contact_email='a@example.com')
+        client = Client.objects.create(tenant=cls.tenant, first_name='Ada', last_name='Client', email='c@example.com')
+        cls.trip = Trip.objects.create(client=client, trip_name='Trip', departure_date=date.today())
+        for n in range(4):
+            User.objects.create_user(f'agent{n}', f'agent{n}@example.com', 'password', tenant=cls.tenant, role=cls.role)
+            TripParticipant.objects.create(trip=cls.trip, first_name='Traveler', last_name=str(n))
+            client = Client.objects.create(tenant=cls.tenant, first_name='Ada', last_name=f'Client {n}', email=f'c{n}@example.com')
+            Invoice.objects.create(
+                client=client, trip=cls.trip, invoice_number=f'INV-{n}', subtotal=Decimal('100'),
+                total_amount=Decimal('100'), due_date=date.today()
+            )
+
+    def test_model_str_in_loop(self):
+        with self.assertRaisesRegex(NPlusOneDetected, r'4 similar queries .*business_management/models.py:\d+ in __str__'):
+            with detect_nplusone('invoices'):
+                [str(invoice) for invoice in Invoice.objects.all()]
+        with detect_nplusone('invoices') as detector:
+            [str(invoice) for invoice in Invoice.objects.select_related('client')]
+        self.assertEqual(detector.findings(), [])
+
+    def test_template_line(self):
+        template = Template('<ul>\n{% for invoice in invoices %}<li>{{ invoice.client.full_name }}</li>{% endfor %}</ul>')
+        with self.assertRaisesRegex(NPlusOneDetected, r'<unknown source>:2'):
+            with detect_nplusone('template'):
+                template.render(Context({'invoices': Invoice.objects.all()}))
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'rbac.cache_backends.TieredCache', 'LOCATION': 'remote'},
+        'remote': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'nplusone_cache_table'},
+    })
+    def test_views_without_nplusone(self):
+        # Database cache misses repeat one statement shape, but are not N+1s
+        call_command('createcachetable', 'nplusone_cache_table')
+        self.client.force_login(self.admin_user)
+        for url in [reverse('user_list'), reverse('admin:business_management_trip_change', args=[self.trip.pk])]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
@@ -38,6 +38,13 @@ urlpatterns = [
     # AJAX endpoints
     path('ajax/get-tenant-users/', views.get_tenant_users_ajax, name='get_tenant_users_ajax'),
     
+    # Operations endpoints
+    path('ops/db-pool/', views.db_pool_stats_view, name='db_pool_stats'),
+    path('ops/metrics/', views.metrics_view, name='metrics'),
+    path('ops/profiles/', views.profile_list_view, name='profile_list'),
+    path('ops/profiles/<str:profile_id>/', views.profile_detail_view, name='profile_detail'),
+    path('ops/profiles/<str:profile_id>/stacks.folded', views.profile_stacks_view, name='profile_stacks'),
+    
     # Impersonation URLs
     path('impersonate/tenant/<uuid:tenant_id>/users/', views.impersonate_tenant_users, name='impersonate_tenant_users'),
     path('impersonate/start/<uuid:user_id>/', views.start_impersonation, name='start_impersonation'),
@@ -1,3 +1,4 @@
+import hmac
 import os
 import logging
 from django.shortcuts import render, redirect, get_object_or_404
@@ -6,13 +7,15 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Count, Q
 from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.utils import timezone
+from django.views.decorators.cache import never_cache
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from .models import Role, Permission, Tenant, AuditLog, SupportTicket, TicketComment
 from .forms import AddUserForm, EditUserForm, ChangeUserPasswordForm
+from .decorators import async_login_required, query_budget
 
 # Use get_user_model() instead of direct import
 User = get_user_model()
@@ -83,6 +86,7 @@ def logout_view(request):
     return redirect('login')
 
 
+@query_budget(20)
 @login_required
 def dashboard_view(request):
     """Main dashboard view - customized per role"""
@@ -161,8 +165,8 @@ def helpdesk_dashboard_view(request):
     assigned_filter = request.GET.get('assigned', '')
     search = request.GET.get('search', '')
     
-    # Build ticket query
-    tickets = SupportTicket.objects.all()
+    # Build ticket query (rows show the tenant and assignee)
+    tickets = SupportTicket.objects.select_related('tenant', 'assigned_to')
     
     # Apply filters
     if status_filter:
@@ -209,11 +213,11 @@ def helpdesk_dashboard_view(request):
         },
         
         # Quick access data
-        'recent_tickets': SupportTicket.objects.filter(
+        'recent_tickets': SupportTicket.objects.select_related('tenant').filter(
             status__in=['OPEN', 'IN_PROGRESS', 'PENDING']
         ).order_by('-created_at')[:5],
         
-        'urgent_tickets': SupportTicket.objects.filter(
+        'urgent_tickets': SupportTicket.objects.select_related('tenant').filter(
             priority='URGENT', 
             status__in=['OPEN', 'IN_PROGRESS']
         ).order_by('-created_at')[:3],
@@ -222,6 +226,7 @@ def helpdesk_dashboard_view(request):
     return render(request, 'rbac/helpdesk_dashboard.html', context)
 
 
+@query_budget(10)
 @login_required
 def profile_view(request):
     """User profile view"""
@@ -281,38 +286,13 @@ def tenant_settings_view(request):
     if request.method == 'POST':
         form = TenantSettingsForm(request.POST, request.FILES, instance=tenant)
         
-        # Debug logging
-        logger.info(f"POST data received: {request.POST}")
-        logger.info(f"FILES data received: {request.FILES}")
-        logger.info(f"MEDIA_ROOT setting: {settings.MEDIA_ROOT}")
-        logger.info(f"MEDIA_URL setting: {settings.MEDIA_URL}")
-        
         if form.is_valid():
             try:
-                # Log before saving
-                old_logo = tenant.logo
-                logger.info(f"Before save - Old logo: {old_logo}")
-                logger.info(f"Form cleaned data logo: {form.cleaned_data.get('logo')}")
-                logger.info(f"Logo clear in POST: {'logo-clear' in request.POST}")
-                
-                # Check if logo file upload is working
-                if 'logo' in request.FILES:
-                    uploaded_file = request.FILES['logo']
-                    logger.info(f"Uploaded file name: {uploaded_file.name}")
-                    logger.info(f"Uploaded file size: {uploaded_file.size}")
-                    logger.info(f"Uploaded file content type: {uploaded_file.content_type}")
-                    
-                    # Test if media directory is writable
-                    import os
-                    media_root = settings.MEDIA_ROOT
-                    tenant_logos_dir = os.path.join(media_root, 'tenant_logos')
-                    logger.info(f"Media root exists: {os.path.exists(media_root)}")
-                    logger.info(f"Tenant logos dir exists: {os.path.exists(tenant_logos_dir)}")
-                    logger.info(f"Media root is writable: {os.access(media_root, os.W_OK) if os.path.exists(media_root) else 'N/A'}")
-                    logger.info(f"Tenant logos dir is writable: {os.access(tenant_logos_dir, os.W_OK) if os.path.exists(tenant_logos_dir) else 'N/A'}")
-                
                 saved_tenant = form.save()
-                logger.info(f"Tenant saved successfully. New logo: {saved_tenant.logo}")
+                logger.info('Tenant settings saved', extra={
+                    'fields_updated': list(form.changed_data),
+                    'logo': saved_tenant.logo.name if 'logo' in form.changed_data else None,
+                })
                 
                 # Log the tenant settings update
                 AuditLog.objects.create(
@@ -329,12 +309,10 @@ def tenant_settings_view(request):
                 messages.success(request, 'Company settings have been updated successfully!')
                 return redirect('tenant_settings')
             except Exception as e:
-                import traceback
-                logger.error(f"Error saving tenant settings: {str(e)}")
-                logger.error(f"Full traceback: {traceback.format_exc()}")
+                logger.exception("Error saving tenant settings")
                 messages.error(request, f'Error saving settings: {str(e)}')
         else:
-            logger.error(f"Form validation errors: {form.errors}")
+            logger.warning('Tenant settings form invalid', extra={'invalid_fields': list(form.errors)})
             messages.error(request, 'Please correct the errors below.')
     else:
         form = TenantSettingsForm(instance=tenant)
@@ -483,6 +461,7 @@ def get_client_ip(request):
 
 # User Management Views
 
+@query_budget(12)
 @login_required
 def user_list_view(request):
     """List users in the current tenant"""
@@ -496,6 +475,7 @@ def user_list_view(request):
         users = User.objects.all().order_by('username')
     else:
         users = User.objects.filter(tenant=request.user.tenant).order_by('username')
+    users = users.select_related('role', 'tenant')
     
     context = {
         'users': users,
@@ -976,10 +956,9 @@ def ticket_detail_view(request, ticket_id):
                 if not is_internal and ticket.created_for and ticket.created_for.email:
                     try:
                         send_ticket_notification_email(ticket, comment, 'comment')
-                    except Exception as e:
+                    except Exception:
                         # Don't let email failures block the comment creation
-                        print(f"Email notification failed: {e}")
-                        pass
+                        logger.exception(f"Comment notification for ticket {ticket.ticket_number} failed")
                 
                 # Log the comment
                 AuditLog.objects.create(
@@ -1047,10 +1026,9 @@ def ticket_detail_view(request, ticket_id):
                     if ticket.created_for and ticket.created_for.email:
                         try:
                             send_ticket_notification_email(ticket, resolution_comment, 'resolved')
-                        except Exception as e:
+                        except Exception:
                             # Don't let email failures block the resolution
-                            print(f"Resolution email notification failed: {e}")
-                            pass
+                            logger.exception(f"Resolution notification for ticket {ticket.ticket_number} failed")
                     
                     # Log the resolution
                     AuditLog.objects.create(
@@ -1308,8 +1286,8 @@ def create_client_user_view(request, tenant_id):
     return render(request, 'rbac/create_client_user.html', context)
 
 
-@login_required
-def get_tenant_users_ajax(request):
+@async_login_required
+async def get_tenant_users_ajax(request):
     """AJAX endpoint to get users for a specific tenant"""
     if not request.user.role.name in ['SUPER_ADMIN', 'SYSTEM_ADMIN', 'HELPDESK_USER']:
         return JsonResponse({'error': 'Permission denied'}, status=403)
@@ -1319,7 +1297,7 @@ def get_tenant_users_ajax(request):
         return JsonResponse({'error': 'Missing tenant_id'}, status=400)
     
     try:
-        tenant = Tenant.objects.get(id=tenant_id)
+        tenant = await Tenant.objects.aget(id=tenant_id)
         users = User.objects.filter(
             tenant=tenant,
             role__is_system_role=False,
@@ -1327,7 +1305,7 @@ def get_tenant_users_ajax(request):
         ).values('id', 'username', 'first_name', 'last_name', 'email').order_by('username')
         
         user_list = []
-        for user in users:
+        async for user in users:
             full_name = f"{user['first_name']} {user['last_name']}".strip()
             display_name = full_name if full_name else user['username']
             user_list.append({
@@ -1345,6 +1323,88 @@ def get_tenant_users_ajax(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@login_required
+def db_pool_stats_view(request):
+    """Connection reuse metrics for this worker process (system admins only)"""
+    if not request.user.role.name in ['SUPER_ADMIN', 'SYSTEM_ADMIN']:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    from .db_metrics import get_connection_stats
+    return JsonResponse(get_connection_stats())
+
+
+@never_cache
+def metrics_view(request):
+    """Request metrics of every worker in the Prometheus text format (METRICS_TOKEN or system admins)"""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(authorization, f'Bearer {token}')):
+        user = request.user
+        if not (user.is_authenticated and user.role and user.role.name in ['SUPER_ADMIN', 'SYSTEM_ADMIN']):
+            return HttpResponse('Permission denied\n', status=403, content_type='text/plain')
+    
+    from .request_metrics import render_prometheus
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+def profile_list_view(request):
+    """Stored request profiles, newest first (system users only)"""
+    from .profiling import list_profiles, may_request_profiles
+    if not may_request_profiles(request.user):
+        messages.error(request, 'You do not have permission to view request profiles.')
+        return redirect('dashboard')
+    
+    paginator = Paginator(list_profiles(), 50)
+    context = {
+        'page_obj': paginator.get_page(request.GET.get('page')),
+        'sample_rate': settings.PROFILE_SAMPLE_RATE,
+        'token_enabled': bool(settings.PROFILER_TOKEN),
+    }
+    return render(request, 'rbac/profile_list.html', context)
+
+
+@login_required
+def profile_detail_view(request, profile_id):
+    """Hot functions, grouped SQL and the event timeline of one profile"""
+    from .profiling import grouped_queries, load_profile, may_request_profiles, top_functions
+    if not may_request_profiles(request.user):
+        messages.error(request, 'You do not have permission to view request profiles.')
+        return redirect('dashboard')
+    
+    profile = load_profile(profile_id)
+    if profile is None:
+        raise Http404('Profile not found')
+    
+    events = profile['events']
+    sql = [event for event in events if event['kind'] == 'sql']
+    context = {
+        'profile': profile,
+        'top_functions': top_functions(profile),
+        'queries': grouped_queries(profile),
+        'query_count': len(sql),
+        'sql_ms': round(sum(event['ms'] for event in sql), 3),
+        'templates': [event for event in events if event['kind'] == 'template'],
+        'events': events,
+    }
+    return render(request, 'rbac/profile_detail.html', context)
+
+
+@login_required
+def profile_stacks_view(request, profile_id):
+    """A profile's stacks in the folded format, for flamegraph.pl or speedscope"""
+    from .profiling import folded_stacks, load_profile, may_request_profiles
+    if not may_request_profiles(request.user):
+        return HttpResponse('Permission denied\n', status=403, content_type='text/plain')
+    
+    profile = load_profile(profile_id)
+    if profile is None:
+        raise Http404('Profile not found')
+    response = HttpResponse(folded_stacks(profile), content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{profile_id}.folded"'
+    return response
+
+
 def send_ticket_notification_email(ticket, comment=None, notification_type='comment'):
     """Send email notification to client user about ticket updates"""
     if not ticket.created_for or not ticket.created_for.email:
@@ -1458,8 +1518,8 @@ def send_ticket_notification_email(ticket, comment=None, notification_type='comm
         
         return True
         
-    except Exception as e:
-        print(f"Failed to send email notification: {str(e)}")
+    except Exception:
+        logger.exception(f"Failed to send {notification_type} notification for ticket {ticket.ticket_number}")
         return False
 
 
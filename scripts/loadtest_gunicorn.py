@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+Load-test harness for gunicorn.conf.py worker configurations
+
+Starts gunicorn once per configuration, drives a URL with concurrent
+keep-alive clients and reports throughput, latency and memory (RSS, plus PSS
+which counts copy-on-write pages shared between workers only once).
+
+Examples:
+    python scripts/loadtest_gunicorn.py
+    python scripts/loadtest_gunicorn.py --config sync:4 --config gthread:2x8 --config uvicorn:2
+    python scripts/loadtest_gunicorn.py --config gthread:2x4 --compare-preload --url /login/
+"""
+import argparse
+import http.client
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIGS = ['sync:auto', 'gthread:auto', 'uvicorn:auto']
+
+
+def parse_config(spec):
+    """'gthread:2x8' -> ('gthread', '2', '8'); 'sync:auto' -> ('sync', None, None)"""
+    worker_class, _, sizing = spec.partition(':')
+    workers, threads = None, None
+    if sizing and sizing != 'auto':
+        workers, _, threads = sizing.partition('x')
+    return worker_class, workers, threads or None
+
+
+def process_tree(root_pid):
+    """root pid plus its direct children (gunicorn master and workers)"""
+    pids = [root_pid]
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        stat = read_proc(f'/proc/{entry}/stat')
+        # Field 4 is the parent pid; the command name (field 2) may contain spaces
+        if stat and int(stat.rsplit(')', 1)[1].split()[1]) == root_pid:
+            pids.append(int(entry))
+    return pids
+
+
+def read_proc(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def memory_kb(pid, field):
+    """VmRSS from /proc/<pid>/status or Pss from /proc/<pid>/smaps_rollup, in kB"""
+    path = f'/proc/{pid}/status' if field == 'VmRSS' else f'/proc/{pid}/smaps_rollup'
+    for line in (read_proc(path) or '').splitlines():
+        if line.startswith(f'{field}:'):
+            return int(line.split()[1])
+    return 0
+
+
+def wait_until_ready(port, proc, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.25)
+    return False
+
+
+def run_load(port, path, total_requests, concurrency):
+    timings = []
+    errors = []
+    lock = threading.Lock()
+    per_client = max(1, total_requests // concurrency)
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        for _ in range(per_client):
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(type(e).__name__)
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.append((time.perf_counter() - start) * 1000)
+        conn.close()
+        with lock:
+            timings.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors, time.perf_counter() - wall_start
+
+
+def run_configuration(spec, preload, args):
+    worker_class, workers, threads = parse_config(spec)
+    env = dict(os.environ, PORT=str(args.port), GUNICORN_WORKER_CLASS=worker_class,
+               GUNICORN_PRELOAD='true' if preload else 'false')
+    if workers:
+        env['WEB_CONCURRENCY'] = workers
+    if threads:
+        env['GUNICORN_THREADS'] = threads
+
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE if args.quiet else None,
+    )
+    label = f'{spec} preload={"on" if preload else "off"}'
+    try:
+        if not wait_until_ready(args.port, proc):
+            print(f'❌ {label}: gunicorn did not start')
+            return
+
+        run_load(args.port, args.url, min(200, args.requests), args.concurrency)  # warm up every worker
+        timings, errors, wall = run_load(args.port, args.url, args.requests, args.concurrency)
+
+        pids = process_tree(proc.pid)
+        rss = sum(memory_kb(pid, 'VmRSS') for pid in pids) / 1024
+        pss = sum(memory_kb(pid, 'Pss') for pid in pids) / 1024
+        ordered = sorted(timings)
+        p99 = ordered[max(int(len(ordered) * 0.99) - 1, 0)]
+        print(
+            f'📊 {label:<28} workers={len(pids) - 1:<3} '
+            f'{len(timings) / wall:8.1f} req/s  p50={statistics.median(ordered):7.1f}ms  p99={p99:7.1f}ms  '
+            f'RSS={rss:7.1f}MB  PSS={pss:7.1f}MB  errors={len(errors)}'
+        )
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--config', action='append', dest='configs',
+                        help='worker_class[:workers[xthreads]|:auto], repeatable (default: sync, gthread, uvicorn auto-sized)')
+    parser.add_argument('--url', default='/login/', help='Path to request')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--compare-preload', action='store_true', help='Run each configuration with and without preload_app')
+    parser.add_argument('--quiet', action='store_true', help='Hide gunicorn logs')
+    args = parser.parse_args()
+
+    print(f'🔥 {args.requests} x GET {args.url} with {args.concurrency} concurrent clients')
+    for spec in args.configs or DEFAULT_CONFIGS:
+        for preload in ([True, False] if args.compare_preload else [True]):
+            run_configuration(spec, preload, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,4 +16,4 @@ python manage.py migrate
 
 # Start Gunicorn server
 echo "Starting Gunicorn server..."
-gunicorn -c gunicorn.conf.py vacationdesktop.wsgi:application
\ No newline at end of file
+gunicorn -c gunicorn.conf.py
\ No newline at end of file
@@ -0,0 +1,15 @@
+'use strict';
+// Reloads the changelist when an AutocompleteFilter (rbac/admin_performance.py) changes
+{
+    const $ = django.jQuery;
+
+    $(document).on('change', 'select.admin-autocomplete-filter', function() {
+        const params = new URLSearchParams(window.location.search);
+        params.delete(this.dataset.filterParameter);
+        params.delete('p');
+        if (this.value) {
+            params.set(this.dataset.filterParameter, this.value);
+        }
+        window.location.search = params.toString();
+    });
+}
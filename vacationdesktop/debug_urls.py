@@ -0,0 +1,38 @@
+"""
+Debug and emergency-recovery endpoints
+
+Only included by vacationdesktop/urls.py when DEBUG_ENDPOINTS_ENABLED is set, so
+none of these modules are imported by production workers or management commands.
+"""
+from django.urls import path
+
+from rbac.views import create_emergency_admin, fix_existing_admin
+from debug_views import debug_admin, simple_dashboard
+from simple_login import emergency_login
+from minimal_test import minimal_test
+from db_test import db_test, model_test
+from production_test import production_debug
+from emergency_login_debug import emergency_login_debug
+from admin_debug import admin_debug_view
+from email_debug import email_debug_view
+from env_debug import env_debug_view
+from admin_tenant_fix import admin_tenant_fix_view
+from media_debug_view import media_debug_view
+
+urlpatterns = [
+    path('emergency-admin-setup/', create_emergency_admin, name='emergency_admin'),
+    path('fix-admin/', fix_existing_admin, name='fix_admin'),
+    path('debug-admin/', debug_admin, name='debug_admin'),
+    path('simple-dashboard/', simple_dashboard, name='simple_dashboard'),
+    path('emergency-login/', emergency_login, name='emergency_login'),
+    path('test/', minimal_test, name='minimal_test'),
+    path('db-test/', db_test, name='db_test'),
+    path('model-test/', model_test, name='model_test'),
+    path('production-debug/', production_debug, name='production_debug'),
+    path('emergency-login-debug/', emergency_login_debug, name='emergency_login_debug'),
+    path('admin-debug/', admin_debug_view, name='admin_debug_view'),
+    path('email-debug/', email_debug_view, name='email_debug_view'),
+    path('env-debug/', env_debug_view, name='env_debug_view'),
+    path('admin-tenant-fix/', admin_tenant_fix_view, name='admin_tenant_fix_view'),
+    path('media-debug/', media_debug_view, name='media_debug_view'),
+]
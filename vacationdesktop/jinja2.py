@@ -0,0 +1,33 @@
+"""
+Jinja2 environment for the optional email template engine (EMAIL_TEMPLATE_ENGINE=jinja2)
+
+The templates in jinja2/emails/ are ports of templates/emails/ and use the same
+Django filters, registered here under the same names.
+"""
+import os
+
+from django.conf import settings
+from django.template import defaultfilters
+from django.templatetags.static import static
+from django.urls import reverse
+from jinja2 import Environment, FileSystemBytecodeCache
+
+
+def linebreaks(value):
+    return defaultfilters.linebreaks_filter(value, autoescape=True)
+
+
+def environment(**options):
+    if settings.JINJA2_BYTECODE_DIR:
+        # Compiled templates written by precompile_templates at build time
+        os.makedirs(settings.JINJA2_BYTECODE_DIR, exist_ok=True)
+        options.setdefault('bytecode_cache', FileSystemBytecodeCache(settings.JINJA2_BYTECODE_DIR))
+    env = Environment(**options)
+    env.globals.update({'static': static, 'url': reverse})
+    env.filters.update({
+        'date': defaultfilters.date,
+        'floatformat': defaultfilters.floatformat,
+        'linebreaks': linebreaks,
+        'pluralize': defaultfilters.pluralize,
+    })
+    return env
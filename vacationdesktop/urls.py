@@ -19,18 +19,6 @@ from django.urls import path, include
 from django.shortcuts import redirect
 from django.conf import settings
 from django.conf.urls.static import static
-from rbac.views import create_emergency_admin, fix_existing_admin
-from debug_views import debug_admin, simple_dashboard
-from simple_login import emergency_login
-from minimal_test import minimal_test
-from db_test import db_test, model_test
-from production_test import production_debug
-from emergency_login_debug import emergency_login_debug
-from admin_debug import admin_debug_view
-from email_debug import email_debug_view
-from env_debug import env_debug_view
-from admin_tenant_fix import admin_tenant_fix_view
-from media_debug_view import media_debug_view
 from custom_media_view import serve_media_file
 
 def root_redirect(request):
@@ -41,27 +29,17 @@ def root_redirect(request):
 urlpatterns = [
     path('', root_redirect, name='root'),
     path('admin/', admin.site.urls),
-    path('emergency-admin-setup/', create_emergency_admin, name='emergency_admin'),
-    path('fix-admin/', fix_existing_admin, name='fix_admin'),
-    path('debug-admin/', debug_admin, name='debug_admin'),
-    path('simple-dashboard/', simple_dashboard, name='simple_dashboard'),
-    path('emergency-login/', emergency_login, name='emergency_login'),
-    path('test/', minimal_test, name='minimal_test'),
-    path('db-test/', db_test, name='db_test'),
-    path('model-test/', model_test, name='model_test'),
-    path('production-debug/', production_debug, name='production_debug'),
-    path('emergency-login-debug/', emergency_login_debug, name='emergency_login_debug'),
-    path('admin-debug/', admin_debug_view, name='admin_debug_view'),
-    path('email-debug/', email_debug_view, name='email_debug_view'),
-    path('env-debug/', env_debug_view, name='env_debug_view'),
-    path('admin-tenant-fix/', admin_tenant_fix_view, name='admin_tenant_fix_view'),
-    path('media-debug/', media_debug_view, name='media_debug_view'),
     # Custom media file serving for Railway volume
     path('media/<path:path>', serve_media_file, name='serve_media'),
     path('', include('rbac.urls')),
     path('crm/', include('business_management.urls')),
 ]
 
+# Debug/emergency views live in their own URLconf so their modules are only
+# imported when the endpoints are switched on
+if settings.DEBUG_ENDPOINTS_ENABLED:
+    urlpatterns.insert(2, path('', include('vacationdesktop.debug_urls')))
+
 # Serve static and media files during development and production
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])